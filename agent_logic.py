@@ -2,19 +2,27 @@ import os
 import json
 import asyncio
 from enum import Enum
-from openai import AzureOpenAI
 import logging
+from openai import RateLimitError
 
 logger = logging.getLogger("AgentT")
 
 import azure.cognitiveservices.speech as speechsdk
 
-# Initialize Azure OpenAI
-client = AzureOpenAI(
-    api_key=os.getenv("AZURE_OPENAI_SERVICE_KEY"),
-    api_version="2023-12-01-preview",
-    azure_endpoint=os.getenv("AZURE_OPENAI_SERVICE_ENDPOINT")
-)
+from transcript_archive import new_turn
+from endpointing import EndpointingTuner
+from llm_pool import LLMPool
+from hold_detector import HoldDetector
+from repetition_index import RepetitionIndex
+from token_scheduler import TokenRateScheduler, estimate_tokens, retry_after_seconds, LIVE, HOLD as HOLD_PRIORITY
+
+# Initialize Azure OpenAI (one or more endpoints, hedged and failed over)
+llm_pool = LLMPool.from_env()
+# Shared by every call so concurrent agents queue against one TPM/RPM budget
+token_scheduler = TokenRateScheduler()
+
+# How many recent turns survive when we trim the prompt under quota pressure
+TRIMMED_HISTORY_TURNS = 6
 
 DEPLOYMENT_MODEL = os.getenv("AZURE_OPENAI_DEPLOYMENT_MODEL", "gpt-4")
 
@@ -28,7 +36,9 @@ class AgentState(Enum):
     FINISHED = "FINISHED"
 
 class VoiceAgent:
-    def __init__(self, websocket_manager):
+    def __init__(self, websocket_manager, call_connection_id=None):
+        self.call_connection_id = call_connection_id
+        self.remote_phone = None
         self.state = AgentState.LISTENING
         self.history = [
             {"role": "system", "content": (
@@ -44,6 +54,38 @@ class VoiceAgent:
         ]
         self.websocket_manager = websocket_manager
         self.latest_transcript = ""
+        # Timestamped Remote / Agent / System turns, archived when the call ends
+        self.transcript = []
+        # Fed with raw call audio when media streaming is on
+        self.hold_detector = HoldDetector()
+        # Per-state recognition timeouts, tuned as the call goes on (its VAD shows when a speaker was cut off)
+        self.endpointing = EndpointingTuner(voice=self.hold_detector)
+        # Fingerprints of recent remote utterances, to spot looped hold messages
+        self.repetition_index = RepetitionIndex()
+        # Whether the line sounded like hold when the utterance being answered came in
+        self.hold_turn = False
+        # Set (by the app) when the call runs as a translation bridge instead of a negotiator
+        self.bridge = None
+
+    def record_turn(self, speaker, text):
+        self.transcript.append(new_turn(speaker, text, self.state.value))
+
+    def snapshot(self):
+        """Conversation state another instance needs to carry on this call (no PII values)."""
+        return {
+            "call_connection_id": self.call_connection_id,
+            "remote_phone": self.remote_phone,
+            "state": self.state.value,
+            "history": self.history,
+            "transcript": self.transcript,
+            "translation": {"source_language": self.bridge.source_language} if self.bridge else None,
+        }
+
+    def restore(self, snapshot):
+        self.remote_phone = snapshot.get("remote_phone")
+        self.state = AgentState(snapshot.get("state", AgentState.LISTENING.value))
+        self.history = snapshot.get("history") or self.history
+        self.transcript = snapshot.get("transcript") or []
 
     async def process_audio_transcript(self, text):
         """
@@ -54,23 +96,48 @@ class VoiceAgent:
             return None
 
         self.latest_transcript = text
-        await self.websocket_manager.broadcast_transcript(f"Remote: {text}")
+        self.record_turn("Remote", text)
+        await self.websocket_manager.broadcast_transcript(f"Remote: {text}", self.call_connection_id)
         
+        if self.hold_detector.on_hold:
+            # Audio says we're still on hold (a late transcript); no LLM call needed
+            return {"type": "HOLD"}
+
+        # Every utterance is indexed, so the first playback of a hold message is known by the second
+        repeated = self.repetition_index.check(text)
+        if repeated and (self.state == AgentState.HOLD or self.hold_detector.hold_suspected):
+            # Near-verbatim repeat while we're on hold: the recorded hold message again.
+            # Outside hold a repeat is an IVR menu or a person asking again, and needs an answer.
+            self.repetition_index.llm_calls_saved += 1
+            return {"type": "HOLD"}
+        # Read before the reset below: a turn taken on (suspected) hold yields to live calls for budget
+        self.hold_turn = self.state == AgentState.HOLD or self.hold_detector.hold_suspected
+        if self.state == AgentState.HOLD:
+            # Something new on the line; treat it as live until the LLM says otherwise
+            self.state = AgentState.LISTENING
+
+        if self.bridge:
+            # Translation mode: the operator gets what was said in their language, no negotiation.
+            # It streams to them in the background, so the caller can be heard again straight away.
+            self.bridge.submit_inbound(text)
+            return {"type": "TRANSLATED"}
+
         self.history.append({"role": "user", "content": text})
         
         # AUTO MODE: Generate AI Response
-        response = self._get_llm_response_and_update_history()
+        response = await self._get_llm_response_and_update_history()
         
         if response and response.get("type") == "SPEAK":
-            await self.websocket_manager.broadcast_transcript(f"Agent: {response['text']}")
+            self.record_turn("Agent", response["text"])
+            await self.websocket_manager.broadcast_transcript(f"Agent: {response['text']}", self.call_connection_id)
             
         return response
 
-    def _get_llm_response_and_update_history(self):
+    async def _get_llm_response_and_update_history(self):
         """
         Helper to get LLM response and update history.
         """
-        response = self._get_llm_response()
+        response = await self._get_llm_response()
         if response and response.get("type") == "SPEAK":
             self.history.append({"role": "assistant", "content": response["text"]})
         return response
@@ -78,15 +145,15 @@ class VoiceAgent:
     def handle_human_input(self, text):
         """Called when the human types a response in the web UI."""
         self.history.append({"role": "assistant", "content": text})
+        self.record_turn("Agent", text)
         return text
 
-    def _get_llm_response(self):
+    async def _get_llm_response(self):
         """
         Get response from Azure OpenAI.
         """
         try:
             logger.info(f"DEBUG: Generating LLM response...")
-            logger.info(f"DEBUG: Endpoint: {os.getenv('AZURE_OPENAI_SERVICE_ENDPOINT')}")
             
             functions = [
                 {
@@ -105,12 +172,23 @@ class VoiceAgent:
                 }
             ]
 
-            completion = client.chat.completions.create(
-                model=DEPLOYMENT_MODEL,
-                messages=self.history,
+            messages = self.history
+            priority = HOLD_PRIORITY if self.hold_turn else LIVE
+            reservation = await token_scheduler.admit(estimate_tokens(messages), priority)
+            if reservation is None and priority == LIVE:
+                # Quota pressure: a shorter prompt costs less budget and may still fit
+                messages = self._trimmed_history()
+                reservation = await token_scheduler.admit(estimate_tokens(messages), priority, max_wait=2)
+            if reservation is None:
+                logger.warning(f"LLM budget exhausted for state {self.state.value} (hold turn: {self.hold_turn}); degrading turn")
+                return self._degraded_response()
+
+            completion = await llm_pool.chat(
+                messages=messages,
                 functions=functions,
                 function_call="auto"
             )
+            token_scheduler.record_usage(reservation, completion.usage.total_tokens if completion.usage else None)
             
             logger.info(f"DEBUG: Completion received: {completion}")
 
@@ -137,12 +215,28 @@ class VoiceAgent:
             logger.info("DEBUG: No content in response")
             return None
 
+        except RateLimitError as e:
+            token_scheduler.throttle(retry_after_seconds(e.response))
+            return self._degraded_response()
+
         except Exception as e:
             logger.error(f"LLM Error: {e}")
             import traceback
             logger.error(traceback.format_exc())
             return None
 
+    def _trimmed_history(self):
+        """System prompt plus the most recent turns."""
+        return self.history[:1] + self.history[1:][-TRIMMED_HISTORY_TURNS:]
+
+    def _degraded_response(self):
+        """What to do when the LLM can't be reached in time: keep the call alive, never go silent."""
+        if self.hold_turn:
+            # Probably still on hold; keep listening without spending budget
+            self.state = AgentState.HOLD
+            return {"type": "HOLD"}
+        return {"type": "SPEAK", "text": "Sorry, one moment please."}
+
     def handle_user_pii_input(self, pii_text):
         """
         Received PII from frontend. Convert to audio immediately and return text to speak.
@@ -1,9 +1,13 @@
 import os
+import re
+import hmac
 import uuid
 import json
+import base64
+import asyncio
 import logging
 from typing import Dict
-from fastapi import FastAPI, WebSocket, Request, BackgroundTasks
+from fastapi import FastAPI, WebSocket, Request, BackgroundTasks, HTTPException, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from azure.communication.callautomation import (
     CallAutomationClient,
@@ -12,11 +16,25 @@ from azure.communication.callautomation import (
     RecognizeInputType,
     TextSource,
     CallConnectionState,
+    MediaStreamingOptions,
+    StreamingTransportType,
+    MediaStreamingContentType,
+    MediaStreamingAudioChannelType,
 )
 from dotenv import load_dotenv
 load_dotenv()
 
-from agent_logic import VoiceAgent
+from agent_logic import VoiceAgent, AgentState, llm_pool, token_scheduler
+from transcript_archive import TranscriptArchive, parse_date
+from speech_queue import SpeechQueue, SpeechPriority
+from pii_vault import PIIVault, DEFAULT_TTL
+from audio_relay import AudioRelay, ParticipantFilter
+from event_batcher import EventBatcher, split_prefix, INPUT_NEEDED
+from drain import drain_state
+from worker_routing import worker_routes
+from post_call import PostCallPipeline, LLMOutcomeExtractor
+from translation_bridge import TranslationBridge, LLMTranslator
+from call_recorder import CallRecorder, current_call
 
 # Configuration
 ACS_CONNECTION_STRING = os.getenv("ACS_CONNECTION_STRING")
@@ -24,6 +42,14 @@ CALLBACK_URI_HOST = os.getenv("CALLBACK_URI_HOST")
 ACS_PHONE_NUMBER = os.getenv("ACS_PHONE_NUMBER")
 ACS_PHONE_NUMBER = os.getenv("ACS_PHONE_NUMBER")
 TARGET_PHONE_NUMBER = os.getenv("TARGET_PHONE_NUMBER")
+# Stream raw call audio to /ws/media for local hold detection
+MEDIA_STREAMING_ENABLED = os.getenv("MEDIA_STREAMING_ENABLED", "true").lower() == "true"
+# "negotiate" (default) or "translate": what new calls do unless /call or the dashboard says otherwise
+AGENT_MODE = os.getenv("AGENT_MODE", "negotiate")
+# Shared directory where a draining instance leaves calls it couldn't finish
+CALL_HANDOFF_DIR = os.getenv("CALL_HANDOFF_DIR")
+# Token for the operator-only routes (archived transcripts and outcomes, live call audio). Unset = those routes are off.
+OPERATOR_TOKEN = os.getenv("OPERATOR_TOKEN")
 
 # Global var to store the dynamic caller for Inbound (MVP hack)
 # In production, store this in VoiceAgent or DB.
@@ -53,34 +79,177 @@ except:
 
 # State Management
 call_agents: Dict[str, VoiceAgent] = {}
+speech_queues: Dict[str, SpeechQueue] = {}
+# Recently ended calls (insertion ordered); late events for them must not resurrect an agent
+ended_calls: Dict[str, bool] = {}
+ENDED_CALLS_KEPT = 1024
 websockets: list[WebSocket] = []
+# Strong references to fire-and-forget tasks so they aren't garbage collected mid-flight
+background_tasks = set()
+
+def spawn(coro):
+    task = asyncio.create_task(coro)
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+    return task
 
 class WebSocketManager:
+    """
+    Dashboard fan-out. Clients connecting with ?proto=2 get coalesced binary
+    batches (see event_batcher); older clients still get one JSON text frame
+    per event.
+    """
+
+    def __init__(self):
+        self.batched = set()
+        self.batcher = EventBatcher(self._send_batch, spawn)
+        self.stats = {
+            "batched": {"frames": 0, "bytes": 0, "events": 0},
+            "legacy": {"frames": 0, "bytes": 0},
+            # What the batched clients' traffic would have cost as per-event JSON frames
+            "legacy_equivalent": {"frames": 0, "bytes": 0},
+        }
+
     async def connect(self, websocket: WebSocket):
         await websocket.accept()
         websockets.append(websocket)
+        if websocket.query_params.get("proto") == "2":
+            # Batches carry their own call id mappings; nothing to catch up on
+            self.batched.add(websocket)
 
     def disconnect(self, websocket: WebSocket):
         if websocket in websockets:
             websockets.remove(websocket)
+        self.batched.discard(websocket)
 
-    async def broadcast_transcript(self, message: str):
+    async def _send_legacy(self, payload):
+        text = None
         for ws in websockets:
+            if ws in self.batched:
+                continue
             try:
-                await ws.send_json({"type": "transcript", "data": message})
+                text = text or json.dumps(payload)
+                await ws.send_text(text)
+                self.stats["legacy"]["frames"] += 1
+                self.stats["legacy"]["bytes"] += len(text)
             except Exception:
                 pass
+        if self.batched:
+            size = len(text or json.dumps(payload))
+            self.stats["legacy_equivalent"]["frames"] += len(self.batched)
+            self.stats["legacy_equivalent"]["bytes"] += size * len(self.batched)
+
+    async def _send_batch(self, frame, event_count):
+        targets = list(self.batched)
+        results = await asyncio.gather(*(ws.send_bytes(frame) for ws in targets), return_exceptions=True)
+        sent = sum(1 for r in results if not isinstance(r, Exception))
+        self.stats["batched"]["frames"] += sent
+        self.stats["batched"]["bytes"] += len(frame) * sent
+        self.stats["batched"]["events"] += event_count
+
+    async def broadcast_transcript(self, message: str, call_connection_id: str = None):
+        if self.batched:
+            kind, text = split_prefix(message)
+            self.batcher.add(call_connection_id, kind, text)
+        await self._send_legacy({"type": "transcript", "data": message})
     
-    async def request_pii(self, field: str):
-        for ws in websockets:
-            try:
-                await ws.send_json({"type": "INPUT_NEEDED", "field": field})
-            except Exception:
-                pass
+    async def request_pii(self, field: str, call_connection_id: str = None):
+        if self.batched:
+            self.batcher.add(call_connection_id, INPUT_NEEDED, field)
+        await self._send_legacy({"type": "INPUT_NEEDED", "field": field})
 
 ws_manager = WebSocketManager()
+transcript_archive = TranscriptArchive()
+pii_vault = PIIVault()
+audio_relay = AudioRelay()
+post_call = PostCallPipeline(LLMOutcomeExtractor(llm_pool, token_scheduler), transcript_archive)
+translator = LLMTranslator(llm_pool, token_scheduler)
+# Replay fixtures of real calls (CALL_RECORDING_DIR), for call_replay.py / bench_replay.py
+call_recorder = CallRecorder.from_env()
+if call_recorder:
+    llm_pool.recorder = call_recorder.record_llm
+
+def create_agent(call_connection_id, mode=None):
+    agent = VoiceAgent(ws_manager, call_connection_id)
+    set_translation(call_connection_id, agent, (mode or AGENT_MODE) == "translate")
+    return agent
+
+def set_translation(call_connection_id, agent, enabled):
+    """Switch a call between negotiator and translation-bridge mode."""
+    if not enabled:
+        if agent.bridge:
+            agent.bridge.close()
+        agent.bridge = None
+        return
+    if agent.bridge:
+        return
+
+    async def speak_chunk(text):
+        # Translated operator text is what the remote party hears, with operator priority
+        return await speak(call_connection_id, text, SpeechPriority.HUMAN)
+
+    async def deliver_chunk(text):
+        # Translated remote speech is for the operator only; the remote party heard the original
+        agent.record_turn("Translation", text)
+        await ws_manager.broadcast_transcript(f"Translation: {text}", call_connection_id)
+
+    agent.bridge = TranslationBridge(translator, speak_chunk, deliver_chunk)
+
+def handoff_path(call_connection_id):
+    return os.path.join(CALL_HANDOFF_DIR, re.sub(r"[^A-Za-z0-9_.-]", "_", call_connection_id) + ".json")
+
+def hand_off_calls():
+    """Drain timed out: leave each live call's conversation where the next instance will find it."""
+    if not CALL_HANDOFF_DIR:
+        logger.warning(f"CALL_HANDOFF_DIR not set; {len(call_agents)} call(s) will restart from scratch elsewhere")
+        return
+    os.makedirs(CALL_HANDOFF_DIR, exist_ok=True)
+    for call_connection_id, agent in call_agents.items():
+        tmp = handoff_path(call_connection_id) + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(agent.snapshot(), f)
+        os.replace(tmp, handoff_path(call_connection_id))
+        logger.info(f"Handed off call {call_connection_id}")
+
+def claim_handoff(call_connection_id, agent):
+    if not CALL_HANDOFF_DIR:
+        return
+    path = handoff_path(call_connection_id)
+    try:
+        with open(path) as f:
+            snapshot = json.load(f)
+        agent.restore(snapshot)
+        if snapshot.get("translation"):
+            set_translation(call_connection_id, agent, True)
+            agent.bridge.source_language = snapshot["translation"].get("source_language")
+        os.remove(path)
+        logger.info(f"Picked up handed-off call {call_connection_id} in state {agent.state.value}")
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.error(f"Failed to pick up handed-off call {call_connection_id}: {e}")
+
+drain_state.active_calls = lambda: len(call_agents)
+drain_state.hand_off = hand_off_calls
+drain_state.flush = post_call.drain
+
+def callback_url():
+    # With a worker pool, callbacks name the worker that answered so they're routed back to it
+    return f"{CALLBACK_URI_HOST}/api/callbacks{worker_routes.query()}"
+
+def media_streaming_options():
+    if not MEDIA_STREAMING_ENABLED or not CALLBACK_URI_HOST:
+        return None
+    ws_host = CALLBACK_URI_HOST.replace("https://", "wss://").replace("http://", "ws://").rstrip("/")
+    return MediaStreamingOptions(
+        transport_url=f"{ws_host}/ws/media{worker_routes.query()}",
+        transport_type=StreamingTransportType.WEBSOCKET,
+        content_type=MediaStreamingContentType.AUDIO,
+        audio_channel_type=MediaStreamingAudioChannelType.UNMIXED,
+        start_media_streaming=True,
+    )
 
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, JSONResponse, Response
 from fastapi.templating import Jinja2Templates
 
 # Setup Templates
@@ -90,34 +259,97 @@ templates = Jinja2Templates(directory="templates")
 async def root(request: Request):
     return templates.TemplateResponse("index.html", {"request": request})
 
+def target_call(data, fallback=True):
+    """The call a dashboard message is for: the tab it came from, else the LATEST call."""
+    call_connection_id = data.get("call_connection_id")
+    if call_connection_id in call_agents:
+        return call_connection_id
+    if not fallback or (call_connection_id and worker_routes.enabled):
+        # Some other worker's call; that worker answers it
+        return None
+    # Use the LATEST call (index -1) in case old ones weren't cleaned up yet
+    # Dictionaries preserve insertion order in modern Python
+    return list(call_agents.keys())[-1] if call_agents else None
+
+async def connect_peers(websocket):
+    """Worker pool: the dashboard also needs every other worker's calls, so listen to them too."""
+    peers, pumps = [], []
+    for port in worker_routes.peer_ports():
+        try:
+            peer = await worker_routes.open_peer(port, websocket)
+        except Exception as e:
+            logger.error(f"Dashboard can't reach the worker on port {port}: {e}")
+            continue
+        peers.append(peer)
+        pumps.append(spawn(worker_routes.pump_to_client(peer, websocket)))
+    return peers, pumps
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     await ws_manager.connect(websocket)
+    # Connections from other workers (relaying their dashboard) only act on calls this worker owns
+    internal = worker_routes.is_internal(websocket.scope)
+    peers, pumps = await connect_peers(websocket) if worker_routes.enabled and not internal else ([], [])
     try:
         while True:
             data_text = await websocket.receive_text()
+            for peer in peers:
+                try:
+                    await peer.send(data_text)
+                except Exception:
+                    pass
             try:
                 data = json.loads(data_text)
+                call_connection_id = target_call(data, fallback=not internal)
+                if not call_connection_id and (internal or (data.get("call_connection_id") and worker_routes.enabled)):
+                    # Another worker owns the call and has this message too
+                    continue
                 
                 # Handle Human Input
                 if data.get("type") == "input":
                     text_to_speak = data.get("data")
-                    if call_agents and text_to_speak:
-                        # Use the LATEST call (index -1) in case old ones weren't cleaned up yet
-                        # Dictionaries preserve insertion order in modern Python
-                        call_connection_id = list(call_agents.keys())[-1]
+                    if call_connection_id and text_to_speak:
                         agent = call_agents[call_connection_id]
                         
                         logger.info(f"Human Input: {text_to_speak}")
                         agent.handle_human_input(text_to_speak)
                         
-                        await play_to_call(call_connection_id, text_to_speak)
-                        await ws_manager.broadcast_transcript(f"Agent: {text_to_speak}")
-
-                # Handle PII Input (Legacy/PII specific)
+                        if agent.bridge:
+                            # Bridge mode: the operator is heard in the remote party's language
+                            spoken = await agent.bridge.translate_outbound(text_to_speak)
+                            await ws_manager.broadcast_transcript(f"Agent: {spoken}", call_connection_id)
+                        else:
+                            # Operator speech jumps the queue and cuts off any AI sentence in progress
+                            await speak(call_connection_id, text_to_speak, SpeechPriority.HUMAN)
+                            await ws_manager.broadcast_transcript(f"Agent: {text_to_speak}", call_connection_id)
+
+                # Handle PII Input typed by the operator. Never logged.
                 elif data.get("type") == "PII":
-                     # ... (Keep existing if needed or just use input)
-                     pass
+                    pii_text = data.get("data")
+                    if call_connection_id and pii_text:
+                        await speak_pii(call_connection_id, call_agents[call_connection_id], data.get("field"), pii_text)
+
+                # Pre-load a PII profile so identity questions are answered without waiting on the operator
+                elif data.get("type") == "PII_PROFILE":
+                    fields = data.get("fields") or {}
+                    try:
+                        ttl = int(data.get("ttl") or DEFAULT_TTL)
+                    except (TypeError, ValueError):
+                        ttl = None
+                    if not isinstance(fields, dict) or not ttl or ttl <= 0:
+                        await websocket.send_json({"type": "PII_PROFILE_REJECTED", "call_connection_id": call_connection_id,
+                                                   "reason": "fields must be an object and ttl a positive number of seconds"})
+                        continue
+                    loaded = pii_vault.load(call_connection_id, fields, ttl=ttl)
+                    await websocket.send_json({"type": "PII_PROFILE_LOADED", "call_connection_id": call_connection_id, "fields": loaded})
+
+                # Switch a live call between negotiating and translating
+                elif data.get("type") == "MODE":
+                    if call_connection_id:
+                        enabled = data.get("mode") == "translate"
+                        set_translation(call_connection_id, call_agents[call_connection_id], enabled)
+                        await ws_manager.broadcast_transcript(
+                            f"System: {'Translation bridge' if enabled else 'Negotiator'} mode", call_connection_id)
 
             except json.JSONDecodeError:
                 # Handle plain text input as fallback for legacy tests if any
@@ -127,14 +359,101 @@ async def websocket_endpoint(websocket: WebSocket):
         logger.error(f"WebSocket Error: {e}")
     finally:
         ws_manager.disconnect(websocket)
+        for pump in pumps:
+            pump.cancel()
+        for peer in peers:
+            await peer.close()
+
+@app.websocket("/ws/media")
+async def media_stream_endpoint(websocket: WebSocket):
+    """ACS media streaming: raw call audio, used for local hold/IVR detection."""
+    await websocket.accept()
+    owner = worker_routes.owner_port(websocket.query_params.get("worker"))
+    if owner:
+        # The call lives on another worker; so does its hold detector
+        await worker_routes.relay(websocket, owner)
+        return
+    # ACS identifies the call in the upgrade request headers
+    call_connection_id = websocket.headers.get("x-ms-call-connection-id")
+    if not call_connection_id:
+        # Guessing would feed this audio to another call's hold detector and listeners
+        logger.warning("Media stream without x-ms-call-connection-id; closing it")
+        await websocket.close(code=1008)
+        return
+    logger.info(f"Media stream connected for call {call_connection_id}")
+    audio_relay.attach_waiting(call_connection_id)
+    # UNMIXED audio interleaves every participant's frames; listeners and the detectors want the remote party's
+    participants = ParticipantFilter()
+    try:
+        while True:
+            message = json.loads(await websocket.receive_text())
+            if message.get("kind") != "AudioData":
+                continue
+            audio = message["audioData"]
+            agent = call_agents.get(call_connection_id)
+            if not participants.accept(audio.get("participantRawID"), agent.remote_phone if agent else None):
+                continue
+            # Decode once; listeners and the hold detector share this buffer
+            pcm = base64.b64decode(audio["data"])
+            audio_relay.publish(call_connection_id, pcm)
+            if not agent:
+                continue
+            # Silent frames too: the pauses are half of what tells speech from music
+            transition = agent.hold_detector.process(pcm, silent=bool(audio.get("silent")))
+            if transition:
+                await on_hold_transition(call_connection_id, agent, transition)
+    except Exception as e:
+        logger.info(f"Media stream closed for call {call_connection_id}: {e}")
+
+@app.websocket("/ws/listen")
+async def listen_endpoint(websocket: WebSocket, call_connection_id: str = None, token: str = None):
+    """Live call audio for the dashboard: binary 16 kHz mono PCM16 frames. With no call yet, it follows the next one."""
+    await websocket.accept()
+    if not operator_token_ok(token):
+        # Same operator token as the archive; browsers can't set headers on a WebSocket, hence ?token=
+        await websocket.close(code=1008, reason="Operator token required")
+        return
+    if not call_connection_id and call_agents:
+        call_connection_id = list(call_agents.keys())[-1]
+    if call_connection_id and call_connection_id not in call_agents and worker_routes.enabled \
+            and not worker_routes.is_internal(websocket.scope):
+        owner = await worker_routes.find_owner(call_connection_id)
+        if owner:
+            await worker_routes.relay(websocket, owner)
+            return
+    await audio_relay.listen(websocket, call_connection_id)
+
+@app.get("/api/ws/stats")
+async def websocket_stats():
+    """Dashboard traffic: batched vs legacy frames/bytes, and what batched traffic would have cost unbatched."""
+    return ws_manager.stats
+
+@app.get("/api/audio/relay/stats")
+async def audio_relay_stats():
+    return audio_relay.stats()
+
+async def on_hold_transition(call_connection_id, agent, transition):
+    if transition == "HOLD":
+        agent.state = AgentState.HOLD
+        agent.record_turn("System", "Hold audio detected")
+        await ws_manager.broadcast_transcript("System: On hold (audio detected). Recognition paused.", call_connection_id)
+        # Stop the running recognizer; start_recognition stays a no-op until live speech returns
+        await cancel_media(call_connection_id)
+    else:
+        agent.state = AgentState.LISTENING
+        agent.record_turn("System", "Live speech after hold")
+        await ws_manager.broadcast_transcript("System: Live speech detected. Resuming.", call_connection_id)
+        await start_recognition(call_connection_id)
 
 @app.post("/call")
-async def initiate_call():
-    """Start the call to the doctor's office."""
+async def initiate_call(mode: str = None):
+    """Start the call to the doctor's office. mode=translate runs it as a translation bridge."""
+    if drain_state.draining:
+        raise HTTPException(status_code=503, detail="Server is draining; retry on another instance")
     target = PhoneNumberIdentifier(TARGET_PHONE_NUMBER)
     source = PhoneNumberIdentifier(ACS_PHONE_NUMBER)
     
-    callback_uri = f"{CALLBACK_URI_HOST}/api/callbacks"
+    callback_uri = callback_url()
     
     call_invite = CallInvite(target=target, source_caller_id_number=source)
     
@@ -143,7 +462,8 @@ async def initiate_call():
     result = acs_client.create_call(
         call_invite, 
         callback_url=callback_uri,
-        cognitive_services_endpoint=os.getenv("AZURE_SPEECH_SERVICE_ENDPOINT")
+        cognitive_services_endpoint=os.getenv("AZURE_SPEECH_SERVICE_ENDPOINT"),
+        media_streaming=media_streaming_options()
         # Note: ACS usually needs a Cognitive Services resource for TTS/STT.
         # For simplicity we rely on default or configured in Azure.
     )
@@ -151,7 +471,10 @@ async def initiate_call():
     logging.info(f"Call initiated. Connection ID: {result.call_connection_id}")
     
     # Initialize Agent
-    call_agents[result.call_connection_id] = VoiceAgent(ws_manager)
+    agent = create_agent(result.call_connection_id, mode)
+    agent.remote_phone = TARGET_PHONE_NUMBER
+    call_agents[result.call_connection_id] = agent
+    pii_vault.claim_pending(result.call_connection_id)
     
     return {"call_connection_id": result.call_connection_id}
 
@@ -159,6 +482,12 @@ async def initiate_call():
 async def callback_handler(request: Request):
     """Handle ACS Webhooks."""
     global INBOUND_CALLER
+
+    owner = worker_routes.owner_port(request.query_params.get("worker"))
+    if owner:
+        # Another worker answered this call and holds its state
+        status, body, media_type = await worker_routes.forward(owner, request)
+        return Response(content=body, status_code=status, media_type=media_type)
     
     raw_json = await request.json()
     logger.info(f"Raw Webhook Payload: {json.dumps(raw_json)}")
@@ -179,6 +508,10 @@ async def callback_handler(request: Request):
             return {"validationResponse": code}
 
         if event_type == 'Microsoft.Communication.IncomingCall':
+            if drain_state.draining:
+                # Shutting down: Event Grid retries the delivery, and the load balancer sends it to another instance
+                logger.info("Draining; refusing Incoming Call")
+                return JSONResponse({"status": "draining"}, status_code=503, headers={"Retry-After": "1"})
             logger.info("Received Incoming Call")
             incoming_call_context = event['data']['incomingCallContext']
             
@@ -194,7 +527,7 @@ async def callback_handler(request: Request):
                 logger.error(f"Could not extract caller number from event: {e}")
 
             # Answer the call
-            callback_uri = f"{CALLBACK_URI_HOST}/api/callbacks"
+            callback_uri = callback_url()
             
             # CRITICAL: Must provide Cognitive Services endpoint for STT/TTS
             # Separated from OpenAI Endpoint to avoid conflicts
@@ -208,7 +541,8 @@ async def callback_handler(request: Request):
             acs_client.answer_call(
                 incoming_call_context=incoming_call_context, 
                 callback_url=callback_uri,
-                cognitive_services_endpoint=speech_endpoint
+                cognitive_services_endpoint=speech_endpoint,
+                media_streaming=media_streaming_options()
             )
             return {"status": "answering"}
 
@@ -223,6 +557,15 @@ async def callback_handler(request: Request):
             logger.warning(f"Could not find callConnectionId in event: {event['type']}")
             continue
 
+        if call_connection_id in ended_calls:
+            logger.info(f"Ignoring {event['type']} for ended call {call_connection_id}")
+            continue
+
+        # LLM requests made from here on belong to this call (see call_recorder)
+        current_call.set(call_connection_id)
+        if call_recorder:
+            call_recorder.record_event(call_connection_id, event)
+
         agent = call_agents.get(call_connection_id)
         
         # Create agent if new (e.g. for incoming call or if we missed creation)
@@ -230,12 +573,15 @@ async def callback_handler(request: Request):
         if not agent:
              logger.warning(f"Unknown call connection: {call_connection_id}. Re-creating agent.")
              # Simple recovery for demo
-             call_agents[call_connection_id] = VoiceAgent(ws_manager)
+             call_agents[call_connection_id] = create_agent(call_connection_id)
              agent = call_agents[call_connection_id]
+             claim_handoff(call_connection_id, agent)
+             pii_vault.claim_pending(call_connection_id)
 
         if event['type'] == 'Microsoft.Communication.CallConnected':
             logger.info("Call Connected. Starting conversation...")
-            await ws_manager.broadcast_transcript("System: Call Connected")
+            agent.record_turn("System", "Call Connected")
+            await ws_manager.broadcast_transcript("System: Call Connected", call_connection_id)
             
             # Ensure we know who we are talking to for recognition
             if not INBOUND_CALLER:
@@ -258,13 +604,31 @@ async def callback_handler(request: Request):
             else:
                  logger.info(f"Target Participant for Recognition: {INBOUND_CALLER}")
 
-            # Start listing/speaking
-            intro_text = "Hey You reached Agent T. What can I do for you?"
-            await play_to_call(call_connection_id, intro_text)
+            if not agent.remote_phone:
+                agent.remote_phone = INBOUND_CALLER or TARGET_PHONE_NUMBER
+
+            if agent.bridge:
+                # Bridge mode has nothing to say until someone speaks
+                await start_recognition(call_connection_id)
+            else:
+                # Start listing/speaking
+                intro_text = "Hey You reached Agent T. What can I do for you?"
+                await speak(call_connection_id, intro_text, SpeechPriority.AI)
+
+        elif event['type'] == 'Microsoft.Communication.PlayStarted':
+            if agent.bridge:
+                # First translated audio of a segment is on the line: closes its end-to-end timing
+                agent.bridge.on_play_started(event.get('data', {}).get('operationContext'))
 
         elif event['type'] == 'Microsoft.Communication.PlayCompleted':
-            # Speech finished, start listening
-            await start_recognition(call_connection_id)
+            # Speech finished: play the next queued item, or start listening once drained
+            if await get_speech_queue(call_connection_id).on_play_finished(event.get('data', {}).get('operationContext')):
+                await on_speech_drained(call_connection_id)
+
+        elif event['type'] == 'Microsoft.Communication.PlayCanceled':
+            # Preempted items are ignored by the queue; anything else is treated like a completion
+            if await get_speech_queue(call_connection_id).on_play_finished(event.get('data', {}).get('operationContext')):
+                await on_speech_drained(call_connection_id)
 
         elif event['type'] == 'Microsoft.Communication.RecognizeCompleted':
             # STT finished
@@ -272,19 +636,32 @@ async def callback_handler(request: Request):
             if data.get('recognitionType') == 'speech':
                text = data['speechResult']['speech']
                logger.info(f"Recognized: {text}")
+               agent.endpointing.observe_completed(text)
                
-               # Process with Agent Logic
+               # Process with Agent Logic. Note the queue generation first: if the
+               # operator speaks while the LLM is thinking, this reply is stale.
+               generation = get_speech_queue(call_connection_id).generation
                action = await agent.process_audio_transcript(text)
                
                if action:
                    if action['type'] == 'SPEAK':
-                       await play_to_call(call_connection_id, action['text'])
+                       await speak(call_connection_id, action['text'], SpeechPriority.AI, generation)
                    elif action['type'] == 'PII_REQUEST':
-                       await ws_manager.request_pii(action['field'])
-                       # Do NOT continue recognition loop or play anything. Wait for WS input.
+                       value = pii_vault.lookup(call_connection_id, action['field'])
+                       if value:
+                           # Pre-loaded profile has it: answer immediately
+                           await speak_pii(call_connection_id, agent, action['field'], value)
+                       else:
+                           await ws_manager.request_pii(action['field'], call_connection_id)
+                           # Do NOT continue recognition loop or play anything. Wait for WS input.
                    elif action['type'] == 'HOLD':
-                       # Wait loop
-                       pass
+                       # Keep listening for a human; a no-op while hold audio is playing
+                       await start_recognition(call_connection_id)
+                   elif action['type'] == 'TRANSLATED':
+                       # The translation streams to the operator on its own; listen again now,
+                       # unless operator speech is playing on the call (the drain will then)
+                       if get_speech_queue(call_connection_id).current is None:
+                           await start_recognition(call_connection_id)
                else:
                    # Action is None (Human in loop).
                    # We continue listening.
@@ -292,32 +669,183 @@ async def callback_handler(request: Request):
 
         elif event['type'] == 'Microsoft.Communication.PlayFailed':
             logger.warning(f"Play Failed: {event.get('data')}")
-            # Fallback: start listening so user call isn't dead
-            await start_recognition(call_connection_id)
+            # Fallback: move on to the next item, or start listening so user call isn't dead
+            if await get_speech_queue(call_connection_id).on_play_finished(event.get('data', {}).get('operationContext')):
+                await on_speech_drained(call_connection_id)
 
         elif event['type'] == 'Microsoft.Communication.RecognizeFailed':
             logger.error("Recognition Failed")
+            agent.endpointing.observe_failed(event.get('data', {}).get('resultInformation'))
             # Retry or verify state
             await start_recognition(call_connection_id)
             
         elif event['type'] == 'Microsoft.Communication.CallDisconnected':
             logger.info(f"Call Disconnected: {call_connection_id}")
-            await ws_manager.broadcast_transcript("System: Call Disconnected")
+            agent.record_turn("System", "Call Disconnected")
+            await ws_manager.broadcast_transcript("System: Call Disconnected", call_connection_id)
+            ws_manager.batcher.forget(call_connection_id)
             # Cleanup
             if call_connection_id in call_agents:
                 del call_agents[call_connection_id]
+            ended_calls[call_connection_id] = True
+            if len(ended_calls) > ENDED_CALLS_KEPT:
+                del ended_calls[next(iter(ended_calls))]
+            queue = speech_queues.pop(call_connection_id, None)
+            if queue:
+                queue.clear()
+            pii_vault.purge(call_connection_id)
+            # Archive off the request path; compression and indexing run on the archive's writer thread
+            spawn(transcript_archive.archive_call(call_connection_id, agent.remote_phone, agent.transcript))
+            if call_recorder:
+                call_recorder.finish(call_connection_id, agent)
+            # Summary and outcome (appointment, clinic, escalation) are extracted in the background
+            post_call.submit(call_connection_id, agent.remote_phone, agent.transcript)
             
     return {"status": "ok"}
 
-async def play_to_call(call_connection_id, text):
+def operator_token_ok(token):
+    return bool(OPERATOR_TOKEN) and bool(token) and hmac.compare_digest(token.encode(), OPERATOR_TOKEN.encode())
+
+def require_operator(request: Request):
+    """
+    Archived calls are medical conversations, served from the host ACS must reach publicly.
+    Send `Authorization: Bearer <OPERATOR_TOKEN>` (or `?token=` where headers can't be set).
+    """
+    if not OPERATOR_TOKEN:
+        raise HTTPException(status_code=403, detail="Set OPERATOR_TOKEN to enable this endpoint")
+    auth = request.headers.get("authorization", "")
+    token = auth[7:] if auth.lower().startswith("bearer ") else request.query_params.get("token")
+    if not operator_token_ok(token):
+        raise HTTPException(status_code=401, detail="Operator token required", headers={"WWW-Authenticate": "Bearer"})
+
+@app.get("/healthz")
+async def healthz():
+    """Load balancer probe: 503 while draining so no new traffic is routed here."""
+    return JSONResponse(drain_state.stats(), status_code=503 if drain_state.draining else 200)
+
+@app.get("/api/transcripts", dependencies=[Depends(require_operator)])
+async def search_transcripts(phone: str = None, start: str = None, end: str = None, q: str = None, limit: int = 50):
+    """Search archived calls by phone number, date range (ISO dates) and/or phrase."""
+    try:
+        start_ts = parse_date(start)
+        end_ts = parse_date(end, end_of_day=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start/end must be ISO dates or epoch seconds")
+    results = await transcript_archive.search(phone=phone, start=start_ts, end=end_ts, phrase=q, limit=min(limit, 500))
+    return {"results": results}
+
+@app.get("/api/transcripts/{call_connection_id}", dependencies=[Depends(require_operator)])
+async def get_transcript(call_connection_id: str):
+    record = await transcript_archive.get_call(call_connection_id)
+    if not record:
+        raise HTTPException(status_code=404, detail="Transcript not found")
+    record["outcome"] = await transcript_archive.get_outcome(call_connection_id)
+    return record
+
+@app.get("/api/outcomes", dependencies=[Depends(require_operator)])
+async def search_outcomes(phone: str = None, start: str = None, end: str = None, outcome: str = None, escalated: bool = None, limit: int = 50):
+    """Extracted call outcomes (summary, appointment date, clinic, escalation) by phone, date range or outcome."""
+    try:
+        start_ts = parse_date(start)
+        end_ts = parse_date(end, end_of_day=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="start/end must be ISO dates or epoch seconds")
+    results = await transcript_archive.search_outcomes(phone, start_ts, end_ts, outcome, escalated, min(limit, 500))
+    return {"results": results}
+
+@app.get("/api/post_call/stats")
+async def post_call_stats():
+    """Post-call pipeline throughput, queue depth and queue lag."""
+    return post_call.stats()
+
+@app.get("/api/recorder/stats")
+async def recorder_stats():
+    """Calls recorded as replay fixtures (CALL_RECORDING_DIR)."""
+    return call_recorder.stats() if call_recorder else {"enabled": False}
+
+@app.get("/api/llm/stats")
+async def llm_stats():
+    """Per-endpoint latency percentiles, error counts and circuit breaker state."""
+    return {"endpoints": llm_pool.stats(), "scheduler": token_scheduler.stats()}
+
+@app.get("/api/calls")
+async def call_stats():
+    """Live calls with agent state, repetition index and speech queue counters."""
+    return {
+        call_connection_id: {
+            "state": agent.state.value,
+            "repetition": agent.repetition_index.stats(),
+            "speech_queue": speech_queues[call_connection_id].stats if call_connection_id in speech_queues else None,
+            "translation": agent.bridge.stats() if agent.bridge else None,
+        }
+        for call_connection_id, agent in call_agents.items()
+    }
+
+@app.get("/api/translation/stats")
+async def translation_stats():
+    """Per-stage latency and budget overruns for calls in translation-bridge mode."""
+    return {
+        call_connection_id: agent.bridge.stats()
+        for call_connection_id, agent in call_agents.items()
+        if agent.bridge
+    }
+
+def get_speech_queue(call_connection_id):
+    queue = speech_queues.get(call_connection_id)
+    if queue is None:
+        queue = SpeechQueue(
+            call_connection_id,
+            play=lambda text, context: play_to_call(call_connection_id, text, context),
+            cancel=lambda: cancel_media(call_connection_id),
+        )
+        speech_queues[call_connection_id] = queue
+    return queue
+
+async def speak(call_connection_id, text, priority, generation=None):
+    """Queue outbound speech for a call. All playback goes through here."""
+    return await get_speech_queue(call_connection_id).enqueue(text, priority, generation)
+
+async def speak_pii(call_connection_id, agent, field, value):
+    """Speak PII without letting the value reach logs, the transcript archive or the LLM."""
+    text = agent.handle_user_pii_input(value)
+    label = field or "requested information"
+    agent.record_turn("Agent", f"[PII provided: {label}]")
+    # Keep the LLM's view of the conversation coherent without sending it the value
+    agent.history.append({"role": "assistant", "content": f"[Provided the {label}]"})
+    await speak(call_connection_id, text, SpeechPriority.PII)
+    await ws_manager.broadcast_transcript(f"System: Provided {label}", call_connection_id)
+
+async def play_to_call(call_connection_id, text, operation_context=None):
     try:
         call_connection = acs_client.get_call_connection(call_connection_id)
         text_source = TextSource(text=text, voice_name="en-US-AvaMultilingualNeural")
-        call_connection.play_media(play_source=text_source)
+        call_connection.play_media(play_source=text_source, operation_context=operation_context)
+        agent = call_agents.get(call_connection_id)
+        if agent:
+            agent.endpointing.note_agent_spoke()
+        return True
     except Exception as e:
         logger.error(f"Failed to play media: {e}")
+        return False
+
+async def cancel_media(call_connection_id):
+    try:
+        acs_client.get_call_connection(call_connection_id).cancel_all_media_operations()
+    except Exception as e:
+        logger.error(f"Failed to cancel media: {e}")
+
+async def on_speech_drained(call_connection_id):
+    """Nothing left to play: listen again, unless a translation is still streaming chunks in."""
+    agent = call_agents.get(call_connection_id)
+    if agent and agent.bridge and agent.bridge.busy:
+        return
+    await start_recognition(call_connection_id)
 
 async def start_recognition(call_connection_id):
+    agent = call_agents.get(call_connection_id)
+    if agent and agent.hold_detector.on_hold:
+        # Hold music: recognition (and the LLM turn behind it) waits for live speech
+        return
     try:
         call_connection = acs_client.get_call_connection(call_connection_id)
         
@@ -327,9 +855,13 @@ async def start_recognition(call_connection_id):
         
         logger.info(f"Starting recognition for: {target_phone}")
 
+        # Silence timeouts depend on what we're waiting for (menu, yes/no, hold...)
+        options = agent.endpointing.recognition_options(agent) if agent else {}
+
         call_connection.start_recognizing_media(
             input_type=RecognizeInputType.SPEECH,
-            target_participant=PhoneNumberIdentifier(target_phone)
+            target_participant=PhoneNumberIdentifier(target_phone),
+            **options
         )
     except Exception as e:
         logger.error(f"Failed to start recognition: {e}")
@@ -0,0 +1,163 @@
+import re
+import time
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger("AgentT")
+
+# 20 ms frames: 25 frames = 500 ms of audio buffered per listener at most
+JITTER_BUFFER_FRAMES = 25
+# Other participants' frames dropped before we stop waiting for the expected one and take who's there
+PARTICIPANT_FALLBACK_FRAMES = 250
+
+
+class ParticipantFilter:
+    """
+    Picks the remote party's frames out of an UNMIXED media stream.
+
+    ACS sends each participant's 20 ms frames separately, interleaved on the
+    same socket; played (or analysed) back to back they are garbage. The
+    participant whose number matches the call's remote phone is kept. If the
+    number is unknown, or nobody matching shows up within a few seconds, the
+    first participant heard is kept instead.
+    """
+
+    def __init__(self):
+        self.participant = None
+        self.dropped = 0
+
+    def accept(self, participant_raw_id, expected_phone=None):
+        if not participant_raw_id:
+            # Mixed audio carries no participant; it is already one stream
+            return True
+        if self.participant is None:
+            want = re.sub(r"\D", "", expected_phone or "")[-10:]
+            if want and not re.sub(r"\D", "", participant_raw_id).endswith(want) \
+                    and self.dropped < PARTICIPANT_FALLBACK_FRAMES:
+                self.dropped += 1
+                return False
+            self.participant = participant_raw_id
+            logger.info(f"Media stream following participant {participant_raw_id}")
+        if participant_raw_id != self.participant:
+            self.dropped += 1
+            return False
+        return True
+
+
+class Listener:
+    """One dashboard client listening to one call, with its own bounded jitter buffer."""
+
+    def __init__(self, websocket, call_connection_id):
+        self.websocket = websocket
+        self.call_connection_id = call_connection_id
+        self.buffer = deque(maxlen=JITTER_BUFFER_FRAMES)
+        self.ready = asyncio.Event()
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.frames_dropped = 0
+        self.send_time = 0.0
+        self.connected_at = time.monotonic()
+
+    def push(self, frame):
+        if len(self.buffer) == self.buffer.maxlen:
+            # Slow client: drop the oldest frame rather than fall further behind live
+            self.frames_dropped += 1
+        self.buffer.append(frame)
+        self.ready.set()
+
+    def stats(self):
+        return {
+            "call_connection_id": self.call_connection_id,
+            "frames_sent": self.frames_sent,
+            "bytes_sent": self.bytes_sent,
+            "frames_dropped": self.frames_dropped,
+            "buffered": len(self.buffer),
+            "avg_send_us": round(self.send_time / self.frames_sent * 1e6, 1) if self.frames_sent else 0,
+            "seconds": round(time.monotonic() - self.connected_at, 1),
+        }
+
+
+class AudioRelay:
+    """
+    Fans call audio out to dashboard listeners.
+
+    publish() runs on the media-streaming path, so it never awaits: it appends
+    a reference to the same decoded frame to every listener's deque and wakes
+    its sender task. Frames are never copied or re-encoded per listener, and a
+    listener whose socket is slow only loses its own oldest frames.
+    """
+
+    def __init__(self):
+        self._listeners = {}
+        self.frames_published = 0
+        self.publish_time = 0.0
+        self.listener_pushes = 0
+
+    async def listen(self, websocket, call_connection_id):
+        """
+        Serve one listener until its socket closes. Without a call it waits
+        (under None) and is moved to the next call whose audio starts.
+        """
+        listener = Listener(websocket, call_connection_id)
+        self._listeners.setdefault(call_connection_id, set()).add(listener)
+        logger.info(f"Audio listener joined call {call_connection_id or '(waiting for a call)'}")
+        sender = asyncio.create_task(self._send_loop(listener))
+        try:
+            # Nothing is expected from the client; this just notices when it goes away
+            while (await websocket.receive())["type"] != "websocket.disconnect":
+                pass
+        except Exception as e:
+            logger.info(f"Audio listener error on call {call_connection_id}: {e}")
+        finally:
+            sender.cancel()
+            # It may have been attached to a call since it joined
+            listeners = self._listeners.get(listener.call_connection_id)
+            if listeners:
+                listeners.discard(listener)
+                if not listeners:
+                    del self._listeners[listener.call_connection_id]
+            logger.info(f"Audio listener left call {listener.call_connection_id}: {listener.stats()}")
+
+    def attach_waiting(self, call_connection_id):
+        """A call's audio started: listeners that joined with no call follow it."""
+        if call_connection_id is None:
+            return
+        waiting = self._listeners.pop(None, None)
+        if not waiting:
+            return
+        for listener in waiting:
+            listener.call_connection_id = call_connection_id
+        self._listeners.setdefault(call_connection_id, set()).update(waiting)
+        logger.info(f"{len(waiting)} waiting audio listener(s) attached to call {call_connection_id}")
+
+    async def _send_loop(self, listener):
+        while True:
+            await listener.ready.wait()
+            listener.ready.clear()
+            while listener.buffer:
+                frame = listener.buffer.popleft()
+                started = time.perf_counter()
+                await listener.websocket.send_bytes(frame)
+                listener.send_time += time.perf_counter() - started
+                listener.frames_sent += 1
+                listener.bytes_sent += len(frame)
+
+    def publish(self, call_connection_id, frame):
+        listeners = self._listeners.get(call_connection_id)
+        if not listeners:
+            return
+        started = time.perf_counter()
+        for listener in listeners:
+            listener.push(frame)
+        self.publish_time += time.perf_counter() - started
+        self.frames_published += 1
+        self.listener_pushes += len(listeners)
+
+    def stats(self):
+        return {
+            "frames_published": self.frames_published,
+            # Cost on the audio path per listener per frame
+            "publish_ns_per_listener": round(self.publish_time / self.listener_pushes * 1e9) if self.listener_pushes else 0,
+            "listeners": [listener.stats() for listeners in self._listeners.values() for listener in listeners],
+        }
@@ -0,0 +1,110 @@
+"""
+Offline benchmark for hold_detector.HoldDetector.
+
+Runs the detector over WAV fixtures in 20 ms frames (as ACS media streaming
+delivers them) and reports the final classification, time to first
+transition and per-frame cost. Every frame is fed, gaps included, which is
+what app.py does too (frames ACS flags as silent go in as zeros).
+
+    python bench_hold_detector.py                      # bundled speech samples + synthetic hold loop
+    python bench_hold_detector.py hold.wav:hold call.wav:live
+"""
+import sys
+import time
+import wave
+
+import numpy as np
+
+from hold_detector import HoldDetector, SAMPLE_RATE, FRAME_MS
+
+SPEECH_FIXTURES = [
+    "output_en_US_AvaMultilingualNeural.wav",
+    "output_en_US_JennyNeural.wav",
+    "test_audio_for_stt.wav",
+]
+
+
+def load_wav(path):
+    with wave.open(path) as w:
+        if w.getframerate() != SAMPLE_RATE or w.getsampwidth() != 2 or w.getnchannels() != 1:
+            raise ValueError(f"{path}: expected 16 kHz mono PCM16")
+        return np.frombuffer(w.readframes(w.getnframes()), dtype=np.int16)
+
+
+def synth_hold_loop(seconds=40, loop_seconds=8.0, seed=7):
+    """A looped synth melody with a little line noise, like a typical hold track."""
+    rng = np.random.default_rng(seed)
+    notes = rng.choice([220.0, 246.9, 261.6, 293.7, 329.6, 349.2, 392.0], size=16)
+    note_len = int(loop_seconds * SAMPLE_RATE / len(notes))
+    t = np.arange(note_len) / SAMPLE_RATE
+    fade = np.minimum(1.0, np.minimum(t, t[::-1]) * 50)
+    loop = np.concatenate([
+        fade * (0.5 * np.sin(2 * np.pi * f * t) + 0.25 * np.sin(4 * np.pi * f * t) + 0.12 * np.sin(2 * np.pi * f * 1.5 * t))
+        for f in notes
+    ])
+    audio = np.tile(loop, int(np.ceil(seconds / loop_seconds)))[: seconds * SAMPLE_RATE]
+    audio = audio * 0.3 + rng.normal(0, 0.003, audio.size)
+    return (np.clip(audio, -1, 1) * 32767).astype(np.int16)
+
+
+def conversation(seconds=30, seed=11):
+    """Bundled speech samples in random order with irregular gaps, like turn-taking."""
+    rng = np.random.default_rng(seed)
+    samples = [load_wav(path) for path in SPEECH_FIXTURES]
+    parts = []
+    while sum(p.size for p in parts) < seconds * SAMPLE_RATE:
+        clip = samples[rng.integers(len(samples))]
+        # Start partway in so repeats don't line up
+        parts.append(clip[rng.integers(0, clip.size // 3):])
+        parts.append(np.zeros(int(rng.uniform(0.3, 1.5) * SAMPLE_RATE), dtype=np.int16))
+    return np.concatenate(parts)[: seconds * SAMPLE_RATE]
+
+
+def with_line_noise(audio, level=0.003, seed=5):
+    """Real lines hiss in the gaps instead of going digitally silent."""
+    rng = np.random.default_rng(seed)
+    noisy = audio + rng.normal(0, level * 32767, audio.size)
+    return np.clip(noisy, -32768, 32767).astype(np.int16)
+
+
+def run(name, audio, expected):
+    detector = HoldDetector()
+    frame_len = SAMPLE_RATE * FRAME_MS // 1000
+    frames = audio.size // frame_len
+    transitions = []
+    started = time.perf_counter()
+    for i in range(frames):
+        result = detector.process(audio[i * frame_len:(i + 1) * frame_len].tobytes())
+        if result:
+            transitions.append((round(i * FRAME_MS / 1000, 1), result))
+    elapsed = time.perf_counter() - started
+
+    final = "hold" if detector.on_hold else "live"
+    ok = final == expected
+    print(f"{'PASS' if ok else 'FAIL'} {name:<28} expected={expected:<4} final={final:<4} "
+          f"transitions={transitions} {elapsed / frames * 1e6:.1f} us/frame  {detector.last_features}")
+    return ok
+
+
+def main(args):
+    cases = []
+    if args:
+        for arg in args:
+            path, _, expected = arg.partition(":")
+            cases.append((path, load_wav(path), expected or "hold"))
+    else:
+        music = synth_hold_loop()
+        speech = conversation()
+        cases = [
+            ("speech (bundled samples)", speech, "live"),
+            ("speech over line noise", with_line_noise(speech), "live"),
+            ("synthetic hold loop", music, "hold"),
+            ("hold then live speech", np.concatenate([music, speech]), "live"),
+            ("line silence", np.zeros(20 * SAMPLE_RATE, dtype=np.int16), "live"),
+        ]
+    results = [run(name, audio, expected) for name, audio, expected in cases]
+    return 0 if all(results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
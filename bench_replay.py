@@ -0,0 +1,264 @@
+"""
+Performance regression benchmark built on call_replay.py.
+
+Replays every fixture --runs times (after one warm-up run) with no pacing
+and instant LLM responses, so what's measured is the app's own cost:
+
+  turn latency   recognized speech delivered -> the app's next request to
+                 ACS, one call at a time (p50/p95 over all turns, median
+                 over runs)
+  loop stalls    --concurrency copies of every call at once, with a 5 ms
+                 ticker on the same event loop; a tick more than 20 ms late
+                 is a stall (count and worst, median over runs)
+  allocations    one more concurrent run under tracemalloc: peak traced
+                 memory, and what is still held per call afterwards
+
+Each measurement is repeated in --processes fresh interpreters and the
+best value of each metric is kept.
+
+Compare against a baseline taken on another commit. Any metric that got
+worse by more than --threshold (and by more than a small absolute floor,
+so noise on tiny numbers doesn't count) fails the run, as does a fixture
+that no longer replays cleanly.
+
+    python bench_replay.py --save-baseline base.json     # on main
+    python bench_replay.py --baseline base.json          # on your branch
+    python bench_replay.py --against main                # both, main checked out in a temporary worktree
+"""
+import os
+import gc
+import sys
+import json
+import shutil
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+import subprocess
+import tracemalloc
+
+from call_replay import Replayer, load_fixtures
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+TICK = 0.005
+STALL = 0.020
+
+# Regressions smaller than this don't count, whatever the percentage
+ABSOLUTE_FLOOR = {
+    "turn_p50_ms": 1.0,
+    "turn_p95_ms": 2.0,
+    "stalls": 2,
+    "stall_max_ms": 10.0,
+    "alloc_peak_kb": 256.0,
+    "alloc_retained_kb_per_call": 16.0,
+}
+
+
+class LoopMonitor:
+    """Measures how late a short periodic sleep wakes up: anything blocking the loop shows up here."""
+
+    def __init__(self, tick=TICK, threshold=STALL):
+        self.tick = tick
+        self.threshold = threshold
+        self.stalls = []
+        self._task = None
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+
+    async def _run(self):
+        while True:
+            before = time.perf_counter()
+            await asyncio.sleep(self.tick)
+            late = time.perf_counter() - before - self.tick
+            if late > self.threshold:
+                self.stalls.append(late * 1000)
+
+
+def percentile(values, p):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(p * len(ordered)))] if ordered else 0.0
+
+
+async def measure(fixtures, runs, concurrency):
+    replayer = Replayer(speed=0, llm_latency=0)
+    divergences = []
+    try:
+        await replayer.replay_all(fixtures, concurrency)
+        await replayer.settle()
+
+        timed = []
+        for _ in range(runs):
+            # Latency one call at a time: under a burst it mostly measures where a turn lands in the queue
+            results = await replayer.replay_all(fixtures)
+            await replayer.settle()
+            latencies = [ms for result in results for ms in result["turn_latency_ms"]]
+
+            monitor = LoopMonitor()
+            monitor.start()
+            results += await replayer.replay_all(fixtures, concurrency)
+            await replayer.settle()
+            await monitor.stop()
+            divergences += [f"{os.path.basename(r['fixture'])}: {d}" for r in results for d in r["divergences"]]
+            timed.append({
+                "turn_p50_ms": percentile(latencies, 0.5),
+                "turn_p95_ms": percentile(latencies, 0.95),
+                "stalls": len(monitor.stalls),
+                "stall_max_ms": max(monitor.stalls, default=0.0),
+                "turns": len(latencies),
+            })
+
+        gc.collect()
+        tracemalloc.start()
+        before = tracemalloc.get_traced_memory()[0]
+        results = await replayer.replay_all(fixtures, concurrency)
+        await replayer.settle()
+        gc.collect()
+        after, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    finally:
+        await replayer.close()
+
+    calls = len(results)
+    metrics = {key: round(statistics.median(run[key] for run in timed), 2) for key in ABSOLUTE_FLOOR if key in timed[0]}
+    metrics["alloc_peak_kb"] = round((peak - before) / 1024, 1)
+    metrics["alloc_retained_kb_per_call"] = round((after - before) / 1024 / calls, 1)
+    return {
+        "metrics": metrics,
+        "turns_per_run": timed[0]["turns"],
+        "calls_per_run": calls,
+        "fixtures": sorted(os.path.basename(fixture["path"]) for fixture in fixtures),
+        "runs": runs,
+        "concurrency": concurrency,
+        "divergences": sorted(set(divergences)),
+    }
+
+
+def git_head(cwd=HERE):
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=cwd, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def measure_best(args, cwd=HERE):
+    """
+    Run the measurement in --processes fresh interpreters and keep the best
+    of each metric. On shared machines one process can be a steady 50%
+    slower than the next (memory placement, neighbours), which no number of
+    runs inside that process will average away.
+    """
+    fixtures = [os.path.abspath(path) for path in args.fixtures]
+    command = [sys.executable, "bench_replay.py", *fixtures, "--runs", str(args.runs),
+               "--concurrency", str(args.concurrency), "--child"]
+    results = []
+    for _ in range(args.processes):
+        done = subprocess.run(command, cwd=cwd, capture_output=True, text=True)
+        if done.returncode != 0:
+            raise SystemExit(f"benchmark process failed in {cwd}:\n{done.stderr[-2000:]}")
+        results.append(json.loads(done.stdout.strip().splitlines()[-1]))
+    best = dict(results[0])
+    best["metrics"] = {key: min(result["metrics"][key] for result in results) for key in results[0]["metrics"]}
+    best["divergences"] = sorted({d for result in results for d in result["divergences"]})
+    best["processes"] = args.processes
+    best["commit"] = git_head(cwd)
+    return best
+
+
+def baseline_at(ref, args):
+    """Run this benchmark, with the current fixtures, on `ref` checked out in a throwaway worktree."""
+    workdir = tempfile.mkdtemp(prefix="bench-replay-")
+    subprocess.run(["git", "worktree", "add", "--detach", workdir, ref], cwd=HERE, check=True, capture_output=True)
+    try:
+        if not os.path.exists(os.path.join(workdir, "call_replay.py")):
+            # Older trees can't be replayed: the app has no call_recorder hooks there
+            raise SystemExit(f"{ref} predates call_replay.py; pick a later commit or use --baseline")
+        # Same measuring code on both sides; only the app under it differs
+        shutil.copy(os.path.abspath(__file__), os.path.join(workdir, "bench_replay.py"))
+        return measure_best(args, cwd=workdir)
+    finally:
+        subprocess.run(["git", "worktree", "remove", "--force", workdir], cwd=HERE, capture_output=True)
+
+
+def compare(current, baseline, threshold):
+    """Print the comparison table; returns the metrics that regressed."""
+    if (baseline["fixtures"], baseline["concurrency"]) != (current["fixtures"], current["concurrency"]):
+        print("warning: baseline was taken with different fixtures or concurrency")
+    regressed = []
+    print(f"{'metric':<28} {'baseline':>10} {'current':>10} {'change':>8}")
+    for key, value in current["metrics"].items():
+        base = baseline["metrics"].get(key)
+        if base is None:
+            print(f"{key:<28} {'-':>10} {value:>10}")
+            continue
+        change = (value - base) / base if base else (0.0 if value == base else float("inf"))
+        worse = value > base * (1 + threshold) and value - base > ABSOLUTE_FLOOR[key]
+        if worse:
+            regressed.append(key)
+        print(f"{key:<28} {base:>10} {value:>10} {change:>+7.0%}{'  REGRESSION' if worse else ''}")
+    return regressed
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", nargs="*", default=[os.path.join(HERE, "replay_fixtures")])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--concurrency", type=int, default=4, help="copies of each call replayed at once")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--baseline", help="compare against this saved result")
+    parser.add_argument("--against", metavar="GIT_REF", help="take the baseline from this commit first")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write this run's result here")
+    parser.add_argument("--processes", type=int, default=3, help="fresh processes to measure in; best of each metric counts")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"No fixtures found in {' '.join(args.fixtures)}")
+        return 1
+    if args.child:
+        print(json.dumps(asyncio.run(measure(fixtures, args.runs, args.concurrency))))
+        return 0
+
+    baseline = None
+    if args.against:
+        print(f"Measuring baseline at {args.against}...")
+        baseline = baseline_at(args.against, args)
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+
+    current = measure_best(args)
+    print(f"{len(fixtures)} fixture(s) x{args.concurrency}, {current['turns_per_run']} turns per run, "
+          f"{args.runs} runs x {args.processes} processes, commit {current['commit']}")
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(current, f, indent=1)
+
+    for divergence in current["divergences"]:
+        print(f"DIVERGED {divergence}")
+
+    if baseline is None:
+        for key, value in current["metrics"].items():
+            print(f"{key:<28} {value:>10}")
+        return 1 if current["divergences"] else 0
+
+    regressed = compare(current, baseline, args.threshold)
+    if regressed or current["divergences"]:
+        print(f"FAIL: {', '.join(regressed) or 'fixtures diverged'}")
+        return 1
+    print(f"PASS: no regression beyond {args.threshold:.0%} against {baseline.get('commit') or 'baseline'}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
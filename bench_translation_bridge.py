@@ -0,0 +1,167 @@
+"""
+Offline benchmark for translation_bridge.TranslationBridge.
+
+Drives one bridged call end to end against local stand-ins: a recognizer
+that delivers Spanish segments, a streaming translator with LLM-like
+first-token and per-token delays, and a TTS that only starts playing once
+a whole chunk is synthesized. Translated remote speech goes straight to
+the operator; translated operator lines play through the real SpeechQueue,
+so PlayStarted/PlayCompleted arrive in the same order as on a call.
+
+Runs the same call chunked and unchunked and compares time from text
+received to its first translated chunk reaching the operator (inbound) or
+playing on the call (outbound) against the latency budget. Exits 1 if the
+chunked bridge misses it.
+
+    python bench_translation_bridge.py
+    python bench_translation_bridge.py --budget 1200 --first-token 500
+"""
+import sys
+import asyncio
+import argparse
+
+from speech_queue import SpeechQueue, SpeechPriority
+from translation_bridge import TranslationBridge, LATENCY_BUDGET_MS
+
+# Remote party's segments as the recognizer would hand them over, with their reference translations
+PHRASES = {
+    "Buenos días, consultorio del doctor Ramírez.":
+        "Good morning, Dr. Ramírez's office.",
+    "¿En qué le puedo ayudar?":
+        "How can I help you?",
+    "Claro, déjeme revisar la agenda, un momento por favor, el sistema está un poco lento hoy.":
+        "Sure, let me check the schedule, one moment please, the system is a bit slow today.",
+    "Tengo disponible el martes catorce a las diez y media de la mañana, o el jueves dieciséis a las tres de la tarde, "
+    "pero el jueves sería con la doctora Fuentes porque el doctor Ramírez está en un congreso.":
+        "I have Tuesday the fourteenth at ten thirty in the morning, or Thursday the sixteenth at three in the afternoon, "
+        "but Thursday would be with Dr. Fuentes because Dr. Ramírez is at a conference.",
+    "Perfecto, ¿me da el nombre completo y la fecha de nacimiento del paciente?":
+        "Perfect, can you give me the patient's full name and date of birth?",
+    "Muy bien, ya quedó registrada la cita; le pedimos llegar quince minutos antes, traer su identificación, "
+    "la tarjeta del seguro y la lista de medicamentos que esté tomando actualmente.":
+        "Very well, the appointment is booked; we ask that you arrive fifteen minutes early, bring your ID, "
+        "your insurance card and the list of medications you are currently taking.",
+    "¿Algo más en lo que le pueda ayudar?":
+        "Anything else I can help you with?",
+    "Que tenga buen día.":
+        "Have a good day.",
+}
+# Operator lines typed on the dashboard mid-call
+OPERATOR = {
+    "The Tuesday at ten thirty works.": "El martes a las diez y media me funciona.",
+    "Thank you, that's all.": "Gracias, es todo.",
+}
+
+
+class StubTranslator:
+    """Looks translations up instead of calling a model, but streams them word by word at model-like speed."""
+
+    def __init__(self, first_token_ms, token_ms):
+        self.first_token = first_token_ms / 1000
+        self.token = token_ms / 1000
+
+    async def stream(self, text, target, source=None, on_language=None):
+        translated = PHRASES.get(text) or OPERATOR.get(text) or text
+        await asyncio.sleep(self.first_token)
+        if source is None and on_language:
+            # LLMTranslator reports the language from the tag leading the first reply
+            on_language("es" if text in PHRASES else "en")
+        for i, word in enumerate(translated.split(" ")):
+            if i:
+                await asyncio.sleep(self.token)
+            yield word if i == 0 else " " + word
+
+
+class StubTTS:
+    """
+    Synthesizes a chunk in full before it starts playing (as ACS TextSource
+    does), so longer chunks start later. Playback itself is faster than real
+    time to keep the run short; it only affects when the next chunk starts.
+    """
+
+    def __init__(self, synth_ms, synth_per_char_ms, play_per_char_ms=2):
+        self.synth_ms = synth_ms
+        self.synth_per_char_ms = synth_per_char_ms
+        self.play_per_char_ms = play_per_char_ms
+        self.events = asyncio.Queue()
+
+    async def play(self, text, operation_context):
+        loop = asyncio.get_running_loop()
+        start = (self.synth_ms + self.synth_per_char_ms * len(text)) / 1000
+        loop.call_later(start, self.events.put_nowait, ("PlayStarted", operation_context))
+        loop.call_later(start + self.play_per_char_ms * len(text) / 1000, self.events.put_nowait,
+                        ("PlayCompleted", operation_context))
+        return True
+
+    async def cancel(self):
+        pass
+
+
+async def run_call(chunked, args):
+    tts = StubTTS(args.synth, args.synth_per_char)
+    queue = SpeechQueue("bench-call", tts.play, tts.cancel)
+
+    async def speak(text):
+        return await queue.enqueue(text, SpeechPriority.HUMAN)
+
+    async def deliver(text):
+        # The dashboard shows (and reads out) the chunk; nothing to wait for on the call
+        pass
+
+    bridge = TranslationBridge(StubTranslator(args.first_token, args.token), speak, deliver,
+                               target_language="en", budget_ms=args.budget, chunked=chunked)
+    drained = asyncio.Event()
+
+    async def acs_events():
+        # What app.py does with the same callbacks
+        while True:
+            kind, ctx = await tts.events.get()
+            if kind == "PlayStarted":
+                bridge.on_play_started(ctx)
+            elif await queue.on_play_finished(ctx) and not bridge.busy:
+                drained.set()
+
+    events = asyncio.create_task(acs_events())
+    operator = iter(OPERATOR)
+    for i, segment in enumerate(PHRASES):
+        await bridge.translate_inbound(segment)
+        if i in (3, 6):
+            drained.clear()
+            await bridge.translate_outbound(next(operator))
+            if queue.current is not None:
+                await drained.wait()
+    events.cancel()
+    return bridge.stats()
+
+
+def report(name, stats, budget):
+    stages = stats["stages"]
+    first_audio = stages["first_audio_ms"]
+    ok = first_audio is not None and first_audio["p95"] <= budget
+    print(f"{'PASS' if ok else 'FAIL'} {name:<10} first_audio p50={first_audio['p50']}ms p95={first_audio['p95']}ms "
+          f"budget={budget:.0f}ms over_budget={stats['over_budget']} chunks={stats['chunks']} "
+          f"clause_chars={stats['clause_chars']} language={stats['source_language']}")
+    for stage, summary in stages.items():
+        if summary and stage != "first_audio_ms":
+            print(f"     {stage:<16} p50={summary['p50']:>5}ms p95={summary['p95']:>5}ms n={summary['n']}")
+    return ok
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--budget", type=float, default=LATENCY_BUDGET_MS, help="end-to-end budget (ms)")
+    parser.add_argument("--first-token", type=float, default=350, help="translator time to first token (ms)")
+    parser.add_argument("--token", type=float, default=25, help="translator time per word (ms)")
+    parser.add_argument("--synth", type=float, default=200, help="TTS fixed start-up cost (ms)")
+    parser.add_argument("--synth-per-char", type=float, default=6, help="TTS synthesis cost per character (ms)")
+    args = parser.parse_args(argv)
+
+    chunked = asyncio.run(run_call(True, args))
+    whole = asyncio.run(run_call(False, args))
+    ok = report("chunked", chunked, args.budget)
+    report("unchunked", whole, args.budget)
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
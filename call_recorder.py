@@ -0,0 +1,131 @@
+import os
+import json
+import time
+import asyncio
+import hashlib
+import logging
+from contextvars import ContextVar
+from datetime import datetime
+
+logger = logging.getLogger("AgentT")
+
+# Where finished calls are written as replay fixtures; recording is off when unset
+RECORDING_DIR = os.getenv("CALL_RECORDING_DIR")
+FIXTURE_VERSION = 1
+
+# The call whose webhook is being handled. Set by the callback handler, so LLM
+# requests made while handling it (and tasks spawned from it) know their call.
+current_call = ContextVar("current_call", default=None)
+
+
+def request_hash(kwargs):
+    """Fingerprint of an LLM request, so a replay can tell when the prompt changed."""
+    relevant = {key: kwargs.get(key) for key in ("messages", "functions", "max_tokens", "temperature", "stream")}
+    return hashlib.sha1(json.dumps(relevant, sort_keys=True, default=str).encode()).hexdigest()[:16]
+
+
+class RecordedStream:
+    """Passes a streaming completion through while keeping each chunk and when it arrived."""
+
+    def __init__(self, stream, entry, started):
+        self._stream = stream
+        self._entry = entry
+        self._started = started
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            self._entry["chunks"].append({
+                "t_ms": round((time.monotonic() - self._started) * 1000, 1),
+                "chunk": chunk.model_dump(mode="json"),
+            })
+            yield chunk
+        self._entry["latency_ms"] = round((time.monotonic() - self._started) * 1000, 1)
+
+
+class CallRecorder:
+    """
+    Captures what a call looked like from the app's side, for call_replay.py.
+
+    Every webhook for the call is kept with its offset from the first one,
+    along with every LLM response made while handling it (full completion,
+    or each streamed chunk, plus latency). When the call disconnects, the
+    recording is written to `<directory>/<call_connection_id>.json`.
+
+    IncomingCall is not recorded, since it has no call connection id yet;
+    the caller's number and the call's mode at hang-up are kept instead.
+    Operator input from the dashboard is not recorded either. Fixtures
+    contain what the remote party said, as the transcript archive does, so
+    treat them like transcripts. Vault PII is only ever played, never
+    recognized or sent to the LLM, so it never ends up in a fixture.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._calls = {}
+        self.counters = {"recorded": 0, "events": 0, "llm_responses": 0, "write_errors": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(RECORDING_DIR) if RECORDING_DIR else None
+
+    def record_event(self, call_connection_id, event):
+        recording = self._calls.get(call_connection_id)
+        now = time.monotonic()
+        if recording is None:
+            recording = self._calls[call_connection_id] = {
+                "started": now,
+                "fixture": {
+                    "version": FIXTURE_VERSION,
+                    "call_connection_id": call_connection_id,
+                    "recorded_at": datetime.now().isoformat(timespec="seconds"),
+                    "events": [],
+                    "llm": [],
+                },
+            }
+        recording["fixture"]["events"].append({"t_ms": round((now - recording["started"]) * 1000, 1), "event": event})
+        self.counters["events"] += 1
+
+    def record_llm(self, kwargs, result, started):
+        """LLMPool hook: called with each winning response. Returns what the caller should get."""
+        # Background work spawned from a call's handler inherits its call id; once
+        # that call's fixture has been written, its responses are simply not kept.
+        recording = self._calls.get(current_call.get())
+        if recording is None:
+            return result
+        entry = {
+            "t_ms": round((started - recording["started"]) * 1000, 1),
+            "request_hash": request_hash(kwargs),
+        }
+        recording["fixture"]["llm"].append(entry)
+        self.counters["llm_responses"] += 1
+        if kwargs.get("stream"):
+            entry["chunks"] = []
+            return RecordedStream(result, entry, started)
+        entry["latency_ms"] = round((time.monotonic() - started) * 1000, 1)
+        entry["response"] = result.model_dump(mode="json")
+        return result
+
+    def finish(self, call_connection_id, agent):
+        """Stop recording the call and write its fixture off the event loop."""
+        recording = self._calls.pop(call_connection_id, None)
+        if recording is not None:
+            # IncomingCall isn't recorded, so keep who was on the other end and how the call ran
+            recording["fixture"]["remote_phone"] = agent.remote_phone
+            recording["fixture"]["mode"] = "translate" if agent.bridge else "negotiate"
+            asyncio.get_running_loop().run_in_executor(None, self._write, recording["fixture"])
+
+    def _write(self, fixture):
+        name = "".join(c if c.isalnum() or c in "-_." else "_" for c in fixture["call_connection_id"])
+        path = os.path.join(self.directory, f"{name}.json")
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(path + ".tmp", "w") as f:
+                json.dump(fixture, f, indent=1)
+            os.replace(path + ".tmp", path)
+            self.counters["recorded"] += 1
+        except Exception as e:
+            self.counters["write_errors"] += 1
+            logger.error(f"Failed to write call recording {path}: {e}")
+
+    def stats(self):
+        return dict(self.counters, in_progress=len(self._calls), directory=self.directory)
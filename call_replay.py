@@ -0,0 +1,348 @@
+"""
+Replays recorded calls (see call_recorder.py) against the app, in-process.
+
+Each fixture's webhooks are posted to /api/callbacks through the real
+FastAPI stack, at the recorded pace divided by --speed (0 = as fast as the
+app answers). ACS is replaced by a stand-in that accepts every request and
+notes what the app asked for. Each LLM endpoint is replaced by one that
+answers with the call's recorded responses, in order, after the recorded
+latency times --llm-latency.
+
+The replay follows the app instead of the clock where it has to. A recorded
+PlayCompleted is only sent once the app has actually asked for that play,
+with the recorded operationContext swapped for the live one, and a
+RecognizeCompleted only once recognition was started. No event is sent
+before the app has made the LLM requests the recording shows ahead of it
+(background work like bridge translations included). If the app never
+gets there, or asks for LLM responses the fixture doesn't have, the call
+has diverged from the recording. That's reported, and the exit status is 1.
+
+    python call_replay.py replay_fixtures/                  # original speed
+    python call_replay.py replay_fixtures/ --speed 10       # 10x
+    python call_replay.py my_call.json --speed 0 --llm-latency 0
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+from collections import deque
+from types import SimpleNamespace
+
+import httpx
+
+from call_recorder import current_call, request_hash
+
+PLAY_EVENTS = ("PlayStarted", "PlayCompleted", "PlayCanceled", "PlayFailed")
+RECOGNIZE_EVENTS = ("RecognizeCompleted", "RecognizeFailed")
+# How long to wait for the app to make the request a recorded event answers
+WAIT_TIMEOUT = 5.0
+
+
+def load_app():
+    """Import app.py configured for replay: no recording, no media streaming, a throwaway archive."""
+    import tempfile
+    os.environ["CALL_RECORDING_DIR"] = ""
+    os.environ["MEDIA_STREAMING_ENABLED"] = "false"
+    os.environ["AZURE_OPENAI_POOL"] = ""
+    os.environ.setdefault("TRANSCRIPT_ARCHIVE_DIR", tempfile.mkdtemp(prefix="agent-replay-"))
+    os.environ.setdefault("ACS_CONNECTION_STRING", "endpoint=https://replay.invalid/;accesskey=cmVwbGF5")
+    os.environ.setdefault("AZURE_OPENAI_SERVICE_ENDPOINT", "https://replay.invalid/")
+    os.environ.setdefault("AZURE_OPENAI_SERVICE_KEY", "replay")
+    import app
+    logging.getLogger("AgentT").setLevel(logging.WARNING)
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+    return app
+
+
+def load_fixtures(paths):
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files += sorted(os.path.join(path, name) for name in os.listdir(path) if name.endswith(".json"))
+        else:
+            files.append(path)
+    fixtures = []
+    for path in files:
+        with open(path) as f:
+            fixture = json.load(f)
+        if "events" in fixture and "llm" in fixture:
+            fixture["path"] = path
+            fixtures.append(fixture)
+    return fixtures
+
+
+def event_name(event):
+    return (event.get("type") or event.get("eventType") or "").rsplit(".", 1)[-1]
+
+
+class FakeCallAutomation:
+    """Stands in for CallAutomationClient: accepts every request and notes what the app asked for."""
+
+    def __init__(self):
+        self.actions = {}   # call_connection_id -> [(perf_counter, kind, operation_context)]
+        self._changed = asyncio.Event()
+
+    def get_call_connection(self, call_connection_id):
+        return FakeCallConnection(self, call_connection_id)
+
+    def answer_call(self, **kwargs):
+        return SimpleNamespace(call_connection_id=None)
+
+    def note(self, call_connection_id, kind, operation_context=None):
+        self.actions.setdefault(call_connection_id, []).append((time.perf_counter(), kind, operation_context))
+        self._changed.set()
+
+    def requests(self, call_connection_id, kind):
+        return [action for action in self.actions.get(call_connection_id, []) if action[1] == kind]
+
+    async def wait_for(self, call_connection_id, kind, count, timeout=WAIT_TIMEOUT):
+        """Wait until the app has made `count` requests of this kind on the call."""
+        deadline = time.monotonic() + timeout
+        while True:
+            self._changed.clear()
+            if len(self.requests(call_connection_id, kind)) >= count:
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+
+
+class FakeCallConnection:
+    def __init__(self, automation, call_connection_id):
+        self.automation = automation
+        self.call_connection_id = call_connection_id
+
+    def play_media(self, play_source=None, operation_context=None, **kwargs):
+        self.automation.note(self.call_connection_id, "play", operation_context)
+
+    def start_recognizing_media(self, **kwargs):
+        self.automation.note(self.call_connection_id, "recognize")
+
+    def cancel_all_media_operations(self, **kwargs):
+        self.automation.note(self.call_connection_id, "cancel")
+
+    def hang_up(self, **kwargs):
+        self.automation.note(self.call_connection_id, "hang_up")
+
+
+class ReplayLLM:
+    """
+    Stands in for an LLM endpoint's client. Requests are matched to calls
+    through call_recorder.current_call and get that call's recorded
+    responses in order; a request whose prompt differs from the recorded
+    one is still answered, but counted.
+    """
+
+    def __init__(self, latency_scale=1.0):
+        self.latency_scale = latency_scale
+        self.sessions = {}  # live call_connection_id -> {"responses": deque, "served", "prompt_changed", "missing"}
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+        self._changed = asyncio.Event()
+
+    def open(self, call_connection_id, fixture):
+        session = {"responses": deque(fixture["llm"]), "served": 0, "prompt_changed": 0, "missing": 0}
+        self.sessions[call_connection_id] = session
+        return session
+
+    async def wait_for(self, call_connection_id, count, timeout=WAIT_TIMEOUT):
+        """Wait until the call has made `count` LLM requests."""
+        session = self.sessions[call_connection_id]
+        deadline = time.monotonic() + timeout
+        while session["served"] + session["missing"] < count:
+            self._changed.clear()
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            try:
+                await asyncio.wait_for(self._changed.wait(), remaining)
+            except asyncio.TimeoutError:
+                pass
+        return True
+
+    async def create(self, model=None, **kwargs):
+        from openai.types.chat import ChatCompletion
+        self._changed.set()
+        session = self.sessions.get(current_call.get())
+        if session is None or not session["responses"]:
+            if session is not None:
+                session["missing"] += 1
+            raise RuntimeError(f"replay: no recorded LLM response left for {current_call.get()}")
+        entry = session["responses"].popleft()
+        session["served"] += 1
+        if entry["request_hash"] != request_hash(kwargs):
+            session["prompt_changed"] += 1
+        if "chunks" in entry:
+            return self._stream(entry)
+        if self.latency_scale:
+            await asyncio.sleep(entry["latency_ms"] / 1000 * self.latency_scale)
+        return ChatCompletion.model_validate(entry["response"])
+
+    async def _stream(self, entry):
+        from openai.types.chat import ChatCompletionChunk
+        started = time.monotonic()
+        for recorded in entry["chunks"]:
+            if self.latency_scale:
+                delay = started + recorded["t_ms"] / 1000 * self.latency_scale - time.monotonic()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            yield ChatCompletionChunk.model_validate(recorded["chunk"])
+
+
+class Replayer:
+    """Drives the app (imported once per process) through recorded calls."""
+
+    def __init__(self, speed=1.0, llm_latency=1.0, wait_timeout=WAIT_TIMEOUT):
+        from llm_pool import LLMEndpoint
+        self.speed = speed
+        self.wait_timeout = wait_timeout
+        self.app = load_app()
+        self.acs = FakeCallAutomation()
+        self.llm = ReplayLLM(llm_latency)
+        endpoint = LLMEndpoint("replay", "https://replay.invalid/", "replay", "replay")
+        endpoint.client = self.llm
+        self.app.acs_client = self.acs
+        self.app.llm_pool.endpoints = [endpoint]
+        # A replay packs minutes of calls into seconds; the token quota would throttle it where the live calls weren't
+        self.app.token_scheduler.tpm = self.app.token_scheduler.rpm = float("inf")
+        # Outcome extraction is background work the recordings have no responses for
+        self.app.post_call.submit = lambda *args: False
+        self.client = httpx.AsyncClient(transport=httpx.ASGITransport(app=self.app.app), base_url="http://replay")
+        self._runs = 0
+
+    async def close(self):
+        await self.client.aclose()
+
+    async def settle(self):
+        """Wait for the app's fire-and-forget work (transcript archiving) to finish."""
+        while self.app.background_tasks:
+            await asyncio.gather(*list(self.app.background_tasks), return_exceptions=True)
+
+    async def replay(self, fixture):
+        """Replay one fixture under a fresh call id. Returns the call's timings and any divergence."""
+        self._runs += 1
+        recorded_id = fixture["call_connection_id"]
+        call_connection_id = f"{recorded_id}-replay{self._runs}"
+        session = self.llm.open(call_connection_id, fixture)
+        contexts = {}       # recorded operationContext -> live one
+        recognitions = 0
+        turns = []          # perf_counter when each RecognizeCompleted was posted
+        divergences = []
+        # Stands in for what the unrecorded IncomingCall set up
+        self.app.INBOUND_CALLER = fixture.get("remote_phone") or self.app.INBOUND_CALLER
+        self.app.call_agents[call_connection_id] = self.app.create_agent(call_connection_id, fixture.get("mode"))
+        started = time.perf_counter()
+
+        for item in fixture["events"]:
+            if self.speed:
+                delay = started + item["t_ms"] / 1000 / self.speed - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            event = json.loads(json.dumps(item["event"]).replace(recorded_id, call_connection_id))
+            name = event_name(event)
+            data = event.get("data", {})
+
+            llm_due = sum(1 for entry in fixture["llm"] if entry["t_ms"] < item["t_ms"])
+            if not await self.llm.wait_for(call_connection_id, llm_due, self.wait_timeout):
+                divergences.append(f"app never made LLM request #{llm_due} (before {name})")
+                break
+
+            if name in PLAY_EVENTS and str(data.get("operationContext", "")).startswith("speech-"):
+                recorded_context = data["operationContext"]
+                if recorded_context not in contexts:
+                    wanted = len(contexts) + 1
+                    if not await self.acs.wait_for(call_connection_id, "play", wanted, self.wait_timeout):
+                        divergences.append(f"app never made play #{wanted} (for {name})")
+                        break
+                    contexts[recorded_context] = self.acs.requests(call_connection_id, "play")[wanted - 1][2]
+                data["operationContext"] = contexts[recorded_context]
+            elif name in RECOGNIZE_EVENTS:
+                recognitions += 1
+                if not await self.acs.wait_for(call_connection_id, "recognize", recognitions, self.wait_timeout):
+                    divergences.append(f"app never started recognition #{recognitions} (for {name})")
+                    break
+
+            if name == "RecognizeCompleted":
+                turns.append(time.perf_counter())
+            # Webhooks of one call are handled in order, as ACS delivers them
+            response = await self.client.post("/api/callbacks", json=[event])
+            if response.status_code != 200:
+                divergences.append(f"{name} got HTTP {response.status_code}")
+
+        # A turn's latency: recognized speech delivered -> the app's next request to ACS
+        actions = self.acs.actions.pop(call_connection_id, [])
+        latencies, unanswered = [], 0
+        for i, posted in enumerate(turns):
+            until = turns[i + 1] if i + 1 < len(turns) else float("inf")
+            answer = next((t for t, kind, _ in actions if posted < t < until and kind != "cancel"), None)
+            if answer is None:
+                unanswered += 1
+            else:
+                latencies.append((answer - posted) * 1000)
+
+        self.llm.sessions.pop(call_connection_id, None)
+        if session["responses"]:
+            divergences.append(f"{len(session['responses'])} recorded LLM response(s) never requested")
+        if session["missing"]:
+            divergences.append(f"{session['missing']} LLM request(s) beyond the recording")
+        return {
+            "fixture": fixture.get("path", recorded_id),
+            "call_connection_id": call_connection_id,
+            "events": len(fixture["events"]),
+            "duration_s": round(time.perf_counter() - started, 3),
+            "turn_latency_ms": latencies,
+            "unanswered_turns": unanswered,
+            "llm_served": session["served"],
+            "prompt_changed": session["prompt_changed"],
+            "divergences": divergences,
+        }
+
+    async def replay_all(self, fixtures, concurrency=1):
+        """Every fixture, `concurrency` copies of each running at once."""
+        return await asyncio.gather(*(self.replay(fixture) for fixture in fixtures for _ in range(concurrency)))
+
+
+def summarize(result):
+    latencies = sorted(result["turn_latency_ms"])
+    p50 = f"{latencies[len(latencies) // 2]:.1f}" if latencies else "-"
+    status = "DIVERGED" if result["divergences"] else "OK"
+    line = (f"{status:<8} {os.path.basename(result['fixture']):<36} events={result['events']:<3} "
+            f"turns={len(latencies)} p50={p50}ms unanswered={result['unanswered_turns']} "
+            f"llm={result['llm_served']} prompt_changed={result['prompt_changed']} {result['duration_s']:.2f}s")
+    for divergence in result["divergences"]:
+        line += f"\n         {divergence}"
+    return line
+
+
+async def run(args):
+    fixtures = load_fixtures(args.fixtures)
+    if not fixtures:
+        print(f"No fixtures found in {' '.join(args.fixtures)}")
+        return 1
+    replayer = Replayer(speed=args.speed, llm_latency=args.llm_latency)
+    try:
+        results = await replayer.replay_all(fixtures, args.concurrency)
+    finally:
+        await replayer.close()
+    for result in results:
+        print(summarize(result))
+    return 1 if any(result["divergences"] for result in results) else 0
+
+
+def main(argv):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fixtures", nargs="*", default=["replay_fixtures"], help="fixture files or directories")
+    parser.add_argument("--speed", type=float, default=1.0, help="pace multiplier; 0 = no pacing")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="scale for recorded LLM latency; 0 = instant")
+    parser.add_argument("--concurrency", type=int, default=1, help="copies of each call to replay at once")
+    return asyncio.run(run(parser.parse_args(argv)))
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
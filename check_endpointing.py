@@ -0,0 +1,132 @@
+"""
+Offline checks for endpointing.EndpointingTuner driven by a real HoldDetector.
+
+Turns are simulated the way app.py feeds them: the recognizer completes a
+segment, the media stream delivers 20 ms frames (silent ones flagged the
+way ACS flags them), and then the agent replies. The clock both modules
+read is swapped for a fake one, so a few dozen turns run in milliseconds.
+
+    python check_endpointing.py
+"""
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+
+import endpointing
+import hold_detector
+from endpointing import EndpointingTuner, DEFAULT_PROFILES
+from hold_detector import HoldDetector, SAMPLE_RATE, FRAME_MS
+
+FRAME = SAMPLE_RATE * FRAME_MS // 1000
+SILENT_FRAME = bytes(FRAME * 2)
+VOICE_FRAME = (0.3 * 32767 * np.sin(2 * np.pi * 220 * np.arange(FRAME) / SAMPLE_RATE)).astype(np.int16).tobytes()
+DEFAULT = DEFAULT_PROFILES["LISTENING"].end_silence
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+def agent():
+    return SimpleNamespace(state=SimpleNamespace(value="LISTENING"), history=[], latest_transcript="")
+
+
+def turn(clock, tuner, detector, text, after=None):
+    """One remote turn: speak, complete, then `after` frames on the media stream before the agent replies."""
+    tuner.recognition_options(agent())
+    clock.advance(1.0)
+    tuner.observe_completed(text)
+    for frame in after or []:
+        clock.advance(FRAME_MS / 1000)
+        detector.process(frame, silent=frame is SILENT_FRAME)
+    tuner.note_agent_spoke()
+    return tuner.profiles["LISTENING"].end_silence
+
+
+def with_clock(check):
+    def run():
+        clock = Clock()
+        saved = endpointing.time, hold_detector.time
+        endpointing.time = hold_detector.time = clock
+        try:
+            detector = HoldDetector()
+            check(clock, EndpointingTuner(voice=detector), detector)
+        finally:
+            endpointing.time, hold_detector.time = saved
+    run.__name__ = check.__name__
+    return run
+
+
+@with_clock
+def check_quiet_line_shortens(clock, tuner, detector):
+    # ACS marks the gap after a short answer as silent frames; that alone must let end silence drop
+    quiet = [SILENT_FRAME] * 30
+    first = turn(clock, tuner, detector, "Yes that's fine", quiet)
+    assert first < DEFAULT, first
+    for _ in range(20):
+        last = turn(clock, tuner, detector, "Yes that's fine", quiet)
+    assert last == DEFAULT_PROFILES["LISTENING"].min_end_silence, last
+
+
+@with_clock
+def check_no_audio_stays_at_default(clock, tuner, detector):
+    for _ in range(10):
+        last = turn(clock, tuner, detector, "Yes that's fine")
+    assert last == DEFAULT, last
+
+
+@with_clock
+def check_voice_after_segment_lengthens(clock, tuner, detector):
+    # The speaker kept going after the recognizer called the segment done
+    last = turn(clock, tuner, detector, "Yes that's fine", [SILENT_FRAME] * 10 + [VOICE_FRAME] * 25)
+    assert last > DEFAULT, last
+    assert tuner.stats["LISTENING"]["cutoffs"] == 1
+
+
+@with_clock
+def check_dangling_word_lengthens(clock, tuner, detector):
+    last = turn(clock, tuner, detector, "We have Tuesday and", [SILENT_FRAME] * 30)
+    assert last > DEFAULT, last
+
+
+@with_clock
+def check_cut_offs_stop_shortening(clock, tuner, detector):
+    # Once the line has cut the speaker off, later quiet short answers don't earn the time back
+    turn(clock, tuner, detector, "We have Tuesday and", [SILENT_FRAME] * 30)
+    raised = tuner.profiles["LISTENING"].end_silence
+    for _ in range(5):
+        last = turn(clock, tuner, detector, "Yes", [SILENT_FRAME] * 30)
+    assert last == raised, (last, raised)
+
+
+CHECKS = [
+    check_quiet_line_shortens,
+    check_no_audio_stays_at_default,
+    check_voice_after_segment_lengthens,
+    check_dangling_word_lengthens,
+    check_cut_offs_stop_shortening,
+]
+
+
+def main():
+    failed = 0
+    for check in CHECKS:
+        try:
+            check()
+            print(f"PASS {check.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL {check.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
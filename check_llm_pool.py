@@ -0,0 +1,226 @@
+"""
+Offline checks for llm_pool.LLMPool endpoint ordering, hedging and circuit breaking.
+
+Endpoints are real LLMEndpoint objects whose client is swapped for a local
+stand-in with a fixed latency (or a fixed error), so nothing leaves the
+machine. Latencies are scaled down (tens of ms instead of seconds) to keep
+the run short; the ratios are what matter.
+
+    python check_llm_pool.py
+"""
+import sys
+import time
+import asyncio
+from types import SimpleNamespace
+
+import llm_pool
+from llm_pool import LLMPool, LLMEndpoint, BREAKER_FAILURES, BREAKER_COOLDOWN
+
+
+class StubCompletions:
+    def __init__(self, latency, error=None):
+        self.latency = latency
+        self.error = error
+        self.calls = 0
+        self.last_kwargs = None
+
+    async def create(self, model, **kwargs):
+        self.calls += 1
+        self.last_kwargs = kwargs
+        await asyncio.sleep(self.latency)
+        if self.error:
+            raise self.error
+        return SimpleNamespace(model=model)
+
+
+def endpoint(name, latency, error=None):
+    e = LLMEndpoint(name, "https://example.invalid", "not-a-key", name)
+    e.client = SimpleNamespace(chat=SimpleNamespace(completions=StubCompletions(latency, error)))
+    return e
+
+
+def names(pool):
+    return [e.name for e in pool.ordered()]
+
+
+async def check_slow_primary_demoted():
+    # A slow endpoint listed first must not stay first just because it only ever loses hedges
+    slow, fast = endpoint("slow", 0.6), endpoint("fast", 0.04)
+    pool = LLMPool([slow, fast], hedge_after=0.1)
+    took = []
+    for _ in range(5):
+        started = time.monotonic()
+        await pool.chat(messages=[])
+        took.append(time.monotonic() - started)
+    assert names(pool) == ["fast", "slow"], names(pool)
+    assert slow.latency_ewma is not None and slow.latency_ewma >= pool.hedge_after, slow.latency_ewma
+    assert slow.hedges_lost == 1 and fast.hedges_won == 1, (slow.hedges_lost, fast.hedges_won)
+    # Only the first request paid for the hedge
+    assert max(took[1:]) < pool.hedge_after, took
+    assert slow.client.chat.completions.calls == 1
+
+
+async def check_unmeasured_ranking():
+    measured_fast, unmeasured, measured_slow = endpoint("a", 0), endpoint("b", 0), endpoint("c", 0)
+    pool = LLMPool([measured_slow, unmeasured, measured_fast], hedge_after=1.0)
+    measured_fast.record_success(0.3)
+    measured_slow.record_success(2.0)
+    assert names(pool) == ["a", "b", "c"], names(pool)
+
+
+async def check_lost_hedge_past_slow_threshold_strikes():
+    saved = llm_pool.SLOW_THRESHOLD
+    llm_pool.SLOW_THRESHOLD = 0.15
+    try:
+        slow, fast = endpoint("slow", 1.0), endpoint("fast", 0.1)
+        pool = LLMPool([slow, fast], hedge_after=0.1)
+        await pool.chat(messages=[])
+        assert slow.consecutive_failures == 1, slow.consecutive_failures
+        assert names(pool) == ["fast", "slow"], names(pool)
+    finally:
+        llm_pool.SLOW_THRESHOLD = saved
+
+
+async def check_quick_hedge_loss_not_counted():
+    # The hedge was beaten moments after it went out: no evidence it's slow
+    primary, hedge = endpoint("primary", 0.12), endpoint("hedge", 0.5)
+    pool = LLMPool([primary, hedge], hedge_after=0.1)
+    await pool.chat(messages=[])
+    assert hedge.latency_ewma is None and hedge.hedges_lost == 0, (hedge.latency_ewma, hedge.hedges_lost)
+
+
+async def check_same_tick_loser_closed():
+    # Both hedged requests answer at once: the stream not handed back must still be closed
+    class Stream:
+        closed = False
+
+        async def aclose(self):
+            self.closed = True
+
+    release = asyncio.Event()
+    streams = []
+
+    async def create(model, **kwargs):
+        await release.wait()
+        streams.append(Stream())
+        return streams[-1]
+
+    a, b = endpoint("a", 0), endpoint("b", 0)
+    for e in (a, b):
+        e.client.chat.completions.create = create
+    pool = LLMPool([a, b], hedge_after=0.01)
+    asyncio.get_running_loop().call_later(0.05, release.set)
+    chosen = await pool.chat(messages=[], stream=True)
+    assert len(streams) == 2, len(streams)
+    assert not chosen.closed and [s.closed for s in streams if s is not chosen] == [True]
+
+
+async def check_background_leaves_breaker_alone():
+    # Long post-call batches, slower than the live slow threshold, must not eject the endpoint live turns use
+    saved = llm_pool.SLOW_THRESHOLD
+    llm_pool.SLOW_THRESHOLD = 0.02
+    try:
+        only = endpoint("only", 0.05)
+        pool = LLMPool([only], hedge_after=0.01)
+        for _ in range(BREAKER_FAILURES + 1):
+            await pool.chat(background=True, messages=[])
+        assert only.state == "closed" and only.consecutive_failures == 0, (only.state, only.consecutive_failures)
+        assert only.latency_ewma is None and only.requests == 0, (only.latency_ewma, only.requests)
+        assert only.background_requests == BREAKER_FAILURES + 1
+        assert only.client.chat.completions.last_kwargs["timeout"] == llm_pool.BACKGROUND_TIMEOUT
+
+        # The same traffic as live turns does trip it
+        for _ in range(BREAKER_FAILURES):
+            await pool.chat(messages=[])
+        assert only.state == "open", only.state
+    finally:
+        llm_pool.SLOW_THRESHOLD = saved
+
+
+async def check_background_errors_fail_over_quietly():
+    broken, ok = endpoint("broken", 0, error=RuntimeError("timeout")), endpoint("ok", 0.01)
+    pool = LLMPool([broken, ok], hedge_after=1.0)
+    for _ in range(BREAKER_FAILURES):
+        await pool.chat(background=True, messages=[])
+    assert broken.state == "closed" and broken.errors == 0, (broken.state, broken.errors)
+    assert broken.background_errors == BREAKER_FAILURES and ok.background_requests == BREAKER_FAILURES
+
+
+async def check_breaker():
+    broken, ok = endpoint("broken", 0, error=RuntimeError("500")), endpoint("ok", 0.01)
+    pool = LLMPool([broken, ok], hedge_after=1.0)
+    # An error fails over within the same request, and the failing endpoint drops behind
+    await pool.chat(messages=[])
+    assert names(pool) == ["ok", "broken"] and broken.state == "closed", (names(pool), broken.state)
+    for _ in range(BREAKER_FAILURES - 1):
+        broken.record_failure("500")
+    assert broken.state == "open", broken.state
+    assert names(pool) == ["ok"], names(pool)
+
+    # After the cooldown one trial request is allowed; failing it re-opens straight away
+    broken.opened_at -= BREAKER_COOLDOWN
+    assert broken.state == "half-open" and names(pool) == ["ok", "broken"], (broken.state, names(pool))
+    broken.record_failure("500")
+    assert broken.state == "open", broken.state
+
+    # A successful trial closes it again
+    broken.opened_at -= BREAKER_COOLDOWN
+    broken.record_success(0.01)
+    assert broken.state == "closed" and broken.consecutive_failures == 0
+
+
+async def check_everything_ejected():
+    a, b = endpoint("a", 0), endpoint("b", 0)
+    for e in (a, b):
+        for _ in range(BREAKER_FAILURES):
+            e.record_failure("500")
+    assert names(LLMPool([a, b])) == ["a", "b"]
+
+
+async def check_all_fail():
+    pool = LLMPool([endpoint("a", 0, error=RuntimeError("a down")), endpoint("b", 0, error=RuntimeError("b down"))])
+    try:
+        await pool.chat(messages=[])
+    except RuntimeError as e:
+        assert str(e) == "b down", e
+    else:
+        raise AssertionError("expected the last endpoint's error")
+
+
+async def check_empty_pool():
+    try:
+        await LLMPool([]).chat(messages=[])
+    except RuntimeError:
+        return
+    raise AssertionError("expected RuntimeError from an empty pool")
+
+
+CHECKS = [
+    check_slow_primary_demoted,
+    check_unmeasured_ranking,
+    check_lost_hedge_past_slow_threshold_strikes,
+    check_quick_hedge_loss_not_counted,
+    check_same_tick_loser_closed,
+    check_background_leaves_breaker_alone,
+    check_background_errors_fail_over_quietly,
+    check_breaker,
+    check_everything_ejected,
+    check_all_fail,
+    check_empty_pool,
+]
+
+
+def main():
+    failed = 0
+    for check in CHECKS:
+        try:
+            asyncio.run(check())
+            print(f"PASS {check.__name__}")
+        except AssertionError as e:
+            failed += 1
+            print(f"FAIL {check.__name__}: {e}")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
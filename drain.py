@@ -0,0 +1,170 @@
+import os
+import time
+import signal
+import socket
+import asyncio
+import logging
+
+import uvicorn
+from uvicorn._subprocess import get_subprocess
+
+from worker_routing import worker_routes
+
+logger = logging.getLogger("AgentT")
+
+# How long a SIGTERM'd worker waits for its live calls to end before handing them off
+DRAIN_TIMEOUT = float(os.getenv("DRAIN_TIMEOUT_S", "600"))
+# Then how long it gives background work (post-call extraction) to finish
+FLUSH_TIMEOUT = 30.0
+DRAIN_POLL = 0.5
+
+
+class DrainState:
+    """
+    Per-process draining flag, shared between the server and the app.
+
+    The app wires in `active_calls` (how many calls this process still owns)
+    and `hand_off` (persist whatever is left so another instance can pick it
+    up) at import time, and optionally `flush` for background work.
+    """
+
+    def __init__(self):
+        self.draining = False
+        self.started_at = None
+        self.active_calls = lambda: 0
+        self.hand_off = lambda: None
+        self.handed_off = False
+        # Optional coroutine function(timeout): finish background work before exit
+        self.flush = None
+
+    def begin(self):
+        self.draining = True
+        self.started_at = time.monotonic()
+
+    def hand_off_remaining(self):
+        if self.handed_off or not self.active_calls():
+            return
+        self.handed_off = True
+        logger.warning(f"Handing off {self.active_calls()} active call(s)")
+        self.hand_off()
+
+    def stats(self):
+        return {
+            "draining": self.draining,
+            "draining_for_s": round(time.monotonic() - self.started_at, 1) if self.draining else 0,
+            "active_calls": self.active_calls(),
+        }
+
+
+drain_state = DrainState()
+
+
+class DrainingServer(uvicorn.Server):
+    """
+    uvicorn server that drains calls on SIGTERM instead of exiting at once.
+
+    The first SIGTERM/SIGINT flips `drain_state` (the app then refuses new
+    IncomingCall events with 503 so Event Grid redelivers them elsewhere) but
+    keeps the listener open, because callbacks for calls already in progress
+    still arrive here. The server exits once no calls are left, or after
+    `drain_timeout`, when the remaining calls are handed off. A second
+    signal exits immediately.
+    """
+
+    def __init__(self, config, drain_timeout=DRAIN_TIMEOUT, worker=None, worker_ports=None):
+        super().__init__(config)
+        self.drain_timeout = drain_timeout
+        # In a worker pool: our index and every worker's private port (see worker_routing)
+        self.worker = worker
+        self.worker_ports = worker_ports
+        self._loop = None
+        self._drain_task = None
+
+    def run(self, sockets=None):
+        # Before the app is imported, so it builds callback URLs that point back at this worker
+        if self.worker is not None:
+            worker_routes.assign(self.worker, self.worker_ports)
+        return super().run(sockets=sockets)
+
+    async def startup(self, sockets=None):
+        self._loop = asyncio.get_running_loop()
+        await super().startup(sockets=sockets)
+
+    def handle_exit(self, sig, frame):
+        if drain_state.draining or self._loop is None or not self.started:
+            if drain_state.draining:
+                drain_state.hand_off_remaining()
+            return super().handle_exit(sig, frame)
+        # uvicorn re-raises captured signals after shutdown so the exit status is preserved
+        self._captured_signals.append(sig)
+        drain_state.begin()
+        logger.info(f"Draining: refusing new calls, waiting for {drain_state.active_calls()} active call(s)")
+        self._loop.call_soon_threadsafe(self._start_drain)
+
+    def _start_drain(self):
+        self._drain_task = asyncio.ensure_future(self._drain())
+
+    async def _drain(self):
+        deadline = time.monotonic() + self.drain_timeout
+        while drain_state.active_calls() and time.monotonic() < deadline and not self.should_exit:
+            await asyncio.sleep(DRAIN_POLL)
+        drain_state.hand_off_remaining()
+        if drain_state.flush and not self.should_exit:
+            await drain_state.flush(FLUSH_TIMEOUT)
+        logger.info(f"Drained after {time.monotonic() - drain_state.started_at:.1f}s; shutting down")
+        self.should_exit = True
+
+
+def loopback_socket():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind(("127.0.0.1", 0))
+    sock.set_inheritable(True)
+    return sock
+
+
+def serve_workers(config, workers):
+    """
+    Run `workers` DrainingServer processes on one shared listening socket.
+
+    Each worker also gets a private loopback socket that the others use to
+    hand it requests for the calls it owns (see worker_routing); a restarted
+    worker keeps its index and private port, so URLs already given to ACS
+    stay valid. SIGTERM is forwarded to every worker and each drains its own calls; the
+    supervisor returns once they have all exited. Workers that die outside a
+    shutdown are restarted. Ctrl+C already reaches the workers through the
+    process group, so SIGINT is not forwarded (that would count as a second
+    signal and skip the drain).
+    """
+    sock = config.bind_socket()
+    private = [loopback_socket() for _ in range(workers)]
+    ports = {i: s.getsockname()[1] for i, s in enumerate(private)}
+    stopping = []
+
+    def start(i):
+        server = DrainingServer(config, worker=i, worker_ports=ports)
+        process = get_subprocess(config, target=server.run, sockets=[sock, private[i]])
+        process.start()
+        return process
+
+    def on_signal(sig, frame):
+        stopping.append(sig)
+        if sig == signal.SIGTERM:
+            for process in processes:
+                if process.is_alive():
+                    os.kill(process.pid, sig)
+
+    processes = [start(i) for i in range(workers)]
+    signal.signal(signal.SIGTERM, on_signal)
+    signal.signal(signal.SIGINT, on_signal)
+    while not stopping:
+        time.sleep(DRAIN_POLL)
+        for i, process in enumerate(processes):
+            if not process.is_alive() and not stopping:
+                logger.warning(f"Worker {process.pid} exited with code {process.exitcode}; restarting")
+                processes[i] = start(i)
+    for process in processes:
+        process.join()
+    sock.close()
+    for s in private:
+        s.close()
@@ -0,0 +1,230 @@
+import os
+import re
+import time
+import logging
+
+logger = logging.getLogger("AgentT")
+
+# Custom Speech model trained on clinic vocabulary (doctor names, departments, insurers).
+# ACS speech recognition has no inline phrase list, so vocabulary hints ride on the model.
+CUSTOM_SPEECH_ENDPOINT_ID = os.getenv("AZURE_SPEECH_CUSTOM_MODEL_ENDPOINT_ID")
+
+# ACS rejects end silence outside this window
+MIN_END_SILENCE = 0.3
+MAX_END_SILENCE = 3.0
+MAX_INITIAL_SILENCE = 60
+
+# Result sub-code ACS reports when nobody spoke before initial_silence_timeout
+INITIAL_SILENCE_TIMEOUT_CODE = 8510
+
+# A continuation within this window after a completed segment means we cut the speaker off
+CUTOFF_WINDOW = 2.5
+# Voice heard after a segment completed and before we replied that counts as the speaker still going
+CUTOFF_VOICE = 0.3
+# Ignore the first moments after completion: the tail of the segment and event delivery
+CUTOFF_GRACE = 0.15
+
+# A segment ending on one of these (or on a comma) stopped mid-sentence
+DANGLING_WORDS = {"and", "but", "or", "because", "the", "a", "an", "my", "your", "our", "if", "um", "uh", "uhm", "er"}
+_WORD = re.compile(r"[a-z']+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+YES_NO_OPENERS = ("is ", "are ", "do ", "does ", "can ", "could ", "would ", "will ", "should ", "did ", "shall ")
+IVR_MARKERS = ("press ", "say ", "for ", "option", "menu", "extension")
+
+
+class RecognitionProfile:
+    """Silence timeouts (seconds) for one kind of turn."""
+
+    def __init__(self, end_silence, initial_silence, min_end_silence=MIN_END_SILENCE, max_end_silence=MAX_END_SILENCE):
+        self.end_silence = end_silence
+        self.initial_silence = initial_silence
+        self.min_end_silence = min_end_silence
+        self.max_end_silence = max_end_silence
+
+    def copy(self):
+        return RecognitionProfile(self.end_silence, self.initial_silence, self.min_end_silence, self.max_end_silence)
+
+    def __repr__(self):
+        return f"RecognitionProfile(end_silence={self.end_silence:.2f}s, initial_silence={self.initial_silence}s)"
+
+
+# Starting points per AgentState value, plus two turn shapes inferred from the last exchange
+DEFAULT_PROFILES = {
+    "LISTENING": RecognitionProfile(0.8, 8),
+    "PROCESSING": RecognitionProfile(0.8, 8),
+    "NEGOTIATING": RecognitionProfile(0.7, 6),
+    "PII_INPUT_NEEDED": RecognitionProfile(0.8, 10),
+    "ESCALATING": RecognitionProfile(0.9, 15),
+    "FINISHED": RecognitionProfile(0.8, 5),
+    # Hold audio: long gaps, we only care when a human comes back
+    "HOLD": RecognitionProfile(1.5, 30, min_end_silence=1.0),
+    # Yes/no confirmation: answers are one or two words
+    "CONFIRMATION": RecognitionProfile(0.45, 5, max_end_silence=1.2),
+    # IVR menus pause between options; cutting in mid-menu loses the option we need
+    "IVR_MENU": RecognitionProfile(1.6, 8, min_end_silence=1.0),
+}
+
+
+def trailing_fragment(text):
+    """True when a recognized segment stops mid-sentence ("...on Tuesday and")."""
+    stripped = (text or "").rstrip()
+    if stripped.endswith((",", "...", "\u2026", "-")):
+        return True
+    words = _WORD.findall(stripped.lower())
+    return bool(words) and words[-1] in DANGLING_WORDS
+
+
+def last_sentence(text):
+    return _SENTENCE_END.split((text or "").strip())[-1]
+
+
+class EndpointingTuner:
+    """
+    Per-call recognition profiles, tuned from what we observe on the call.
+
+    End silence is lengthened when the speaker was cut off mid-pause, which
+    shows up as any of:
+
+    - the segment ending mid-sentence (a dangling "and", a trailing comma),
+    - voice on the media stream after the segment completed and before we
+      replied (needs `voice`, the call's HoldDetector, fed with audio),
+    - the speaker's continuation arriving as the very next segment.
+
+    It is shortened on short answers that arrived whole, but only below the
+    profile's default when the media stream confirmed the line went quiet.
+    Without audio there is no evidence of slack, so it stays at the default.
+
+    Initial silence timeouts grow when the remote side keeps taking longer
+    than allowed to start talking, and decay back once they answer promptly.
+    """
+
+    def __init__(self, profiles=None, voice=None):
+        base = profiles or DEFAULT_PROFILES
+        self.defaults = base
+        self.profiles = {key: profile.copy() for key, profile in base.items()}
+        self.voice = voice
+        self.active_key = None
+        self.started_at = None
+        self.last_completed_at = None
+        self.last_completed_key = None
+        self.agent_spoke_since = True
+        # (profile key, completed at, word count) of a segment whose aftermath we haven't judged yet
+        self._pending = None
+        # Per-profile turn and cut-off counts; the cut-off rate gates shortening
+        self.stats = {}
+
+    def select_key(self, agent):
+        state = agent.state.value
+        if state in ("HOLD", "PII_INPUT_NEEDED", "ESCALATING"):
+            return state
+
+        last_agent = next((m["content"] for m in reversed(agent.history) if m["role"] == "assistant"), "")
+        # "Thanks, that works. Is 9am okay?" asks for a yes/no; only the closing question counts
+        question = last_sentence(last_agent)
+        if question.endswith("?") and question.lower().startswith(YES_NO_OPENERS):
+            return "CONFIRMATION"
+
+        last_remote = (agent.latest_transcript or "").lower()
+        if sum(marker in last_remote for marker in IVR_MARKERS) >= 2:
+            return "IVR_MENU"
+        return state
+
+    def recognition_options(self, agent):
+        """Keyword arguments for start_recognizing_media for the next turn."""
+        self._judge_pending()
+        key = self.select_key(agent)
+        profile = self.profiles.setdefault(key, DEFAULT_PROFILES["LISTENING"].copy())
+        self.active_key = key
+        self.started_at = time.monotonic()
+
+        options = {
+            # SDK takes seconds and converts to ms; round to whole ms so the wire value is an integer
+            "end_silence_timeout": round(profile.end_silence * 1000) / 1000,
+            "initial_silence_timeout": int(profile.initial_silence),
+        }
+        if CUSTOM_SPEECH_ENDPOINT_ID:
+            options["speech_recognition_model_endpoint_id"] = CUSTOM_SPEECH_ENDPOINT_ID
+        logger.info(f"Recognition profile {key}: {profile}")
+        return options
+
+    def note_agent_spoke(self):
+        self._judge_pending(replied_at=time.monotonic())
+        self.agent_spoke_since = True
+
+    def observe_completed(self, text):
+        if not self.active_key:
+            return
+        self._judge_pending()
+        now = time.monotonic()
+        profile = self.profiles[self.active_key]
+
+        restarted = (
+            not self.agent_spoke_since
+            and self.last_completed_at is not None
+            and self.last_completed_key == self.active_key
+            and self.started_at - self.last_completed_at < 0.5
+            and now - self.started_at < CUTOFF_WINDOW + profile.end_silence
+        )
+        stats = self.stats.setdefault(self.active_key, {"turns": 0, "cutoffs": 0})
+        stats["turns"] += 1
+        if restarted or trailing_fragment(text):
+            self._cut_off(self.active_key, "continued" if restarted else "mid-sentence")
+        else:
+            # Whether the line went quiet afterwards is known once we reply (or the window passes)
+            self._pending = (self.active_key, now, len(text.split()))
+
+        # Answered well inside the initial window: let it drift back down
+        base = self.defaults.get(self.active_key)
+        if base and profile.initial_silence > base.initial_silence:
+            profile.initial_silence = max(base.initial_silence, profile.initial_silence - 1)
+
+        self.last_completed_at = now
+        self.last_completed_key = self.active_key
+        self.agent_spoke_since = False
+
+    def _judge_pending(self, replied_at=None):
+        if self._pending is None:
+            return
+        key, completed_at, words = self._pending
+        now = time.monotonic()
+        window_end = completed_at + CUTOFF_WINDOW
+        if replied_at is None and now < window_end:
+            # Still inside the window with no reply yet; wait for more audio
+            return
+        self._pending = None
+        window_end = min(window_end, replied_at or now)
+
+        heard = None
+        detector = self.voice
+        if detector is not None and detector.last_frame_at is not None and detector.last_frame_at >= completed_at:
+            # Audio kept arriving after the segment, so silence in it is real
+            heard = detector.voiced_seconds(completed_at + CUTOFF_GRACE, window_end)
+        if heard is not None and heard >= CUTOFF_VOICE:
+            self._cut_off(key, f"{heard:.1f}s of voice after the segment")
+            return
+
+        stats = self.stats[key]
+        profile = self.profiles[key]
+        if words <= 4 and stats["cutoffs"] / stats["turns"] < 0.1:
+            # Short answer that arrived whole and rarely cut: there may be slack to remove,
+            # but below the default only when the audio showed the line actually went quiet
+            floor = profile.min_end_silence
+            if heard is None:
+                floor = max(floor, self.defaults.get(key, DEFAULT_PROFILES["LISTENING"]).end_silence)
+            if profile.end_silence > floor:
+                profile.end_silence = max(floor, profile.end_silence - 0.05)
+
+    def _cut_off(self, key, reason):
+        profile = self.profiles[key]
+        self.stats.setdefault(key, {"turns": 0, "cutoffs": 0})["cutoffs"] += 1
+        profile.end_silence = min(profile.max_end_silence, profile.end_silence + 0.2)
+        logger.info(f"Endpointing: speaker cut off in {key} ({reason}), end silence -> {profile.end_silence:.2f}s")
+
+    def observe_failed(self, result_information):
+        if not self.active_key:
+            return
+        profile = self.profiles[self.active_key]
+        if (result_information or {}).get("subCode") == INITIAL_SILENCE_TIMEOUT_CODE:
+            profile.initial_silence = min(MAX_INITIAL_SILENCE, int(profile.initial_silence * 1.5) + 1)
+            logger.info(f"Endpointing: initial silence timeout in {self.active_key}, now {profile.initial_silence}s")
@@ -0,0 +1,120 @@
+import json
+import time
+import zlib
+import asyncio
+import logging
+
+logger = logging.getLogger("AgentT")
+
+# Events are coalesced for one frame interval before going out as a single binary message
+FRAME_INTERVAL = 0.05
+# Below this size deflate costs more than it saves
+COMPRESS_THRESHOLD = 512
+
+FLAG_DEFLATE = 0x01
+
+# Event kinds on the wire
+REMOTE = "R"
+AGENT = "A"
+SYSTEM = "S"
+INPUT_NEEDED = "P"
+# Remote speech translated for the operator (translation bridge)
+TRANSLATION = "T"
+
+PREFIXES = (("Remote: ", REMOTE), ("Agent: ", AGENT), ("System: ", SYSTEM), ("Translation: ", TRANSLATION))
+
+
+def split_prefix(message):
+    """'Remote: hello' -> ('R', 'hello'). Unprefixed text is a system line."""
+    for prefix, kind in PREFIXES:
+        if message.startswith(prefix):
+            return kind, message[len(prefix):]
+    return SYSTEM, message
+
+
+class EventBatcher:
+    """
+    Coalesces dashboard events into compact binary batches.
+
+    Frame layout: one flag byte (bit 0 = deflate), then UTF-8 JSON
+        {"t": base_ms, "c": {idx: call_connection_id, ...}, "e": [[idx, kind, dt_ms, text, extra?], ...]}
+
+    Call connection ids (long GUIDs) are interned to small integers; idx 0
+    means "no call". Every batch carries the mapping for each id it uses, so
+    a client that missed earlier batches can still decode it, and ids of
+    ended calls are dropped (forget()) instead of piling up for the life of
+    the process. Every client gets the same bytes, so a batch is encoded and
+    compressed once no matter how many dashboards are open.
+
+    `spawn(coro)` runs the scheduled flush as a task the caller keeps a
+    reference to (app.spawn), so it can't be garbage-collected mid-send.
+    """
+
+    def __init__(self, send, spawn=asyncio.ensure_future, interval=FRAME_INTERVAL, compress_threshold=COMPRESS_THRESHOLD):
+        self._send = send
+        self._spawn = spawn
+        self.interval = interval
+        self.compress_threshold = compress_threshold
+        self._pending = []
+        self._ids = {}
+        self._next_idx = 1
+        self._retired = set()
+        self._flush_handle = None
+
+    def add(self, call_connection_id, kind, text, extra=None):
+        self._pending.append((time.time(), call_connection_id, kind, text, extra))
+        if self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.interval, lambda: self._spawn(self.flush()))
+
+    def forget(self, call_connection_id):
+        """The call has ended: drop its id once its last events have gone out."""
+        if call_connection_id in self._ids:
+            self._retired.add(call_connection_id)
+
+    async def flush(self):
+        self._flush_handle = None
+        if not self._pending:
+            return
+        events, self._pending = self._pending, []
+        frame = self.encode(events)
+        for call_connection_id in self._retired:
+            self._ids.pop(call_connection_id, None)
+        self._retired.clear()
+        try:
+            await self._send(frame, len(events))
+        except Exception as e:
+            logger.error(f"Failed to send event batch: {e}")
+
+    def _intern(self, call_connection_id, used):
+        if call_connection_id is None:
+            return 0
+        idx = self._ids.get(call_connection_id)
+        if idx is None:
+            # Never reuse an index: a slow client may still hold the old mapping
+            idx = self._ids[call_connection_id] = self._next_idx
+            self._next_idx += 1
+        used[idx] = call_connection_id
+        return idx
+
+    def encode(self, events):
+        base = events[0][0]
+        used = {}
+        rows = []
+        for ts, call_connection_id, kind, text, extra in events:
+            row = [self._intern(call_connection_id, used), kind, round((ts - base) * 1000), text]
+            if extra is not None:
+                row.append(extra)
+            rows.append(row)
+        payload = {"t": round(base * 1000), "e": rows}
+        if used:
+            payload["c"] = used
+        return self._frame(payload)
+
+    def _frame(self, payload):
+        body = json.dumps(payload, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+        if len(body) >= self.compress_threshold:
+            compressed = zlib.compress(body, 6)
+            if len(compressed) < len(body):
+                return bytes([FLAG_DEFLATE]) + compressed
+        return bytes([0]) + body
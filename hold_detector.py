@@ -0,0 +1,202 @@
+import time
+import logging
+from collections import deque
+
+import numpy as np
+
+logger = logging.getLogger("AgentT")
+
+SAMPLE_RATE = 16000
+FRAME_MS = 20
+
+# Seconds of evidence needed before flipping state either way
+ENTER_HOLD_AFTER = 4.0
+LEAVE_HOLD_AFTER = 0.8
+
+# Sliding window the per-window features are computed over
+WINDOW_SECONDS = 3.0
+# Envelope history searched for a repeating loop
+LOOP_HISTORY_SECONDS = 60.0
+LOOP_MIN_LAG = 4.0
+
+# dBFS; line noise above this is treated as signal
+NOISE_FLOOR_CEILING = -50.0
+
+# Arrival times of active frames kept for voiced_seconds(); endpointing looks a few seconds back
+VOICE_HISTORY_SECONDS = 10.0
+
+
+class HoldDetector:
+    """
+    Classifies raw call audio as live speech, hold music or silence.
+
+    Works on 16 kHz PCM16 frames (ACS media streaming sends 20 ms frames) and
+    keeps only a few seconds of per-frame features, so a 20-minute hold costs
+    the same per frame as the first second. Per frame it computes:
+
+    - energy against an adaptive noise floor (a simple VAD),
+    - spectral flatness (music is tonal and stable, speech alternates
+      voiced/unvoiced so its flatness swings frame to frame).
+
+    Over a sliding window it then looks at:
+
+    - active-frame duty cycle (music rarely pauses; speech does),
+    - flatness variance,
+    - periodicity of the long-term envelope, which catches looped hold
+      tracks and the recorded "please stay on the line" they contain.
+
+    `process()` returns "HOLD" or "LIVE" on the frame the state flips, else None.
+    """
+
+    def __init__(self, sample_rate=SAMPLE_RATE):
+        self.sample_rate = sample_rate
+        self.frame_rate = 1000 // FRAME_MS
+        window_frames = int(WINDOW_SECONDS * self.frame_rate)
+        self.active = deque(maxlen=window_frames)
+        self.flatness = deque(maxlen=window_frames)
+        # Long envelope at 10 Hz for loop detection
+        self.envelope_rate = 10
+        self._env_accum = []
+        self.envelope = deque(maxlen=int(LOOP_HISTORY_SECONDS * self.envelope_rate))
+        self.noise_floor = NOISE_FLOOR_CEILING
+        self.on_hold = False
+        self._evidence = 0.0
+        self._frames = 0
+        self._pending = np.zeros(0, dtype=np.int16)
+        self.last_features = {}
+        # When each recent active frame arrived, and when any frame last did
+        self.voiced_at = deque(maxlen=int(VOICE_HISTORY_SECONDS * self.frame_rate))
+        self.last_frame_at = None
+
+    @property
+    def hold_suspected(self):
+        """On hold, or the latest frames already lean that way without having flipped the state yet."""
+        return self.on_hold or self._evidence > 0
+
+    def voiced_seconds(self, start, end):
+        """How much of the audio received between two monotonic times was voice."""
+        return sum(start <= t < end for t in self.voiced_at) * FRAME_MS / 1000
+
+    def note_frame(self):
+        """A frame arrived, even one not worth analysing (ACS flags silence): the line is still up."""
+        self.last_frame_at = time.monotonic()
+
+    def process(self, pcm, silent=False):
+        """
+        Feed PCM16 mono bytes (any length). Returns "HOLD"/"LIVE" on a transition.
+
+        Frames ACS flags as silent must still come through (silent=True): the
+        gaps between utterances are what the duty cycle and the noise floor
+        are measured on. Their payload isn't trusted; they count as zeros.
+        """
+        self.note_frame()
+        if silent:
+            pcm = bytes(len(pcm) or self.sample_rate * FRAME_MS // 1000 * 2)
+        samples = np.frombuffer(pcm, dtype=np.int16)
+        if self._pending.size:
+            samples = np.concatenate((self._pending, samples))
+        frame_len = self.sample_rate * FRAME_MS // 1000
+        usable = samples.size - samples.size % frame_len
+        self._pending = samples[usable:].copy()
+
+        transition = None
+        for start in range(0, usable, frame_len):
+            result = self._process_frame(samples[start:start + frame_len])
+            if result:
+                transition = result
+        return transition
+
+    def _process_frame(self, frame):
+        x = frame.astype(np.float32) / 32768.0
+        power = float(np.mean(x * x)) + 1e-10
+        db = 10.0 * np.log10(power)
+
+        # Noise floor follows quiet frames quickly and loud frames slowly, and never
+        # rises to the level of continuous music (which would make the music "noise")
+        if db < self.noise_floor:
+            self.noise_floor = 0.9 * self.noise_floor + 0.1 * db
+        else:
+            self.noise_floor = min(NOISE_FLOOR_CEILING, 0.999 * self.noise_floor + 0.001 * db)
+        is_active = db > max(self.noise_floor + 9.0, -55.0)
+
+        spectrum = np.abs(np.fft.rfft(x * np.hanning(x.size))) ** 2 + 1e-12
+        flatness = float(np.exp(np.mean(np.log(spectrum))) / np.mean(spectrum))
+
+        self.active.append(is_active)
+        self.flatness.append(flatness)
+        if is_active:
+            self.voiced_at.append(self.last_frame_at)
+
+        self._env_accum.append(db)
+        if len(self._env_accum) * self.envelope_rate >= self.frame_rate:
+            self.envelope.append(float(np.mean(self._env_accum)))
+            self._env_accum.clear()
+
+        self._frames += 1
+        # Classifying every 100 ms is plenty and keeps per-frame cost flat
+        if self._frames % 5 or len(self.active) < self.active.maxlen:
+            return None
+        return self._update(self._classify())
+
+    def _classify(self):
+        active = np.fromiter(self.active, dtype=bool)
+        flatness = np.fromiter(self.flatness, dtype=np.float32)
+        duty = float(active.mean())
+
+        if duty < 0.1:
+            label = "silence"
+            flat_var = loop = 0.0
+        else:
+            flat_var = float(np.std(np.log10(flatness[active] + 1e-9)))
+            loop = self._loop_score()
+
+            speech_score = (1.0 if duty < 0.85 else 0.0) + (1.0 if flat_var > 0.45 else 0.0)
+            hold_score = (2.0 - speech_score) + (1.5 if loop > 0.6 else 0.0)
+            label = "hold" if hold_score > speech_score + 1.0 else "speech"
+
+        self.last_features = {
+            "label": label,
+            "duty": round(duty, 3),
+            "flatness_var": round(flat_var, 3),
+            "loop": round(loop, 3),
+            "noise_floor_db": round(float(self.noise_floor), 1),
+        }
+        return label
+
+    def _loop_score(self):
+        """Peak normalized autocorrelation of the long envelope beyond LOOP_MIN_LAG."""
+        min_lag = int(LOOP_MIN_LAG * self.envelope_rate)
+        if len(self.envelope) < 2 * min_lag + self.envelope_rate:
+            return 0.0
+        env = np.fromiter(self.envelope, dtype=np.float32)
+        env = env - env.mean()
+        denom = float(np.dot(env, env)) + 1e-9
+        # FFT autocorrelation: O(n log n) over the whole history
+        n = env.size
+        spec = np.fft.rfft(env, 2 * n)
+        acf = np.fft.irfft(spec * np.conj(spec))[:n] / denom
+        # Normalize for the shrinking overlap at long lags and only trust lags with half the history behind them
+        lags = np.arange(n)
+        acf = acf * n / np.maximum(n - lags, 1)
+        upper = n // 2
+        if upper <= min_lag:
+            return 0.0
+        return float(acf[min_lag:upper].max())
+
+    def _update(self, label):
+        step = 5.0 / self.frame_rate
+        if not self.on_hold:
+            self._evidence = self._evidence + step if label == "hold" else 0.0
+            if self._evidence >= ENTER_HOLD_AFTER:
+                self.on_hold = True
+                self._evidence = 0.0
+                logger.info(f"Hold audio detected: {self.last_features}")
+                return "HOLD"
+        else:
+            self._evidence = self._evidence + step if label == "speech" else 0.0
+            if self._evidence >= LEAVE_HOLD_AFTER:
+                self.on_hold = False
+                self._evidence = 0.0
+                logger.info(f"Live speech after hold: {self.last_features}")
+                return "LIVE"
+        return None
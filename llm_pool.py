@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import asyncio
+import inspect
+import logging
+from collections import deque
+from openai import AsyncAzureOpenAI
+
+logger = logging.getLogger("AgentT")
+
+API_VERSION = "2023-12-01-preview"
+
+# Start a second request if the first hasn't answered within this many seconds
+HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER_MS", "1200")) / 1000
+# Hard per-request timeout; a request slower than this counts as a failure
+REQUEST_TIMEOUT = float(os.getenv("LLM_REQUEST_TIMEOUT_S", "15"))
+# Successful but slower than this still counts against the circuit breaker
+SLOW_THRESHOLD = float(os.getenv("LLM_SLOW_THRESHOLD_MS", "6000")) / 1000
+# Background requests (post-call batches) write far longer answers than a live turn
+BACKGROUND_TIMEOUT = float(os.getenv("LLM_BACKGROUND_TIMEOUT_S", "120"))
+
+BREAKER_FAILURES = 3
+BREAKER_COOLDOWN = 30
+
+
+async def _discard(result):
+    """Release a response nobody will read (streams have a close)."""
+    close = getattr(result, "aclose", None) or getattr(result, "close", None)
+    if close:
+        outcome = close()
+        if inspect.isawaitable(outcome):
+            await outcome
+
+
+class LLMEndpoint:
+    """One Azure OpenAI resource + deployment, with latency stats and a circuit breaker."""
+
+    def __init__(self, name, endpoint, api_key, deployment, api_version=API_VERSION):
+        self.name = name
+        self.deployment = deployment
+        self.client = AsyncAzureOpenAI(
+            api_key=api_key,
+            api_version=api_version,
+            azure_endpoint=endpoint,
+            timeout=REQUEST_TIMEOUT,
+            # The pool does its own failover; SDK retries would only hide a slow region
+            max_retries=0,
+        )
+        self.requests = 0
+        self.errors = 0
+        self.background_requests = 0
+        self.background_errors = 0
+        self.hedges_won = 0
+        self.hedges_lost = 0
+        self.latency_ewma = None
+        self.latencies = deque(maxlen=200)
+        self.consecutive_failures = 0
+        self.opened_at = None
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= BREAKER_COOLDOWN:
+            return "half-open"
+        return "open"
+
+    def available(self):
+        return self.state != "open"
+
+    def record_success(self, latency):
+        self.latencies.append(latency)
+        self.latency_ewma = latency if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * latency
+        if latency > SLOW_THRESHOLD:
+            self._record_strike(f"slow response ({latency:.2f}s)")
+        else:
+            self.consecutive_failures = 0
+            self.opened_at = None
+
+    def record_lost(self, elapsed):
+        """
+        Cancelled after running `elapsed` without answering, because another
+        endpoint won the hedge. The real latency is at least that, so it counts
+        as a sample (and as a strike if it's already past the slow threshold).
+        """
+        self.hedges_lost += 1
+        self.latencies.append(elapsed)
+        self.latency_ewma = elapsed if self.latency_ewma is None else 0.8 * self.latency_ewma + 0.2 * max(elapsed, self.latency_ewma)
+        if elapsed > SLOW_THRESHOLD:
+            self._record_strike(f"lost hedge after {elapsed:.2f}s")
+
+    def record_failure(self, error):
+        self.errors += 1
+        self._record_strike(error)
+
+    def _record_strike(self, reason):
+        self.consecutive_failures += 1
+        # A failed half-open trial re-opens immediately
+        if self.consecutive_failures >= BREAKER_FAILURES or self.state == "half-open":
+            if self.opened_at is None or self.state == "half-open":
+                logger.warning(f"LLM endpoint {self.name} ejected for {BREAKER_COOLDOWN}s: {reason}")
+            self.opened_at = time.monotonic()
+
+    def stats(self):
+        ordered = sorted(self.latencies)
+
+        def pct(p):
+            return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000) if ordered else None
+
+        return {
+            "deployment": self.deployment,
+            "state": self.state,
+            "requests": self.requests,
+            "errors": self.errors,
+            "background_requests": self.background_requests,
+            "background_errors": self.background_errors,
+            "hedges_won": self.hedges_won,
+            "hedges_lost": self.hedges_lost,
+            "latency_ewma_ms": round(self.latency_ewma * 1000) if self.latency_ewma is not None else None,
+            "p50_ms": pct(0.5),
+            "p95_ms": pct(0.95),
+            "p99_ms": pct(0.99),
+        }
+
+
+class LLMPool:
+    """
+    Chat completions across several Azure OpenAI endpoints.
+
+    The fastest healthy endpoint gets the request. If it hasn't answered within
+    HEDGE_AFTER, the same request goes to the next endpoint and whichever
+    answers first wins; the loser is cancelled. Errors fail over to the next
+    endpoint immediately. Endpoints that keep failing or answering slowly are
+    ejected by their circuit breaker until the cooldown passes.
+    """
+
+    def __init__(self, endpoints, hedge_after=HEDGE_AFTER):
+        self.endpoints = endpoints
+        self.hedge_after = hedge_after
+        # Optional hook(kwargs, result, started) -> result, e.g. CallRecorder.record_llm
+        self.recorder = None
+
+    @classmethod
+    def from_env(cls):
+        """
+        AZURE_OPENAI_POOL is a JSON list of
+        {"name", "endpoint", "key", "deployment"} objects. Without it, the single
+        AZURE_OPENAI_SERVICE_* endpoint is used.
+        """
+        raw = os.getenv("AZURE_OPENAI_POOL")
+        if raw:
+            entries = json.loads(raw)
+        else:
+            entries = [{
+                "name": "default",
+                "endpoint": os.getenv("AZURE_OPENAI_SERVICE_ENDPOINT"),
+                "key": os.getenv("AZURE_OPENAI_SERVICE_KEY"),
+                "deployment": os.getenv("AZURE_OPENAI_DEPLOYMENT_MODEL", "gpt-4"),
+            }]
+        endpoints = [
+            LLMEndpoint(
+                entry.get("name") or entry["endpoint"],
+                entry["endpoint"],
+                entry["key"],
+                entry.get("deployment", "gpt-4"),
+                entry.get("api_version", API_VERSION),
+            )
+            for entry in entries
+        ]
+        return cls(endpoints)
+
+    def ordered(self):
+        healthy = [e for e in self.endpoints if e.available()]
+        if not healthy:
+            # Everything is ejected: better to try the least-bad one than fail the turn
+            healthy = list(self.endpoints)
+        # Recently failing endpoints go last. Unmeasured ones rank as if they took
+        # hedge_after: ahead of anything known to be slower, behind anything faster.
+        return sorted(healthy, key=lambda e: (
+            e.state != "closed",
+            e.consecutive_failures,
+            self.hedge_after if e.latency_ewma is None else e.latency_ewma,
+        ))
+
+    async def _call(self, endpoint, kwargs, background=False):
+        if background:
+            return await self._call_background(endpoint, kwargs)
+        endpoint.requests += 1
+        started = time.monotonic()
+        try:
+            result = await endpoint.client.chat.completions.create(model=endpoint.deployment, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            endpoint.record_failure(str(e))
+            raise
+        endpoint.record_success(time.monotonic() - started)
+        return result
+
+    async def _call_background(self, endpoint, kwargs):
+        # A 1000-token batch taking 20s says nothing about how fast the next live
+        # turn will be, so it gets its own timeout and stays out of the latency
+        # stats and the breaker that live turns rely on
+        endpoint.background_requests += 1
+        try:
+            return await endpoint.client.chat.completions.create(
+                model=endpoint.deployment, timeout=BACKGROUND_TIMEOUT, **kwargs)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            endpoint.background_errors += 1
+            raise
+
+    async def chat(self, hedge=True, background=False, **kwargs):
+        """
+        Drop-in for client.chat.completions.create (without `model`).
+
+        hedge=False still fails over on errors but never sends a duplicate
+        request. background=True (post-call work) also never hedges, waits up
+        to BACKGROUND_TIMEOUT, and leaves endpoint stats and breakers alone.
+        """
+        hedge = hedge and not background
+        if self.recorder is None:
+            return await self._chat(hedge, kwargs, background)
+        started = time.monotonic()
+        result = await self._chat(hedge, kwargs, background)
+        return self.recorder(kwargs, result, started)
+
+    async def _chat(self, hedge, kwargs, background=False):
+        candidates = self.ordered()
+        if not candidates:
+            raise RuntimeError("LLM pool has no endpoints configured")
+        running = {}
+        launched = {}
+        last_error = None
+        won = False
+
+        def launch():
+            endpoint = candidates.pop(0)
+            task = asyncio.create_task(self._call(endpoint, kwargs, background))
+            running[task] = endpoint
+            launched[task] = time.monotonic()
+
+        primary = candidates[0]
+        launch()
+        hedged = False
+        try:
+            while running:
+                timeout = None if hedged or not hedge or not candidates else self.hedge_after
+                done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+                if not done:
+                    hedged = True
+                    logger.info(f"LLM hedge: {', '.join(e.name for e in running.values())} slow, adding {candidates[0].name}")
+                    launch()
+                    continue
+
+                for task in done:
+                    endpoint = running.pop(task)
+                    if task.exception() is None:
+                        if endpoint is not primary:
+                            endpoint.hedges_won += 1
+                        won = True
+                        return task.result()
+                    last_error = task.exception()
+                    logger.warning(f"LLM endpoint {endpoint.name} failed: {last_error}")
+                if candidates:
+                    launch()
+        finally:
+            for task, endpoint in running.items():
+                if task.done():
+                    # Finished in the same tick as the winner: a stream would hold its connection open
+                    if not task.cancelled() and task.exception() is None:
+                        await _discard(task.result())
+                    continue
+                task.cancel()
+                elapsed = time.monotonic() - launched[task]
+                # Only a request that ran past hedge_after says anything about its endpoint;
+                # a hedge beaten a moment after it was sent doesn't
+                if won and elapsed >= self.hedge_after:
+                    endpoint.record_lost(elapsed)
+        raise last_error
+
+    def stats(self):
+        return {e.name: e.stats() for e in self.endpoints}
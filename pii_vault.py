@@ -0,0 +1,126 @@
+import os
+import re
+import time
+import logging
+from cryptography.fernet import Fernet, InvalidToken
+
+logger = logging.getLogger("AgentT")
+
+DEFAULT_TTL = int(os.getenv("PII_VAULT_TTL_S", "3600"))
+
+# Normalized field name (lowercase, alphanumerics only) -> canonical key.
+# Matched exactly: "Email address", "Doctor name" or "Insurance provider" are
+# different questions, not the patient's address, name or member ID, and go
+# to the operator.
+FIELD_ALIASES = {
+    "fullname": "full_name",
+    "name": "full_name",
+    "firstandlastname": "full_name",
+    "legalname": "full_name",
+    "dateofbirth": "date_of_birth",
+    "birthdate": "date_of_birth",
+    "birthday": "date_of_birth",
+    "dob": "date_of_birth",
+    "address": "address",
+    "streetaddress": "address",
+    "homeaddress": "address",
+    "mailingaddress": "address",
+    "phone": "phone_number",
+    "phonenumber": "phone_number",
+    "callbacknumber": "phone_number",
+    "contactnumber": "phone_number",
+    "insuranceid": "insurance_id",
+    "insurancememberid": "insurance_id",
+    "insurancenumber": "insurance_id",
+    "memberid": "insurance_id",
+    "membernumber": "insurance_id",
+    "policynumber": "insurance_id",
+}
+# "Patient's date of birth" asks the same thing as "date of birth"
+_PATIENT_PREFIX = re.compile(r"^(the)?patients?")
+
+
+def canonical_field(name):
+    """Map whatever the LLM or operator called a field onto a vault key."""
+    normalized = re.sub(r"[^a-z0-9]", "", (name or "").lower())
+    for candidate in (normalized, _PATIENT_PREFIX.sub("", normalized)):
+        if candidate in FIELD_ALIASES:
+            return FIELD_ALIASES[candidate]
+    # Anything else only matches a profile field loaded under that exact name
+    return normalized or None
+
+
+class PIIVault:
+    """
+    In-memory, encrypted store of per-call PII profiles.
+
+    Values are Fernet-encrypted with a key generated at startup and never
+    written anywhere, so a heap dump or a stray log of the vault shows only
+    ciphertext, and a restart makes every profile unreadable. Profiles expire
+    after their TTL and are purged when the call disconnects. Nothing here
+    logs values; log lines carry field names only.
+
+    A profile loaded before a call exists is held as "pending" and claimed by
+    the next call that starts.
+    """
+
+    def __init__(self):
+        self._fernet = Fernet(Fernet.generate_key())
+        self._profiles = {}
+        self._pending = None
+
+    def __repr__(self):
+        return f"<PIIVault profiles={len(self._profiles)} pending={self._pending is not None}>"
+
+    def load(self, call_connection_id, fields, ttl=DEFAULT_TTL):
+        """Encrypt and store a profile. call_connection_id=None stores it for the next call."""
+        profile = {
+            "expires_at": time.monotonic() + ttl,
+            "ttl": ttl,
+            "fields": {
+                canonical_field(name): self._fernet.encrypt(str(value).encode("utf-8"))
+                for name, value in fields.items()
+                if value and canonical_field(name)
+            },
+        }
+        if call_connection_id is None:
+            self._pending = profile
+        else:
+            self._profiles[call_connection_id] = profile
+        logger.info(f"PII profile loaded for {call_connection_id or 'next call'}: fields={sorted(profile['fields'])}")
+        return sorted(profile["fields"])
+
+    def claim_pending(self, call_connection_id):
+        if self._pending and call_connection_id not in self._profiles:
+            self._profiles[call_connection_id] = self._pending
+            self._pending = None
+            logger.info(f"PII profile claimed by call {call_connection_id}")
+
+    def lookup(self, call_connection_id, field_name):
+        """Decrypted value for a requested field, or None if missing or expired."""
+        self._sweep()
+        profile = self._profiles.get(call_connection_id)
+        key = canonical_field(field_name)
+        if not profile or key not in profile["fields"]:
+            return None
+        try:
+            return self._fernet.decrypt(profile["fields"][key], ttl=profile["ttl"]).decode("utf-8")
+        except InvalidToken:
+            return None
+
+    def fields(self, call_connection_id):
+        self._sweep()
+        profile = self._profiles.get(call_connection_id)
+        return sorted(profile["fields"]) if profile else []
+
+    def purge(self, call_connection_id):
+        if self._profiles.pop(call_connection_id, None) is not None:
+            logger.info(f"PII profile purged for call {call_connection_id}")
+
+    def _sweep(self):
+        now = time.monotonic()
+        for call_connection_id in [c for c, p in self._profiles.items() if p["expires_at"] <= now]:
+            del self._profiles[call_connection_id]
+            logger.info(f"PII profile expired for call {call_connection_id}")
+        if self._pending and self._pending["expires_at"] <= now:
+            self._pending = None
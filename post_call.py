@@ -0,0 +1,292 @@
+import os
+import re
+import json
+import time
+import random
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime
+
+from openai import RateLimitError
+
+from transcript_archive import normalize_phone
+from token_scheduler import BACKGROUND, estimate_tokens, retry_after_seconds
+
+logger = logging.getLogger("AgentT")
+
+QUEUE_SIZE = int(os.getenv("POST_CALL_QUEUE_SIZE", "500"))
+WORKERS = int(os.getenv("POST_CALL_WORKERS", "2"))
+BATCH_SIZE = int(os.getenv("POST_CALL_BATCH_SIZE", "4"))
+# Once a worker has one call, how long it waits for more to fill the batch
+BATCH_WAIT = 2.0
+MAX_ATTEMPTS = 4
+RETRY_BASE = 2.0
+# Very long calls are cut to their last turns; the outcome is at the end
+MAX_TURNS_PER_CALL = 120
+COMPLETION_TOKENS_PER_CALL = 250
+
+OUTCOMES = ("booked", "no_availability", "callback_requested", "escalated", "incomplete")
+
+EXTRACTION_PROMPT = (
+    "You review finished phone calls that Agent T, an appointment-booking assistant, made to "
+    "doctor's offices. For each call return a JSON object with: call_id; summary (two sentences at "
+    "most); outcome (one of " + ", ".join(OUTCOMES) + "); appointment_date (YYYY-MM-DD, resolved "
+    "against the call date, or null); appointment_time (HH:MM 24h or null); clinic (the office or "
+    "provider name, or null); escalated (true if the call was handed to a human or a representative "
+    "was requested); escalation_reason (short phrase or null). "
+    'Reply with only {"calls": [...]} containing one object per call, in order.'
+)
+
+
+class PostCallJob:
+    def __init__(self, call_id, phone, turns):
+        self.call_id = call_id
+        self.phone = normalize_phone(phone)
+        self.turns = turns
+        self.ended_at = turns[-1]["ts"]
+        self.submitted_at = time.monotonic()
+        self.enqueued_at = self.submitted_at
+        self.attempts = 0
+        self.last_error = None
+
+
+def format_call(job):
+    turns = job.turns[-MAX_TURNS_PER_CALL:]
+    lines = "\n".join(f"{t['speaker']}: {t['text']}" for t in turns)
+    return f"### call_id: {job.call_id}\ncall date: {datetime.fromtimestamp(job.ended_at):%Y-%m-%d (%A)}\n{lines}"
+
+
+def _clean(value):
+    if value is None:
+        return None
+    value = str(value).strip()
+    return value if value and value.lower() not in ("null", "none", "n/a", "unknown") else None
+
+
+def normalize_outcome(raw):
+    outcome = (_clean(raw.get("outcome")) or "incomplete").lower()
+    date = _clean(raw.get("appointment_date"))
+    if date and not re.fullmatch(r"\d{4}-\d{2}-\d{2}", date):
+        date = None
+    time_ = _clean(raw.get("appointment_time"))
+    escalated = raw.get("escalated")
+    if isinstance(escalated, str):
+        escalated = escalated.strip().lower() in ("true", "yes", "1")
+    return {
+        "summary": _clean(raw.get("summary")),
+        "outcome": outcome if outcome in OUTCOMES else "incomplete",
+        "appointment_date": f"{date} {time_}" if date and time_ else date,
+        "clinic": _clean(raw.get("clinic")),
+        "escalated": bool(escalated),
+        "escalation_reason": _clean(raw.get("escalation_reason")),
+    }
+
+
+def parse_outcomes(content):
+    """LLM reply -> {call_id: outcome}. Tolerates code fences and chatter around the JSON."""
+    match = re.search(r"\{.*\}", content or "", re.S)
+    if not match:
+        raise ValueError("no JSON object in extraction reply")
+    calls = json.loads(match.group(0)).get("calls") or []
+    return {str(c["call_id"]): normalize_outcome(c) for c in calls if isinstance(c, dict) and c.get("call_id")}
+
+
+class LLMOutcomeExtractor:
+    """Summarizes a batch of calls with one background-priority request through the shared pool."""
+
+    def __init__(self, pool, scheduler):
+        self.pool = pool
+        self.scheduler = scheduler
+
+    async def __call__(self, jobs):
+        messages = [
+            {"role": "system", "content": EXTRACTION_PROMPT},
+            {"role": "user", "content": "\n\n".join(format_call(job) for job in jobs)},
+        ]
+        max_tokens = COMPLETION_TOKENS_PER_CALL * len(jobs)
+        reservation = await self.scheduler.admit(estimate_tokens(messages, max_tokens), BACKGROUND)
+        if reservation is None:
+            raise RuntimeError("no LLM budget for background work")
+        try:
+            completion = await self.pool.chat(background=True, messages=messages, max_tokens=max_tokens, temperature=0)
+        except RateLimitError as e:
+            self.scheduler.throttle(retry_after_seconds(e.response))
+            raise
+        self.scheduler.record_usage(reservation, completion.usage.total_tokens if completion.usage else None)
+        return parse_outcomes(completion.choices[0].message.content)
+
+
+class PostCallPipeline:
+    """
+    Background summarization and outcome extraction for finished calls.
+
+    CallDisconnected hands the call's transcript to submit(), which never
+    blocks: the queue is bounded and a full queue rejects (the transcript is
+    archived regardless, so nothing is lost for good). A few worker tasks
+    pull calls off the queue in batches, so several short calls share one LLM
+    request. The LLM work is admitted at BACKGROUND priority, behind every
+    live turn and within its own share of the quota. Failed calls are retried
+    with exponential backoff and jitter, off the queue so they don't hold a
+    worker. After MAX_ATTEMPTS a call is stored with status "failed" so it
+    can be found and re-run.
+    """
+
+    def __init__(self, extract, store, workers=WORKERS, batch_size=BATCH_SIZE,
+                 batch_wait=BATCH_WAIT, queue_size=QUEUE_SIZE, max_attempts=MAX_ATTEMPTS):
+        self.extract = extract
+        self.store = store
+        self.workers = workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait
+        self.max_attempts = max_attempts
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._tasks = []
+        self._retry_handles = set()
+        self._in_flight = 0
+        self._lags = deque(maxlen=500)
+        self._extract_times = deque(maxlen=200)
+        self._completed_at = deque(maxlen=5000)
+        self._batched_calls = 0
+        self.counters = {"submitted": 0, "completed": 0, "failed": 0, "rejected": 0, "retries": 0, "batches": 0}
+
+    def submit(self, call_id, phone, turns):
+        """Queue a finished call. Returns False if it was rejected."""
+        if not turns:
+            return False
+        self._start()
+        if not self._enqueue(PostCallJob(call_id, phone, list(turns))):
+            return False
+        self.counters["submitted"] += 1
+        return True
+
+    def _start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    def _enqueue(self, job):
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except asyncio.QueueFull:
+            self.counters["rejected"] += 1
+            logger.warning(f"Post-call queue full; dropping outcome extraction for {job.call_id}")
+            return False
+
+    async def _worker(self):
+        while True:
+            batch = [await self._queue.get()]
+            # Counted as soon as they leave the queue, so pending() never misses a call
+            self._in_flight += 1
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+                self._in_flight += 1
+            try:
+                await self._process(batch)
+            except Exception as e:
+                logger.error(f"Post-call batch crashed: {e}")
+            finally:
+                self._in_flight -= len(batch)
+                for _ in batch:
+                    self._queue.task_done()
+
+    async def _process(self, batch):
+        now = time.monotonic()
+        self._lags.extend(now - job.enqueued_at for job in batch)
+        self.counters["batches"] += 1
+        self._batched_calls += len(batch)
+        for job in batch:
+            job.attempts += 1
+
+        outcomes, error = {}, None
+        try:
+            outcomes = await self.extract(batch)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+            logger.warning(f"Post-call extraction failed for {len(batch)} call(s): {error}")
+        self._extract_times.append(time.monotonic() - now)
+
+        rows, failed = [], []
+        for job in batch:
+            outcome = outcomes.get(job.call_id)
+            if outcome:
+                rows.append(self._row(job, "ok", outcome))
+            elif job.attempts >= self.max_attempts:
+                failed.append(job)
+                rows.append(self._row(job, "failed", {"error": error or job.last_error or "missing from extraction reply"}))
+            else:
+                job.last_error = error or "missing from extraction reply"
+                self._retry(job)
+        await self.store.save_outcomes(rows)
+
+        self.counters["completed"] += len(rows) - len(failed)
+        self.counters["failed"] += len(failed)
+        finished = time.monotonic()
+        self._completed_at.extend(finished for _ in rows)
+        for job in failed:
+            logger.error(f"Giving up on outcome extraction for {job.call_id} after {job.attempts} attempts")
+
+    def _row(self, job, status, outcome):
+        return dict(
+            outcome,
+            call_id=job.call_id,
+            phone=job.phone,
+            ended_at=job.ended_at,
+            status=status,
+            attempts=job.attempts,
+            processed_at=time.time(),
+        )
+
+    def _retry(self, job):
+        self.counters["retries"] += 1
+        delay = RETRY_BASE * 2 ** (job.attempts - 1) * random.uniform(0.8, 1.2)
+
+        def requeue():
+            self._retry_handles.discard(handle)
+            job.enqueued_at = time.monotonic()
+            self._enqueue(job)
+
+        handle = asyncio.get_running_loop().call_later(delay, requeue)
+        self._retry_handles.add(handle)
+
+    def pending(self):
+        return self._queue.qsize() + self._in_flight + len(self._retry_handles)
+
+    async def drain(self, timeout):
+        """Wait (up to timeout) for queued, in-flight and retrying calls to finish."""
+        deadline = time.monotonic() + timeout
+        while self.pending() and time.monotonic() < deadline:
+            await asyncio.sleep(0.2)
+        if self.pending():
+            logger.warning(f"Post-call pipeline still has {self.pending()} call(s) pending at shutdown")
+
+    def stats(self):
+        now = time.monotonic()
+        lags = sorted(self._lags)
+        oldest = self._queue._queue[0].enqueued_at if self._queue.qsize() else None
+
+        def pct(p):
+            return round(lags[min(len(lags) - 1, int(p * len(lags)))] * 1000) if lags else 0
+
+        batches = self.counters["batches"]
+        return dict(
+            self.counters,
+            queued=self._queue.qsize(),
+            queue_capacity=self._queue.maxsize,
+            in_flight=self._in_flight,
+            retrying=len(self._retry_handles),
+            workers=self.workers,
+            # Time calls spend waiting between submit (or retry) and a worker picking them up
+            queue_lag_ms={"p50": pct(0.5), "p95": pct(0.95), "max": round(lags[-1] * 1000) if lags else 0},
+            oldest_queued_s=round(now - oldest, 1) if oldest is not None else 0,
+            throughput_per_min=sum(1 for t in self._completed_at if now - t <= 60),
+            avg_extract_ms=round(sum(self._extract_times) / len(self._extract_times) * 1000) if self._extract_times else 0,
+            avg_batch_size=round(self._batched_calls / batches, 2) if batches else 0,
+        )
@@ -0,0 +1,103 @@
+import re
+import hashlib
+from collections import deque
+
+import numpy as np
+
+FINGERPRINT_BITS = 64
+# 8 bands of 8 bits: two fingerprints within MAX_DISTANCE bits share at least 2 bands exactly
+BANDS = 8
+BAND_BITS = FINGERPRINT_BITS // BANDS
+BAND_MASK = (1 << BAND_BITS) - 1
+
+MAX_DISTANCE = 6
+# Shorter utterances ("okay", "sorry?") repeat naturally in live conversation
+MIN_TOKENS = 4
+
+_WORD = re.compile(r"[a-z#']+")
+_DIGITS = re.compile(r"\d+")
+
+
+def _tokens(text):
+    # Queue positions and wait times change between repeats; the message doesn't
+    return _WORD.findall(_DIGITS.sub("#", text.lower()))
+
+
+def simhash(tokens):
+    """64-bit SimHash over words and word bigrams."""
+    features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+    digests = b"".join(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest() for f in features)
+    # One row of 64 bits per feature; majority vote per column
+    bits = np.unpackbits(np.frombuffer(digests, dtype=np.uint8).reshape(len(features), 8), axis=1, bitorder="little")
+    majority = bits.sum(axis=0) * 2 > len(features)
+    return int.from_bytes(np.packbits(majority, bitorder="little").tobytes(), "little")
+
+
+class RepetitionIndex:
+    """
+    Recent remote utterances of one call, indexed for near-duplicate lookup.
+
+    Each utterance is reduced to a SimHash fingerprint and filed under its
+    eight 8-bit bands. A lookup only compares against fingerprints sharing a
+    band, then confirms with a Hamming distance check, so "Your call is
+    important to us, please stay on the line" matches its next playback even
+    when recognition drops or swaps a word.
+    """
+
+    def __init__(self, capacity=64, max_distance=MAX_DISTANCE, min_tokens=MIN_TOKENS):
+        self.capacity = capacity
+        self.max_distance = max_distance
+        self.min_tokens = min_tokens
+        self._entries = deque()
+        self._bands = [dict() for _ in range(BANDS)]
+        self.checks = 0
+        self.repeats = 0
+        self.llm_calls_saved = 0
+
+    def check(self, text):
+        """Record `text`; return how many times a near-duplicate was seen before (0 = new)."""
+        tokens = _tokens(text)
+        if len(tokens) < self.min_tokens:
+            return 0
+        self.checks += 1
+        fingerprint = simhash(tokens)
+
+        best = None
+        for band, table in enumerate(self._bands):
+            for entry in table.get((fingerprint >> (band * BAND_BITS)) & BAND_MASK, ()):
+                if (entry[0] ^ fingerprint).bit_count() <= self.max_distance:
+                    best = entry
+                    break
+            if best:
+                break
+
+        if best:
+            best[1] += 1
+            self.repeats += 1
+            return best[1] - 1
+
+        entry = [fingerprint, 1]
+        self._entries.append(entry)
+        for band, table in enumerate(self._bands):
+            table.setdefault((fingerprint >> (band * BAND_BITS)) & BAND_MASK, []).append(entry)
+        if len(self._entries) > self.capacity:
+            self._evict(self._entries.popleft())
+        return 0
+
+    def _evict(self, entry):
+        fingerprint = entry[0]
+        for band, table in enumerate(self._bands):
+            key = (fingerprint >> (band * BAND_BITS)) & BAND_MASK
+            bucket = table.get(key)
+            if bucket:
+                bucket.remove(entry)
+                if not bucket:
+                    del table[key]
+
+    def stats(self):
+        return {
+            "indexed": len(self._entries),
+            "checks": self.checks,
+            "repeats": self.repeats,
+            "llm_calls_saved": self.llm_calls_saved,
+        }
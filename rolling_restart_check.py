@@ -0,0 +1,367 @@
+"""
+Rolling-restart check for the production launcher (run_agent.py --prod).
+
+Runs everything locally: a Call Automation stand-in (HTTPS with a throwaway
+self-signed cert, since the SDK insists on https), an OpenAI stand-in, and
+real agent instances launched the way production launches them. Simulated
+calls are driven through instance A. Mid-traffic, instance B joins the
+rotation and A gets SIGTERM, like one step of a rolling deploy.
+
+Passes when no call dropped: every IncomingCall was answered (by B after A
+started refusing), every webhook got a 200, every call reached
+CallDisconnected on the instance that answered it, and A exited only after
+its last call ended.
+
+    python rolling_restart_check.py
+    python rolling_restart_check.py --workers 1
+    python rolling_restart_check.py --calls 40 --turns 3 --gap 0.5
+"""
+import os
+import ssl
+import sys
+import json
+import time
+import uuid
+import signal
+import socket
+import asyncio
+import argparse
+import datetime
+import ipaddress
+import tempfile
+import threading
+import subprocess
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+import httpx
+from cryptography import x509
+from cryptography.x509.oid import NameOID
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REMOTE_LINES = [
+    "Hi, this is the front desk, how can I help you",
+    "We have an opening next Thursday at nine in the morning",
+    "Can I get the patient's insurance provider please",
+    "Okay that works, anything else I can do for you today",
+]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def self_signed_cert(directory):
+    key = ec.generate_private_key(ec.SECP256R1())
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "127.0.0.1")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name)
+        .issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(minutes=5))
+        .not_valid_after(now + datetime.timedelta(days=1))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), critical=False)
+        .add_extension(x509.BasicConstraints(ca=True, path_length=None), critical=True)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path, key_path = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+class FakeServices:
+    """Just enough of the Call Automation REST API and Azure OpenAI for one call flow."""
+
+    def __init__(self, cert_path, key_path):
+        self.lock = threading.Lock()
+        self.answers = {}   # incomingCallContext -> (call_connection_id, callback_uri)
+        self.ops = {}       # call_connection_id -> [(operation, operationContext)]
+        self.llm_requests = 0
+
+        services = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("content-length") or 0))
+                status, payload = services.handle(self.path, json.loads(body) if body else {})
+                out = json.dumps(payload).encode() if payload is not None else b""
+                self.send_response(status)
+                self.send_header("content-type", "application/json")
+                self.send_header("content-length", str(len(out)))
+                self.end_headers()
+                self.wfile.write(out)
+
+            def log_message(self, *args):
+                pass
+
+        self.acs = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert_path, key_path)
+        self.acs.socket = context.wrap_socket(self.acs.socket, server_side=True)
+        self.llm = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        for server in (self.acs, self.llm):
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    def handle(self, path, body):
+        path = path.split("?")[0]
+        if path.endswith("/chat/completions"):
+            with self.lock:
+                self.llm_requests += 1
+            time.sleep(0.05)
+            content = "Thanks. Is there anything earlier in the week?"
+            prompt = body["messages"][-1]["content"]
+            if "### call_id:" in prompt:
+                # Post-call outcome extraction
+                content = json.dumps({"calls": [
+                    {"call_id": line.split(": ", 1)[1], "summary": "Asked for an earlier slot.", "outcome": "incomplete"}
+                    for line in prompt.splitlines() if line.startswith("### call_id:")
+                ]})
+            return 200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex[:8]}", "object": "chat.completion", "created": int(time.time()), "model": "gpt-4",
+                "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": 120, "completion_tokens": 12, "total_tokens": 132},
+            }
+        if path == "/calling/callConnections:answer":
+            call_connection_id = f"cc-{uuid.uuid4().hex[:12]}"
+            with self.lock:
+                self.answers[body["incomingCallContext"]] = (call_connection_id, body["callbackUri"])
+                self.ops[call_connection_id] = []
+            return 200, {"callConnectionId": call_connection_id, "serverCallId": uuid.uuid4().hex,
+                         "callConnectionState": "connecting", "callbackUri": body["callbackUri"]}
+        if path.startswith("/calling/callConnections/") and ":" in path:
+            call_connection_id, operation = path.rsplit("/", 1)[1].split(":", 1)
+            with self.lock:
+                self.ops.setdefault(call_connection_id, []).append((operation, body.get("operationContext")))
+            return 202, None
+        return 404, {"error": path}
+
+
+class Instance:
+    def __init__(self, name, workdir, services, cert_path, workers):
+        self.name = name
+        self.port = free_port()
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.log_path = os.path.join(workdir, f"{name}.log")
+        self.exited_at = None
+        env = dict(
+            os.environ,
+            ACS_CONNECTION_STRING=f"endpoint=https://127.0.0.1:{services.acs.server_port}/;accesskey=ZmFrZQ==",
+            REQUESTS_CA_BUNDLE=cert_path,
+            AZURE_OPENAI_SERVICE_ENDPOINT=f"http://127.0.0.1:{services.llm.server_port}/",
+            AZURE_OPENAI_SERVICE_KEY="fake",
+            AZURE_OPENAI_DEPLOYMENT_MODEL="gpt-4",
+            AZURE_OPENAI_POOL="",
+            CALLBACK_URI_HOST=self.url,
+            MEDIA_STREAMING_ENABLED="false",
+            TRANSCRIPT_ARCHIVE_DIR=os.path.join(workdir, f"transcripts-{name}"),
+            PYTHONUNBUFFERED="1",
+        )
+        self.log = open(self.log_path, "w")
+        self.proc = subprocess.Popen(
+            [sys.executable, "run_agent.py", "--prod", "--port", str(self.port), "--workers", str(workers)],
+            cwd=HERE, env=env, stdout=self.log, stderr=subprocess.STDOUT,
+        )
+
+    async def wait_healthy(self, client, timeout=30):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"instance {self.name} died on startup, see {self.log_path}")
+            try:
+                if (await client.get(f"{self.url}/healthz")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+        raise RuntimeError(f"instance {self.name} not healthy after {timeout}s")
+
+    async def wait_exit(self, timeout):
+        deadline = time.monotonic() + timeout
+        while self.proc.poll() is None and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        if self.proc.poll() is not None and self.exited_at is None:
+            self.exited_at = time.monotonic()
+        return self.proc.poll()
+
+
+class Check:
+    def __init__(self, args, services, workdir, cert_path):
+        self.args = args
+        self.services = services
+        self.workdir = workdir
+        self.cert_path = cert_path
+        self.instances = []
+        self.refused = 0
+        self.active_at_sigterm = 0
+        self.results = []
+        self.last_disconnect = {}   # instance url -> monotonic time of its last CallDisconnected
+
+    async def deliver_incoming_call(self, client, context):
+        """Event Grid: round-robin over known instances, retrying 503s and dead endpoints."""
+        event = [{
+            "eventType": "Microsoft.Communication.IncomingCall",
+            "data": {"incomingCallContext": context, "from": {"phoneNumber": {"value": "+15550100"}}},
+        }]
+        for attempt in range(50):
+            instance = self.instances[attempt % len(self.instances)]
+            try:
+                response = await client.post(f"{instance.url}/api/callbacks", json=event)
+                if response.status_code == 200:
+                    return
+                self.refused += 1
+            except httpx.TransportError:
+                self.refused += 1
+            await asyncio.sleep(0.1)
+        raise RuntimeError("IncomingCall never accepted")
+
+    async def next_op(self, call_connection_id, wanted, cursor, timeout=15):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            with self.services.lock:
+                ops = self.services.ops.get(call_connection_id, [])
+                while cursor[0] < len(ops):
+                    operation, context = ops[cursor[0]]
+                    cursor[0] += 1
+                    if operation == wanted:
+                        return context
+            await asyncio.sleep(0.02)
+        raise RuntimeError(f"stalled waiting for {wanted}")
+
+    async def webhook(self, client, callback_uri, call_connection_id, event_type, **data):
+        event = [{"type": f"Microsoft.Communication.{event_type}",
+                  "data": dict(data, callConnectionId=call_connection_id)}]
+        response = await client.post(callback_uri, json=event)
+        if response.status_code != 200:
+            raise RuntimeError(f"{event_type} got HTTP {response.status_code}")
+
+    async def run_call(self, client, index):
+        context = f"ctx-{index}-{uuid.uuid4().hex[:6]}"
+        result = {"call": index, "ok": False, "instance": None, "error": None}
+        self.results.append(result)
+        try:
+            await self.deliver_incoming_call(client, context)
+            with self.services.lock:
+                call_connection_id, callback_uri = self.services.answers[context]
+            result["instance"] = callback_uri.rsplit("/api/", 1)[0]
+            cursor = [0]
+            await self.webhook(client, callback_uri, call_connection_id, "CallConnected")
+            for turn in range(self.args.turns):
+                play_context = await self.next_op(call_connection_id, "play", cursor)
+                await asyncio.sleep(self.args.gap)
+                await self.webhook(client, callback_uri, call_connection_id, "PlayCompleted", operationContext=play_context)
+                await self.next_op(call_connection_id, "recognize", cursor)
+                await asyncio.sleep(self.args.gap)
+                await self.webhook(client, callback_uri, call_connection_id, "RecognizeCompleted",
+                                   recognitionType="speech", speechResult={"speech": f"{REMOTE_LINES[turn % len(REMOTE_LINES)]} ({index})"})
+            await self.next_op(call_connection_id, "play", cursor)
+            await self.webhook(client, callback_uri, call_connection_id, "CallDisconnected")
+            self.last_disconnect[result["instance"]] = time.monotonic()
+            result["ok"] = True
+        except Exception as e:
+            result["error"] = f"{type(e).__name__}: {e}"
+
+    async def run(self):
+        args = self.args
+        async with httpx.AsyncClient(timeout=20) as client:
+            old = Instance("A", self.workdir, self.services, self.cert_path, args.workers)
+            # B boots alongside but only joins the rotation at the roll, like a new deploy slot
+            new = Instance("B", self.workdir, self.services, self.cert_path, args.workers)
+            self.instances.append(old)
+            await old.wait_healthy(client)
+            await new.wait_healthy(client)
+
+            calls = []
+            started = time.monotonic()
+            roll_at = args.calls // 3
+            for index in range(args.calls):
+                calls.append(asyncio.create_task(self.run_call(client, index)))
+                if index == roll_at:
+                    await asyncio.sleep(args.gap)
+                    self.instances.append(new)
+                    self.active_at_sigterm = (await client.get(f"{old.url}/healthz")).json()["active_calls"]
+                    print(f"t={time.monotonic() - started:5.1f}s  B in rotation; SIGTERM A with {self.active_at_sigterm} active call(s)")
+                    old.proc.send_signal(signal.SIGTERM)
+                    await asyncio.sleep(0.3)
+                    try:
+                        health = await client.get(f"{old.url}/healthz")
+                        print(f"t={time.monotonic() - started:5.1f}s  A /healthz -> {health.status_code} {health.json()}")
+                    except httpx.TransportError:
+                        print(f"t={time.monotonic() - started:5.1f}s  A already gone")
+                await asyncio.sleep(args.stagger)
+
+            code = await old.wait_exit(timeout=args.drain_wait)
+            await asyncio.gather(*calls)
+            print(f"t={time.monotonic() - started:5.1f}s  all calls finished; A exit code {code}")
+
+            new.proc.send_signal(signal.SIGTERM)
+            new_code = await new.wait_exit(timeout=30)
+
+        for instance in (old, new):
+            instance.log.close()
+        return self.report(old, new, code, new_code)
+
+    def report(self, old, new, code, new_code):
+        failures = [r for r in self.results if not r["ok"]]
+        per_instance = {i.name: sum(1 for r in self.results if r["ok"] and r["instance"] == i.url) for i in (old, new)}
+        print(f"\ncalls: {len(self.results)}  completed: {len(self.results) - len(failures)}  dropped: {len(failures)}")
+        print(f"per instance: {per_instance}  IncomingCall deliveries refused/retried: {self.refused}  "
+              f"LLM requests: {self.services.llm_requests}")
+        for r in failures:
+            print(f"  DROPPED call {r['call']} on {r['instance']}: {r['error']}")
+
+        problems = []
+        if failures:
+            problems.append(f"{len(failures)} call(s) dropped")
+        if code is None:
+            problems.append("A did not exit after draining")
+        elif old.url in self.last_disconnect and old.exited_at < self.last_disconnect[old.url]:
+            problems.append("A exited before its last call ended")
+        if not self.active_at_sigterm:
+            problems.append("A had no active calls at SIGTERM; the drain wasn't exercised")
+        if per_instance["B"] == 0:
+            problems.append("no calls reached B; the roll wasn't exercised")
+        if new_code is None:
+            problems.append("B did not exit on SIGTERM with no calls")
+        if problems:
+            print("FAIL: " + "; ".join(problems) + f"  (logs in {self.workdir})")
+            return 1
+        print("PASS: rolling restart dropped zero calls")
+        return 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=24)
+    parser.add_argument("--turns", type=int, default=3, help="remote/agent exchanges per call")
+    parser.add_argument("--gap", type=float, default=0.4, help="seconds each simulated play/recognition takes")
+    parser.add_argument("--stagger", type=float, default=0.25, help="seconds between call arrivals")
+    parser.add_argument("--workers", type=int, default=2, help="workers per instance")
+    parser.add_argument("--drain-wait", type=float, default=120, help="how long A may take to drain")
+    parser.add_argument("--keep", action="store_true", help="keep the work directory with instance logs")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="agent-roll-")
+    cert_path, key_path = self_signed_cert(workdir)
+    services = FakeServices(cert_path, key_path)
+    try:
+        code = asyncio.run(Check(args, services, workdir, cert_path).run())
+    finally:
+        services.acs.shutdown()
+        services.llm.shutdown()
+    if code == 0 and not args.keep:
+        import shutil
+        shutil.rmtree(workdir, ignore_errors=True)
+    return code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,14 +1,11 @@
 import os
 import sys
+import argparse
+import importlib.util
 import subprocess
 import time
-from pyngrok import ngrok, conf
 from dotenv import load_dotenv
 
-# 1. Configure pyngrok to use our local binary
-# This prevents it from trying to download and hitting SSL errors
-conf.get_default().ngrok_path = os.path.abspath("./ngrok")
-
 def update_env_file(ngrok_url):
     env_path = ".env"
     if not os.path.exists(env_path):
@@ -27,7 +24,61 @@ def update_env_file(ngrok_url):
     
     print(f"✅ Updated .env with callback URL: {ngrok_url}")
 
+def resolve_workers(value):
+    if value == "auto":
+        # Cores this process may actually run on (respects container CPU pinning)
+        return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    return max(1, int(value))
+
+def run_production(port, workers):
+    """No tunnel, no reload: uvloop/httptools when installed, N workers, calls drained on SIGTERM."""
+    import uvicorn
+    from drain import DrainingServer, serve_workers
+
+    load_dotenv()
+    if not os.getenv("CALLBACK_URI_HOST"):
+        print("❌ CALLBACK_URI_HOST must be set to the public URL in production mode")
+        sys.exit(1)
+
+    loop = "uvloop" if importlib.util.find_spec("uvloop") else "asyncio"
+    http = "httptools" if importlib.util.find_spec("httptools") else "h11"
+    config = uvicorn.Config(
+        "app:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        # The app logs every webhook already
+        access_log=False,
+        timeout_graceful_shutdown=30,
+    )
+    print(f"🏭 Starting Agent T (Production Mode) on :{port} with {workers} worker(s), loop={loop}, http={http}")
+    if workers > 1:
+        serve_workers(config, workers)
+    else:
+        DrainingServer(config).run()
+
 def main():
+    parser = argparse.ArgumentParser(description="Run Agent T")
+    parser.add_argument("--prod", action="store_true", help="production mode: no ngrok, no reload, worker pool, graceful drain")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", default=os.getenv("AGENT_WORKERS", "auto"),
+                        help="worker processes in production mode, or 'auto' for one per core")
+    args = parser.parse_args()
+    if args.prod:
+        run_production(args.port, resolve_workers(args.workers))
+        return
+
+    # Only the dev tunnel needs ngrok; production hosts don't install it
+    from pyngrok import ngrok, conf
+
+    # 1. Configure pyngrok to use our local binary
+    # This prevents it from trying to download and hitting SSL errors
+    conf.get_default().ngrok_path = os.path.abspath("./ngrok")
+
     print("🚀 Starting Agent T (Docker Mode)...")
     
     # 2. Start Ngrok Tunnel
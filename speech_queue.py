@@ -0,0 +1,114 @@
+import heapq
+import itertools
+import logging
+import time
+import uuid
+from enum import IntEnum
+
+logger = logging.getLogger("AgentT")
+
+
+class SpeechPriority(IntEnum):
+    """Lower value plays first."""
+    HUMAN = 0
+    PII = 1
+    AI = 2
+
+
+class SpeechItem:
+    def __init__(self, text, priority, generation):
+        self.text = text
+        self.priority = priority
+        self.generation = generation
+        # Echoed back by ACS in PlayCompleted / PlayFailed / PlayCanceled
+        self.operation_context = f"speech-{uuid.uuid4().hex[:12]}"
+        self.enqueued_at = time.monotonic()
+
+
+class SpeechQueue:
+    """
+    Per-call outbound speech, ordered human > PII > AI.
+
+    - Operator (and PII) input bumps the queue generation. AI replies are
+      stamped with the generation they were produced under, so a reply whose
+      LLM call started before the operator stepped in is dropped on arrival.
+    - Queued AI items are cancelled as soon as higher-priority speech arrives.
+    - If a lower-priority item is mid-play, it is cancelled on the call and the
+      new item starts right away instead of waiting for PlayCompleted.
+
+    `play(text, operation_context)` (returning True if the request was
+    accepted) and `cancel()` are coroutines supplied by the app so this class
+    stays independent of the ACS client.
+    """
+
+    def __init__(self, call_connection_id, play, cancel):
+        self.call_connection_id = call_connection_id
+        self._play = play
+        self._cancel = cancel
+        self._heap = []
+        self._seq = itertools.count()
+        self.generation = 0
+        self.current = None
+        self.stats = {"played": 0, "superseded": 0, "preempted": 0}
+
+    def __len__(self):
+        return len(self._heap)
+
+    async def enqueue(self, text, priority, generation=None):
+        """Queue text for playback. Returns the item, or None if it was already superseded."""
+        if priority == SpeechPriority.AI and generation is not None and generation < self.generation:
+            self.stats["superseded"] += 1
+            logger.info(f"Dropping stale AI reply for {self.call_connection_id}: superseded by operator input")
+            return None
+
+        if priority < SpeechPriority.AI:
+            self.generation += 1
+            self._drop_queued(lambda queued: queued.priority == SpeechPriority.AI)
+
+        item = SpeechItem(text, priority, self.generation)
+        heapq.heappush(self._heap, (item.priority, next(self._seq), item))
+
+        if self.current is None:
+            await self._play_next()
+        elif self.current.priority > item.priority:
+            logger.info(f"Preempting {self.current.priority.name} speech with {item.priority.name} on {self.call_connection_id}")
+            self.stats["preempted"] += 1
+            # The PlayCanceled for the old item won't match self.current and is ignored
+            self.current = None
+            await self._cancel()
+            await self._play_next()
+        return item
+
+    async def on_play_finished(self, operation_context):
+        """
+        Handle PlayCompleted / PlayFailed / PlayCanceled.
+        Returns True when the queue is drained and the caller should start listening.
+        """
+        if self.current is None or operation_context != self.current.operation_context:
+            # Event for an item we already preempted, or for a play we didn't queue
+            return self.current is None and not self._heap and operation_context is None
+        self.current = None
+        await self._play_next()
+        return self.current is None
+
+    def clear(self):
+        self._heap.clear()
+        self.current = None
+
+    def _drop_queued(self, predicate):
+        kept = [entry for entry in self._heap if not predicate(entry[2])]
+        dropped = len(self._heap) - len(kept)
+        if dropped:
+            self.stats["superseded"] += dropped
+            heapq.heapify(kept)
+            self._heap = kept
+
+    async def _play_next(self):
+        while self._heap:
+            _, _, item = heapq.heappop(self._heap)
+            self.current = item
+            if await self._play(item.text, item.operation_context):
+                self.stats["played"] += 1
+                return
+            # Play request itself failed: no ACS event will follow, move on
+            self.current = None
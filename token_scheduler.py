@@ -0,0 +1,208 @@
+import os
+import time
+import heapq
+import asyncio
+import itertools
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+logger = logging.getLogger("AgentT")
+
+# Deployment quota, summed over every endpoint in the LLM pool
+TPM_LIMIT = int(os.getenv("LLM_TPM_LIMIT", "80000"))
+RPM_LIMIT = int(os.getenv("LLM_RPM_LIMIT", "480"))
+WINDOW = 60.0
+
+# Completion tokens we reserve when the request doesn't set max_tokens
+DEFAULT_COMPLETION_TOKENS = 300
+
+# Priority classes (lower is admitted first) and how long each may queue
+LIVE = 0
+HOLD = 1
+BACKGROUND = 2
+
+MAX_WAIT = {
+    LIVE: float(os.getenv("LLM_LIVE_MAX_WAIT_S", "4")),
+    HOLD: 15.0,
+    BACKGROUND: 300.0,
+}
+
+# Fraction of the window's TPM/RPM a class may fill. Background work stops short
+# of the limit so a burst of live turns never queues behind post-call batches.
+BUDGET_SHARE = {
+    BACKGROUND: float(os.getenv("LLM_BACKGROUND_SHARE", "0.5")),
+}
+
+# Pause used when a 429 doesn't say (or says something unreadable), and the most we'll honour
+DEFAULT_RETRY_AFTER = 10.0
+MAX_RETRY_AFTER = 120.0
+
+
+def estimate_tokens(messages, max_tokens=None):
+    """Rough prompt + completion estimate (~4 chars per token plus per-message overhead)."""
+    prompt = sum(len(m.get("content") or "") for m in messages) // 4 + 4 * len(messages)
+    return prompt + (max_tokens or DEFAULT_COMPLETION_TOKENS)
+
+
+def retry_after_seconds(response, default=DEFAULT_RETRY_AFTER):
+    """
+    How long a 429 response asks us to wait. Azure sends retry-after-ms or
+    retry-after; the latter may be seconds or an HTTP-date. Anything missing
+    or unparseable falls back to `default`.
+    """
+    headers = response.headers if response is not None else {}
+    try:
+        if headers.get("retry-after-ms"):
+            seconds = float(headers["retry-after-ms"]) / 1000
+        elif headers.get("retry-after"):
+            value = headers["retry-after"].strip()
+            try:
+                seconds = float(value)
+            except ValueError:
+                seconds = (parsedate_to_datetime(value) - datetime.now(timezone.utc)).total_seconds()
+        else:
+            return default
+    except (TypeError, ValueError, OverflowError):
+        return default
+    if seconds != seconds:
+        # NaN
+        return default
+    return min(MAX_RETRY_AFTER, max(0.0, seconds))
+
+
+class Reservation:
+    def __init__(self, tokens):
+        self.at = time.monotonic()
+        self.tokens = tokens
+
+
+class TokenRateScheduler:
+    """
+    Shared admission control for every VoiceAgent's LLM calls.
+
+    Requests reserve their estimated tokens against a sliding 60s window of
+    TPM and RPM budget. When the budget is spent they wait in a priority queue
+    (live negotiation ahead of hold and post-call work) and are admitted as
+    older reservations age out of the window. A request that can't be admitted
+    within its class's MAX_WAIT gets None back, so the caller can degrade
+    (shorter prompt, holding phrase) instead of eating a 429.
+    """
+
+    def __init__(self, tpm=TPM_LIMIT, rpm=RPM_LIMIT, window=WINDOW):
+        self.tpm = tpm
+        self.rpm = rpm
+        self.window = window
+        self._ledger = deque()
+        self._used = 0
+        self._waiters = []
+        self._seq = itertools.count()
+        self._wakeup = None
+        self._paused_until = 0.0
+        self.stats_counters = {"admitted": 0, "timed_out": 0, "throttled": 0, "wait_total": 0.0}
+
+    def _expire(self, now):
+        while self._ledger and now - self._ledger[0].at >= self.window:
+            self._used -= self._ledger.popleft().tokens
+
+    def _fits(self, tokens, now, priority=LIVE):
+        if now < self._paused_until:
+            return False
+        if not self._ledger:
+            # Always let one request through, even if it alone exceeds the budget
+            return True
+        share = BUDGET_SHARE.get(priority, 1.0)
+        return self._used + tokens <= self.tpm * share and len(self._ledger) < self.rpm * share
+
+    def _reserve(self, tokens, now):
+        reservation = Reservation(tokens)
+        reservation.at = now
+        self._ledger.append(reservation)
+        self._used += tokens
+        return reservation
+
+    async def admit(self, tokens, priority=LIVE, max_wait=None):
+        """Wait for budget. Returns a Reservation, or None if max_wait elapsed first."""
+        now = time.monotonic()
+        self._expire(now)
+        if not self._waiters and self._fits(tokens, now, priority):
+            self.stats_counters["admitted"] += 1
+            return self._reserve(tokens, now)
+
+        future = asyncio.get_running_loop().create_future()
+        entry = [priority, next(self._seq), tokens, future]
+        heapq.heappush(self._waiters, entry)
+        self._pump()
+        wait = MAX_WAIT.get(priority, MAX_WAIT[LIVE]) if max_wait is None else max_wait
+        try:
+            reservation = await asyncio.wait_for(asyncio.shield(future), timeout=wait)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Admitted in the same tick the timeout fired; keep it
+                reservation = future.result()
+            else:
+                future.cancel()
+                self._waiters.remove(entry)
+                heapq.heapify(self._waiters)
+                self.stats_counters["timed_out"] += 1
+                self._pump()
+                return None
+        self.stats_counters["admitted"] += 1
+        self.stats_counters["wait_total"] += time.monotonic() - now
+        return reservation
+
+    def _pump(self):
+        now = time.monotonic()
+        self._expire(now)
+        while self._waiters:
+            priority, _, tokens, future = self._waiters[0]
+            if future.done():
+                heapq.heappop(self._waiters)
+                continue
+            if not self._fits(tokens, now, priority):
+                break
+            heapq.heappop(self._waiters)
+            future.set_result(self._reserve(tokens, now))
+
+        if self._wakeup:
+            self._wakeup.cancel()
+            self._wakeup = None
+        if self._waiters:
+            # Wake when the oldest reservation leaves the window (or a pause ends)
+            next_at = self._ledger[0].at + self.window if self._ledger else now
+            next_at = max(next_at, self._paused_until)
+            delay = max(0.01, next_at - now)
+            self._wakeup = asyncio.get_running_loop().call_later(delay, self._pump)
+
+    def record_usage(self, reservation, actual_tokens):
+        """Replace the estimate with the real usage reported by the API."""
+        if reservation is None or actual_tokens is None:
+            return
+        if reservation in self._ledger:
+            self._used += actual_tokens - reservation.tokens
+        reservation.tokens = actual_tokens
+        if self._waiters:
+            self._pump()
+
+    def throttle(self, retry_after):
+        """The service returned 429: stop admitting until it says we can retry."""
+        self.stats_counters["throttled"] += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + retry_after)
+        logger.warning(f"LLM rate limited; pausing admissions for {retry_after:.1f}s")
+
+    def stats(self):
+        now = time.monotonic()
+        self._expire(now)
+        admitted = self.stats_counters["admitted"]
+        return {
+            "tokens_in_window": self._used,
+            "requests_in_window": len(self._ledger),
+            "tpm_limit": self.tpm,
+            "rpm_limit": self.rpm,
+            "queued": sum(1 for w in self._waiters if not w[3].done()),
+            "admitted": admitted,
+            "timed_out": self.stats_counters["timed_out"],
+            "throttled": self.stats_counters["throttled"],
+            "avg_wait_ms": round(self.stats_counters["wait_total"] / admitted * 1000) if admitted else 0,
+        }
@@ -0,0 +1,274 @@
+import os
+import gzip
+import json
+import time
+import fcntl
+import sqlite3
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger("AgentT")
+
+ARCHIVE_DIR = os.getenv("TRANSCRIPT_ARCHIVE_DIR", "transcripts")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS calls (
+    call_id TEXT PRIMARY KEY,
+    phone TEXT,
+    started_at REAL,
+    ended_at REAL,
+    turns INTEGER,
+    segment TEXT,
+    offset INTEGER,
+    length INTEGER
+);
+CREATE INDEX IF NOT EXISTS calls_phone ON calls (phone, started_at);
+CREATE INDEX IF NOT EXISTS calls_started ON calls (started_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS turns_fts USING fts5(
+    text,
+    speaker UNINDEXED,
+    state UNINDEXED,
+    ts UNINDEXED,
+    call_id UNINDEXED
+);
+CREATE TABLE IF NOT EXISTS outcomes (
+    call_id TEXT PRIMARY KEY,
+    phone TEXT,
+    ended_at REAL,
+    status TEXT,
+    outcome TEXT,
+    appointment_date TEXT,
+    clinic TEXT,
+    escalated INTEGER,
+    escalation_reason TEXT,
+    summary TEXT,
+    attempts INTEGER,
+    processed_at REAL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS outcomes_ended ON outcomes (ended_at);
+"""
+
+OUTCOME_COLUMNS = (
+    "call_id", "phone", "ended_at", "status", "outcome", "appointment_date", "clinic",
+    "escalated", "escalation_reason", "summary", "attempts", "processed_at", "error",
+)
+
+
+def normalize_phone(phone):
+    """Strip formatting so '+1 (555) 010-0000' and '+15550100000' match."""
+    if not phone:
+        return None
+    return "".join(ch for ch in phone if ch.isdigit() or ch == "+")
+
+
+def parse_date(value, end_of_day=False):
+    """Accept an ISO date/datetime or epoch seconds and return epoch seconds."""
+    if value is None or value == "":
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        # Plain date as an upper bound means "through the end of that day"
+        return parsed.timestamp() + 86400
+    return parsed.timestamp()
+
+
+class TranscriptArchive:
+    """
+    Compressed, append-only archive of finished call transcripts.
+
+    Each call is appended as its own gzip member to a monthly segment file
+    (calls-YYYY-MM.jsonl.gz), so a segment is a valid gzip stream and a single
+    call can be read back by seeking to its member. A SQLite FTS5 index next to
+    the segments maps phone numbers, dates and phrases to calls.
+
+    All disk work runs on a single writer thread so the event loop never
+    blocks on compression or fsync.
+    """
+
+    def __init__(self, directory=ARCHIVE_DIR):
+        self.directory = directory
+        self.index_path = os.path.join(directory, "index.db")
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="transcript-archive")
+        self._local = threading.local()
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+            # Indexes created before failures had their own column
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(outcomes)")}
+            if "error" not in columns:
+                conn.execute("ALTER TABLE outcomes ADD COLUMN error TEXT")
+
+    def _connect(self):
+        conn = sqlite3.connect(self.index_path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def _conn(self):
+        # One connection per thread; readers run on asyncio's default pool
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    async def archive_call(self, call_connection_id, phone, turns):
+        """Queue a finished call for archiving. Returns once it is indexed."""
+        if not turns:
+            return
+        record = {
+            "call_id": call_connection_id,
+            "phone": normalize_phone(phone),
+            "started_at": turns[0]["ts"],
+            "ended_at": turns[-1]["ts"],
+            "turns": list(turns),
+        }
+        loop = asyncio.get_running_loop()
+        try:
+            await loop.run_in_executor(self._executor, self._write, record)
+        except Exception as e:
+            logger.error(f"Failed to archive transcript for {call_connection_id}: {e}")
+
+    def _write(self, record):
+        started = datetime.fromtimestamp(record["started_at"])
+        segment = f"calls-{started:%Y-%m}.jsonl.gz"
+        path = os.path.join(self.directory, segment)
+
+        member = gzip.compress((json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8"))
+        with open(path, "ab") as f:
+            # Other processes (workers, instances sharing the directory) append to the same
+            # segment; the offset we index must be where *our* member lands
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                offset = f.seek(0, os.SEEK_END)
+                f.write(member)
+                f.flush()
+                os.fsync(f.fileno())
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO calls VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (record["call_id"], record["phone"], record["started_at"], record["ended_at"],
+                 len(record["turns"]), segment, offset, len(member)),
+            )
+            conn.execute("DELETE FROM turns_fts WHERE call_id = ?", (record["call_id"],))
+            conn.executemany(
+                "INSERT INTO turns_fts (text, speaker, state, ts, call_id) VALUES (?, ?, ?, ?, ?)",
+                [(t["text"], t["speaker"], t.get("state"), t["ts"], record["call_id"]) for t in record["turns"]],
+            )
+        logger.info(f"Archived {len(record['turns'])} turns for call {record['call_id']} ({len(member)} bytes)")
+
+    async def search(self, phone=None, start=None, end=None, phrase=None, limit=50):
+        return await asyncio.to_thread(self._search, phone, start, end, phrase, limit)
+
+    def _search(self, phone, start, end, phrase, limit):
+        clauses, params = [], []
+        if phone:
+            clauses.append("c.phone = ?")
+            params.append(normalize_phone(phone))
+        if start is not None:
+            clauses.append("c.started_at >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("c.started_at < ?")
+            params.append(end)
+
+        if phrase:
+            # Quote as an FTS5 phrase so user input is never parsed as query syntax
+            fts_query = '"' + phrase.replace('"', '""') + '"'
+            sql = (
+                "SELECT c.call_id, c.phone, c.started_at, c.ended_at, c.turns, "
+                "f.speaker, f.ts, snippet(turns_fts, 0, '[', ']', '…', 12) AS snippet "
+                "FROM turns_fts f JOIN calls c ON c.call_id = f.call_id "
+                "WHERE turns_fts MATCH ?"
+            )
+            params.insert(0, fts_query)
+            if clauses:
+                sql += " AND " + " AND ".join(clauses)
+            sql += " ORDER BY c.started_at DESC, f.ts LIMIT ?"
+        else:
+            sql = "SELECT c.call_id, c.phone, c.started_at, c.ended_at, c.turns FROM calls c"
+            if clauses:
+                sql += " WHERE " + " AND ".join(clauses)
+            sql += " ORDER BY c.started_at DESC LIMIT ?"
+        params.append(limit)
+
+        rows = self._conn().execute(sql, params).fetchall()
+        return [dict(row) for row in rows]
+
+    async def get_call(self, call_connection_id):
+        return await asyncio.to_thread(self._get_call, call_connection_id)
+
+    def _get_call(self, call_connection_id):
+        row = self._conn().execute(
+            "SELECT segment, offset, length FROM calls WHERE call_id = ?", (call_connection_id,)
+        ).fetchone()
+        if not row:
+            return None
+        with open(os.path.join(self.directory, row["segment"]), "rb") as f:
+            f.seek(row["offset"])
+            member = f.read(row["length"])
+        return json.loads(gzip.decompress(member))
+
+    async def save_outcomes(self, rows):
+        """Store post-call outcomes (dicts keyed by OUTCOME_COLUMNS) on the writer thread."""
+        if rows:
+            await asyncio.get_running_loop().run_in_executor(self._executor, self._write_outcomes, rows)
+
+    def _write_outcomes(self, rows):
+        conn = self._conn()
+        with conn:
+            conn.executemany(
+                f"INSERT OR REPLACE INTO outcomes ({', '.join(OUTCOME_COLUMNS)}) "
+                f"VALUES ({', '.join('?' * len(OUTCOME_COLUMNS))})",
+                [tuple(row.get(column) for column in OUTCOME_COLUMNS) for row in rows],
+            )
+
+    async def search_outcomes(self, phone=None, start=None, end=None, outcome=None, escalated=None, limit=50):
+        return await asyncio.to_thread(self._search_outcomes, phone, start, end, outcome, escalated, limit)
+
+    def _search_outcomes(self, phone, start, end, outcome, escalated, limit):
+        clauses, params = [], []
+        if phone:
+            clauses.append("phone = ?")
+            params.append(normalize_phone(phone))
+        if start is not None:
+            clauses.append("ended_at >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ended_at < ?")
+            params.append(end)
+        if outcome:
+            clauses.append("outcome = ?")
+            params.append(outcome)
+        if escalated is not None:
+            clauses.append("escalated = ?")
+            params.append(int(escalated))
+        sql = "SELECT * FROM outcomes"
+        if clauses:
+            sql += " WHERE " + " AND ".join(clauses)
+        sql += " ORDER BY ended_at DESC LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self._conn().execute(sql, params).fetchall()]
+
+    async def get_outcome(self, call_connection_id):
+        return await asyncio.to_thread(self._get_outcome, call_connection_id)
+
+    def _get_outcome(self, call_connection_id):
+        row = self._conn().execute("SELECT * FROM outcomes WHERE call_id = ?", (call_connection_id,)).fetchone()
+        return dict(row) if row else None
+
+
+def new_turn(speaker, text, state=None):
+    return {"speaker": speaker, "text": text, "state": state, "ts": time.time()}
@@ -0,0 +1,310 @@
+import os
+import re
+import time
+import asyncio
+import logging
+from collections import deque
+
+from token_scheduler import LIVE, estimate_tokens
+
+logger = logging.getLogger("AgentT")
+
+# Language the operator side hears/types (ISO 639-1)
+TARGET_LANGUAGE = os.getenv("BRIDGE_TARGET_LANGUAGE", "en")
+# Remote speech recognized -> first translated audio starting on the call
+LATENCY_BUDGET_MS = float(os.getenv("BRIDGE_LATENCY_BUDGET_MS", "1500"))
+
+# A sentence end always closes a chunk. A clause break (comma, semicolon...)
+# closes one once it is this long; the bridge lowers it when over budget.
+CLAUSE_CHARS = 40
+MIN_CLAUSE_CHARS = 12
+# No punctuation at all: cut at a space past this length
+MAX_CHUNK_CHARS = 160
+
+_SENTENCE = re.compile(r"[.!?](?=\s)|[。！？]")
+_CLAUSE = re.compile(r"[,;:](?=\s)|[，；、]")
+_LANGUAGE_TAG = re.compile(r"^\s*\[([A-Za-z]{2,3}(?:-[A-Za-z]{2,4})?)\]\s*")
+
+STAGES = ("detect_ms", "first_chunk_ms", "translate_ms", "speak_submit_ms", "tts_start_ms", "first_audio_ms")
+
+
+class Chunker:
+    """Cuts a stream of translated text into speakable pieces as soon as each one is complete."""
+
+    def __init__(self, clause_chars=CLAUSE_CHARS, enabled=True):
+        self.clause_chars = clause_chars
+        self.enabled = enabled
+        self.buffer = ""
+
+    def feed(self, delta):
+        self.buffer += delta
+        chunks = []
+        while self.enabled:
+            cut = self._cut()
+            if cut is None:
+                break
+            chunk, self.buffer = self.buffer[:cut].strip(), self.buffer[cut:]
+            if chunk:
+                chunks.append(chunk)
+        return chunks
+
+    def flush(self):
+        chunk, self.buffer = self.buffer.strip(), ""
+        return chunk or None
+
+    def _cut(self):
+        match = _SENTENCE.search(self.buffer)
+        if match:
+            return match.end()
+        if len(self.buffer) >= self.clause_chars:
+            for match in _CLAUSE.finditer(self.buffer):
+                if match.end() >= self.clause_chars:
+                    return match.end()
+        if len(self.buffer) > MAX_CHUNK_CHARS:
+            space = self.buffer.rfind(" ", 0, MAX_CHUNK_CHARS)
+            return space if space > 0 else MAX_CHUNK_CHARS
+        return None
+
+
+class LLMTranslator:
+    """
+    Streaming translation through the shared LLM pool.
+
+    Without a known source language the model is asked to prefix its reply
+    with "[xx]"; the tag is stripped from the stream and reported through
+    on_language, so detection costs no extra round trip.
+    """
+
+    def __init__(self, pool, scheduler):
+        self.pool = pool
+        self.scheduler = scheduler
+
+    async def stream(self, text, target, source=None, on_language=None):
+        if source:
+            instruction = f"Translate the user's message from {source} into {target}."
+        else:
+            instruction = (
+                f"Translate the user's message into {target}. Start your reply with the ISO 639-1 code "
+                "of the message's language in square brackets, e.g. [es], then the translation."
+            )
+        messages = [
+            {"role": "system", "content": instruction + " This is a live phone call: keep the speaker's "
+             "meaning and tone, keep numbers, dates and names exact, and output nothing but the translation."},
+            {"role": "user", "content": text},
+        ]
+        max_tokens = 40 + len(text) // 2
+        reservation = await self.scheduler.admit(estimate_tokens(messages, max_tokens), LIVE)
+        if reservation is None:
+            raise RuntimeError("no LLM budget for translation")
+        response = await self.pool.chat(messages=messages, max_tokens=max_tokens, temperature=0, stream=True)
+
+        pending = "" if source is None else None
+        async for event in response:
+            if not event.choices:
+                continue
+            delta = event.choices[0].delta.content or ""
+            if pending is not None:
+                # Hold text back until the language tag is complete
+                pending += delta
+                if "]" not in pending and len(pending) < 12:
+                    continue
+                match = _LANGUAGE_TAG.match(pending)
+                if match and on_language:
+                    on_language(match.group(1).lower())
+                delta, pending = pending[match.end():] if match else pending, None
+            if delta:
+                yield delta
+
+
+class TranslationBridge:
+    """
+    Speech -> text -> translated speech for one call.
+
+    Each recognized remote segment is streamed through the translator and
+    cut into chunks at sentence (or, under latency pressure, clause)
+    boundaries. Each chunk goes to the operator as soon as it is complete,
+    so the first words arrive while the rest is still being translated. The
+    remote party already heard the original, so nothing inbound is played
+    on the call. Operator text goes the other way, into the remote party's
+    language, and that is what plays on the call.
+
+    The remote language is detected on the first segment and cached for the
+    rest of the call. Timings are kept per stage. The end-to-end figure, from
+    text received to its first translated chunk reaching the operator
+    (inbound) or starting to play on the call (outbound), is checked against
+    the latency budget: going over it makes chunks shorter, and staying well
+    under it lets them grow back.
+
+    `translator.stream(text, target, source, on_language)` is an async
+    generator of text deltas. `speak(text)` queues one outbound chunk on the
+    call and returns the queued item (with its operation_context) or None.
+    `deliver(text)` hands one inbound chunk to the operator. All three are
+    injected, so the bridge runs unchanged against local stand-ins.
+    """
+
+    def __init__(self, translator, speak, deliver, target_language=TARGET_LANGUAGE, budget_ms=LATENCY_BUDGET_MS,
+                 chunked=True):
+        self.translator = translator
+        self.speak = speak
+        self.deliver = deliver
+        self.target_language = target_language
+        self.budget_ms = budget_ms
+        self.chunked = chunked
+        self.source_language = None
+        self.clause_chars = CLAUSE_CHARS
+        # Translations in flight per direction; they overlap when the operator types mid-segment
+        self.running = {"inbound": 0, "outbound": 0}
+        self._inbound_order = asyncio.Lock()
+        self._tasks = set()
+        self._awaiting_start = {}
+        self.timings = {stage: deque(maxlen=200) for stage in STAGES}
+        self.counters = {"segments": 0, "outbound": 0, "chunks": 0, "passthrough": 0, "over_budget": 0, "errors": 0}
+
+    @property
+    def busy(self):
+        """Outbound chunks may still be on their way to the call's speech queue."""
+        return self.running["outbound"] > 0
+
+    def same_language(self):
+        # "en-US" and "en" are the same for our purposes
+        return bool(self.source_language) and self.source_language.split("-")[0] == self.target_language.split("-")[0]
+
+    def _record(self, stage, seconds):
+        self.timings[stage].append(seconds * 1000)
+
+    def submit_inbound(self, text):
+        """
+        Translate a remote segment in the background, so the caller can go back
+        to listening. Segments are delivered in the order they were submitted.
+        """
+        received_at = time.monotonic()
+
+        async def run():
+            async with self._inbound_order:
+                await self.translate_inbound(text, received_at)
+
+        task = asyncio.create_task(run())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def close(self):
+        for task in self._tasks:
+            task.cancel()
+
+    async def translate_inbound(self, text, received_at=None):
+        """Remote speech into the operator's language. Returns what was delivered, or None."""
+        self.counters["segments"] += 1
+        if self.same_language():
+            # Known to speak the operator's language already: don't pay for a translation to throw away
+            self.counters["passthrough"] += 1
+            return None
+        received_at = received_at or time.monotonic()
+        detect = self.source_language is None
+
+        def on_language(code):
+            self.source_language = code
+            self._record("detect_ms", time.monotonic() - received_at)
+            logger.info(f"Bridge detected remote language: {code}")
+
+        return await self._run(
+            text, self.target_language, None if detect else self.source_language, received_at,
+            inbound=True, on_language=on_language if detect else None,
+        )
+
+    async def translate_outbound(self, text):
+        """Operator text into the remote party's language. Returns what was spoken."""
+        self.counters["outbound"] += 1
+        if not self.source_language or self.same_language():
+            # Nothing detected yet, or both sides share a language
+            await self.speak(text)
+            return text
+        spoken = await self._run(text, self.source_language, self.target_language, time.monotonic(), inbound=False)
+        if spoken is None:
+            # Better the untranslated sentence than silence
+            await self.speak(text)
+            return text
+        return spoken
+
+    async def _run(self, text, target, source, started, inbound, on_language=None):
+        chunker = Chunker(self.clause_chars, enabled=self.chunked)
+        spoken = []
+        direction = "inbound" if inbound else "outbound"
+        self.running[direction] += 1
+        stream = self.translator.stream(text, target, source, on_language)
+        try:
+            async for delta in stream:
+                if inbound and self.same_language():
+                    # The first segment just revealed the operator's language; later ones skip the LLM
+                    self.counters["passthrough"] += 1
+                    return None
+                for chunk in chunker.feed(delta):
+                    await self._emit(chunk, spoken, started, inbound)
+            tail = chunker.flush()
+            if tail:
+                await self._emit(tail, spoken, started, inbound)
+            self._record("translate_ms", time.monotonic() - started)
+        except Exception as e:
+            self.counters["errors"] += 1
+            logger.error(f"Translation failed after {len(spoken)} chunk(s): {e}")
+        finally:
+            self.running[direction] -= 1
+            await stream.aclose()
+        return " ".join(spoken) or None
+
+    async def _emit(self, chunk, spoken, started, inbound):
+        now = time.monotonic()
+        first = not spoken
+        if first:
+            self._record("first_chunk_ms", now - started)
+        if inbound:
+            await self.deliver(chunk)
+            self._record("speak_submit_ms", time.monotonic() - now)
+            if first:
+                # The operator has it now; there is no call audio to wait for
+                self._close_timing(started)
+        else:
+            item = await self.speak(chunk)
+            self._record("speak_submit_ms", time.monotonic() - now)
+            if first and item is not None:
+                self._awaiting_start[item.operation_context] = (started, now)
+        spoken.append(chunk)
+        self.counters["chunks"] += 1
+
+    def on_play_started(self, operation_context):
+        """PlayStarted for an outbound message's first chunk closes its end-to-end measurement."""
+        entry = self._awaiting_start.pop(operation_context, None)
+        if entry is None:
+            return
+        started, submitted = entry
+        self._record("tts_start_ms", time.monotonic() - submitted)
+        self._close_timing(started)
+
+    def _close_timing(self, started):
+        first_audio_ms = (time.monotonic() - started) * 1000
+        self.timings["first_audio_ms"].append(first_audio_ms)
+        if first_audio_ms > self.budget_ms:
+            self.counters["over_budget"] += 1
+            self.clause_chars = max(MIN_CLAUSE_CHARS, self.clause_chars - 8)
+        elif first_audio_ms < self.budget_ms / 2:
+            self.clause_chars = min(CLAUSE_CHARS, self.clause_chars + 4)
+
+    def stats(self):
+        def summary(values):
+            ordered = sorted(values)
+            if not ordered:
+                return None
+            return {
+                "p50": round(ordered[len(ordered) // 2]),
+                "p95": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]),
+                "n": len(ordered),
+            }
+
+        return dict(
+            self.counters,
+            source_language=self.source_language,
+            target_language=self.target_language,
+            budget_ms=self.budget_ms,
+            clause_chars=self.clause_chars,
+            stages={stage: summary(values) for stage, values in self.timings.items()},
+        )
@@ -0,0 +1,149 @@
+import asyncio
+import logging
+
+import httpx
+
+logger = logging.getLogger("AgentT")
+
+# Forwarded callbacks run a whole agent turn (LLM included) before they answer
+FORWARD_TIMEOUT = 60.0
+
+
+class WorkerRoutes:
+    """
+    Keeps each call on the worker process that answered it.
+
+    Call state (agents, speech queues, the PII vault, audio listeners) lives
+    in the worker's memory, but every worker accepts on the same public
+    socket, so the kernel hands a call's callbacks and sockets to whichever
+    worker is free. To stay on one worker, the answering worker puts its
+    index in the callback and media URLs (`?worker=N`), and every worker
+    also listens on a private loopback port of its own. A request that lands
+    on the wrong worker is passed through to the owner's private port.
+
+    With a single worker nothing is assigned and all of this is a no-op.
+    """
+
+    def __init__(self):
+        self.worker = None
+        self.ports = {}
+        self._client = None
+
+    def assign(self, worker, ports):
+        self.worker = worker
+        self.ports = dict(ports)
+
+    @property
+    def enabled(self):
+        return len(self.ports) > 1
+
+    def query(self):
+        """Suffix for URLs handed to ACS, so its requests find their way back here."""
+        return f"?worker={self.worker}" if self.enabled else ""
+
+    def owner_port(self, worker):
+        """Private port of the worker a `?worker=` value names, or None if that's us (or unknown)."""
+        if not self.enabled or worker is None:
+            return None
+        try:
+            worker = int(worker)
+        except ValueError:
+            return None
+        if worker == self.worker:
+            return None
+        return self.ports.get(worker)
+
+    def is_internal(self, scope):
+        """The request came in on our private port, i.e. from another worker."""
+        server = scope.get("server")
+        return self.enabled and bool(server) and server[1] == self.ports.get(self.worker)
+
+    def peer_ports(self):
+        return [port for worker, port in self.ports.items() if worker != self.worker]
+
+    @property
+    def client(self):
+        if self._client is None:
+            self._client = httpx.AsyncClient(timeout=FORWARD_TIMEOUT)
+        return self._client
+
+    async def forward(self, port, request):
+        """Replay an HTTP request on another worker and return its (status, body, content type)."""
+        url = f"http://127.0.0.1:{port}{request.url.path}"
+        if request.url.query:
+            url += f"?{request.url.query}"
+        response = await self.client.request(
+            request.method, url, content=await request.body(),
+            headers={"content-type": request.headers.get("content-type", "application/json")},
+        )
+        return response.status_code, response.content, response.headers.get("content-type")
+
+    async def find_owner(self, call_connection_id):
+        """Private port of the peer worker that has this call live, if any."""
+        for port in self.peer_ports():
+            try:
+                calls = (await self.client.get(f"http://127.0.0.1:{port}/api/calls")).json()
+            except Exception as e:
+                logger.warning(f"Worker on port {port} didn't answer a call lookup: {e}")
+                continue
+            if call_connection_id in calls:
+                return port
+        return None
+
+    def peer_url(self, port, websocket):
+        url = f"ws://127.0.0.1:{port}{websocket.url.path}"
+        if websocket.url.query:
+            url += f"?{websocket.url.query}"
+        return url
+
+    async def open_peer(self, port, websocket):
+        """Connect to the same websocket route on another worker, carrying the ACS call header."""
+        # websockets is only needed once there are several workers
+        from websockets.asyncio.client import connect
+
+        headers = {}
+        if "x-ms-call-connection-id" in websocket.headers:
+            headers["x-ms-call-connection-id"] = websocket.headers["x-ms-call-connection-id"]
+        return await connect(self.peer_url(port, websocket), additional_headers=headers, max_size=None)
+
+    async def pump_to_client(self, peer, websocket):
+        """Everything a peer worker sends goes straight to our client."""
+        async for message in peer:
+            if isinstance(message, str):
+                await websocket.send_text(message)
+            else:
+                await websocket.send_bytes(message)
+
+    async def relay(self, websocket, port):
+        """Pipe an accepted websocket to the worker that owns its call until either side closes."""
+        try:
+            peer = await self.open_peer(port, websocket)
+        except Exception as e:
+            logger.error(f"Could not reach the worker on port {port}: {e}")
+            await websocket.close(code=1011)
+            return
+
+        async def from_client():
+            while True:
+                message = await websocket.receive()
+                if message["type"] == "websocket.disconnect":
+                    return
+                await peer.send(message["text"] if message.get("text") is not None else message["bytes"])
+
+        tasks = [asyncio.create_task(from_client()), asyncio.create_task(self.pump_to_client(peer, websocket))]
+        try:
+            done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception():
+                    logger.info(f"Relay to port {port} closed: {task.exception()}")
+        finally:
+            for task in tasks:
+                task.cancel()
+            await peer.close()
+            try:
+                await websocket.close()
+            except Exception:
+                pass
+
+
+worker_routes = WorkerRoutes()